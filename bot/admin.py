@@ -1,3 +1,11 @@
 from django.contrib import admin
+from .models import NotificationOutbox
 
-# Register your models here.
\ No newline at end of file
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ['id', 'chat_id', 'order', 'order_status', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status', 'order_status']
+    search_fields = ['chat_id', 'order__id']
+    readonly_fields = ['created_at', 'sent_at', 'last_error']
+    raw_id_fields = ['order']
@@ -0,0 +1,57 @@
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_orm_executor():
+    """
+    Пул потоков для ORM-запросов бота (размер - BOT_ORM_WORKERS).
+    При BOT_ORM_WORKERS = 0 пул не используется и запросы идут
+    через общий поток Django (thread_sensitive), как в тестах.
+    """
+    global _executor
+    workers = getattr(settings, 'BOT_ORM_WORKERS', 16)
+    if not workers:
+        return None
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bot-orm')
+    return _executor
+
+
+def _with_connection_cleanup(func):
+    """Закрывает устаревшие соединения потока до и после вызова"""
+    @functools.wraps(func)
+    def inner(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return inner
+
+
+def database_sync_to_async(func):
+    """
+    Асинхронная обертка для синхронной функции с ORM.
+    В отличие от sync_to_async по умолчанию, вызовы не выстраиваются
+    в очередь к одному потоку, а выполняются параллельно в пуле бота.
+    """
+    cleaned = _with_connection_cleanup(func)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        executor = get_orm_executor()
+        if executor is None:
+            return await sync_to_async(func)(*args, **kwargs)
+        return await sync_to_async(cleaned, thread_sensitive=False, executor=executor)(*args, **kwargs)
+
+    return wrapper
@@ -1,39 +1,59 @@
-from django.core.management.base import BaseCommand
-from telegram import Update
+from django.core.management.base import BaseCommand, CommandError
+from telegram import Bot, Update
 from telegram.ext import (
     ApplicationBuilder,
+    ApplicationHandlerStop,
     CommandHandler,
     ConversationHandler,
     MessageHandler,
+    TypeHandler,
     filters,
     ContextTypes,
 )
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from asgiref.sync import sync_to_async
 from datetime import timedelta
+import asyncio
 import re
 
 # Импорты ваших моделей
-from orders.models import Order, OrderItem
-from catalog.models import Product
+from orders.checkout import place_order
+from orders.models import Order
+from orders.stats import get_chat_order_stats
+from bot.executor import database_sync_to_async
+from bot.notifications import enqueue_notification
+from bot.persistence import DjangoPersistence
+from bot.processor import ChatSerializedUpdateProcessor
+from flower_project.ratelimit import hit as rate_limit_hit
+from bot.status import get_order_status, get_recent_orders, get_status_display
+from catalog.system import INDIVIDUAL_BOUQUET, get_system_product_for_order
 from django.contrib.auth.models import User
 
 # Определяем этапы разговора
 GET_NAME, GET_PHONE, GET_ADDRESS, GET_FLOWERS, GET_ORDER_NUMBER = range(5)
 
+STATUS_EMOJIS = {
+    'new': '🆕',
+    'confirmed': '✅',
+    'processing': '🔧',
+    'in_progress': '🚚',
+    'delivered': '📦',
+    'cancelled': '❌'
+}
+
 
 # Синхронная функция для создания заказа
 def create_order_sync(user_data, telegram_chat_id=None):
     """
     Создает запись заказа в базе данных на основе user_data.
+    Заказ записывается один раз вместе с позицией в одной транзакции.
     """
     try:
         # 1. Подготавливаем данные для заказа
         delivery_time = timezone.now() + timedelta(hours=2)
 
-        # 2. Создаем заказ
-        new_order = Order.objects.create(
+        new_order = Order(
             customer_name=user_data['name'],
             customer_phone=user_data['phone'],
             delivery_address=user_data['address'],
@@ -43,51 +63,15 @@ def create_order_sync(user_data, telegram_chat_id=None):
             comment=f"Заказ из Telegram бота:\n{user_data['flowers']}",
             user=None,  # Можно связать с пользователем, если нужно
             customer_email=user_data.get('email', ''),
-            total_price=0
-        )
-
-        # 3. Создаем OrderItem с базовым продуктом
-        try:
-            base_product = Product.objects.get(name="Индивидуальный букет")
-        except Product.DoesNotExist:
-            # Создаем базовый продукт, если не существует
-            from catalog.models import Category
-            try:
-                category = Category.objects.first()
-                if not category:
-                    category = Category.objects.create(
-                        name="Индивидуальные заказы",
-                        description="Категория для индивидуальных заказов из Telegram"
-                    )
-
-                base_product = Product.objects.create(
-                    name="Индивидуальный букет",
-                    description='Индивидуальный букет по пожеланиям клиента',
-                    price=1000,
-                    category=category,
-                    is_available=True
-                )
-            except Exception as e:
-                print(f"Ошибка при создании базового продукта: {e}")
-                return None
-
-        # Создаем элемент заказа
-        order_item = OrderItem.objects.create(
-            order=new_order,
-            product=base_product,
-            quantity=1,
-            price=base_product.price
+            # Сразу сохраняем ID чата, чтобы уведомление о новом заказе ушло один раз
+            telegram_chat_id=telegram_chat_id
         )
 
-        # 4. Обновляем общую стоимость заказа
-        new_order.update_total_price()
-
-        # 5. Сохраняем ID чата Telegram для уведомлений
-        if telegram_chat_id:
-            new_order.telegram_chat_id = telegram_chat_id
-            new_order.save()
-
-        return new_order
+        # 2. Сохраняем заказ и позицию с базовым продуктом. Товар запоминается
+        # в процессе, а цена читается в транзакции заказа - ее могли изменить
+        with transaction.atomic():
+            base_product = get_system_product_for_order(INDIVIDUAL_BOUQUET)
+            return place_order(new_order, [{'product': base_product, 'price': base_product.price, 'quantity': 1}])
 
     except Exception as e:
         print(f"Ошибка при создании заказа: {e}")
@@ -97,19 +81,13 @@ def create_order_sync(user_data, telegram_chat_id=None):
 # Функция для получения статуса заказа
 def get_order_status_sync(order_number, telegram_chat_id=None):
     """
-    Получает статус заказа по номеру.
+    Получает статус заказа чата по номеру (из кэша bot.status).
     """
     try:
-        order = Order.objects.get(id=order_number)
-
-        # Проверяем, что заказ принадлежит этому пользователю (по chat_id или телефону)
-        # Это упрощенная проверка - в реальном проекте нужно сделать более надежную
-        if telegram_chat_id and order.telegram_chat_id != telegram_chat_id:
+        order = get_order_status(telegram_chat_id, order_number)
+        if order is None:
             return None, "Заказ с таким номером не найден"
-
         return order, None
-    except Order.DoesNotExist:
-        return None, "Заказ с таким номером не найден"
     except Exception as e:
         return None, f"Ошибка при поиске заказа: {e}"
 
@@ -117,18 +95,12 @@ def get_order_status_sync(order_number, telegram_chat_id=None):
 # Функция для отправки уведомлений
 def send_telegram_notification_sync(order_id, message):
     """
-    Отправляет уведомление в Telegram о изменении статуса заказа.
+    Ставит в очередь уведомление в Telegram о изменении статуса заказа.
     """
     try:
         order = Order.objects.get(id=order_id)
         if order.telegram_chat_id:
-            # Импортируем здесь, чтобы избежать циклических импортов
-            from telegram import Bot
-            bot = Bot(token=settings.TELEGRAM_BOT_TOKEN)
-            bot.send_message(
-                chat_id=order.telegram_chat_id,
-                text=message
-            )
+            enqueue_notification(order.telegram_chat_id, message, order=order)
             return True
         return False
     except Exception as e:
@@ -136,15 +108,35 @@ def send_telegram_notification_sync(order_id, message):
         return False
 
 
-# Асинхронные обертки
-create_order_async = sync_to_async(create_order_sync)
-get_order_status_async = sync_to_async(get_order_status_sync)
-send_telegram_notification_async = sync_to_async(send_telegram_notification_sync)
+# Асинхронные обертки: запросы выполняются параллельно в пуле потоков бота
+create_order_async = database_sync_to_async(create_order_sync)
+get_order_status_async = database_sync_to_async(get_order_status_sync)
+send_telegram_notification_async = database_sync_to_async(send_telegram_notification_sync)
+get_chat_order_stats_async = database_sync_to_async(get_chat_order_stats)
+get_recent_orders_async = database_sync_to_async(get_recent_orders)
+# Кэш лимитов может быть в базе (DatabaseCache), поэтому тоже вне цикла событий
+rate_limit_hit_async = database_sync_to_async(rate_limit_hit)
 
 
 class Command(BaseCommand):
     help = 'Запускает Telegram-бота'
 
+    async def check_rate_limit(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Ограничивает частоту сообщений из одного чата (лимит 'bot' в RATE_LIMITS)"""
+        chat = update.effective_chat
+        if chat is None:
+            return
+        allowed, _ = await rate_limit_hit_async('bot', chat.id)
+        if allowed:
+            return
+        # Предупреждаем не чаще лимита 'bot-warning', остальные сообщения пропускаем молча
+        warn, _ = await rate_limit_hit_async('bot-warning', chat.id)
+        if warn and update.effective_message:
+            await update.effective_message.reply_text(
+                "⏳ Слишком много сообщений. Подождите немного и попробуйте снова."
+            )
+        raise ApplicationHandlerStop
+
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Обрабатывает команду /start"""
         user = update.effective_user
@@ -153,6 +145,8 @@ class Command(BaseCommand):
             f"Используйте команды:\n"
             f"/order - оформить новый заказ\n"
             f"/status - проверить статус заказа\n"
+            f"/stats - статистика ваших заказов\n"
+            f"/myorders - последние заказы\n"
             f"/help - справка по командам",
         )
 
@@ -164,6 +158,8 @@ class Command(BaseCommand):
 /start - Начать работу с ботом
 /order - Оформить новый заказ цветов
 /status - Проверить статус заказа
+/stats - Статистика ваших заказов
+/myorders - Последние заказы
 /help - Показать эту справку
 
 Процесс заказа:
@@ -281,6 +277,39 @@ class Command(BaseCommand):
         context.user_data.clear()
         return ConversationHandler.END
 
+    async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Обрабатывает команду /stats"""
+        stats = await get_chat_order_stats_async(update.effective_chat.id)
+
+        if not stats['total']:
+            await update.message.reply_text("У вас пока нет заказов. Оформите первый с помощью /order 🌹")
+            return
+
+        await update.message.reply_text(
+            "📊 Ваши заказы:\n\n"
+            f"• Всего: {stats['total']}\n"
+            f"• Активных: {stats['active']}\n"
+            f"• Доставлено: {stats['delivered']}\n"
+            f"• Отменено: {stats['cancelled']}\n"
+            f"• На сумму: {stats['total_amount']} ₽"
+        )
+
+    async def my_orders_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Обрабатывает команду /myorders"""
+        orders = await get_recent_orders_async(update.effective_chat.id)
+
+        if not orders:
+            await update.message.reply_text("У вас пока нет заказов. Оформите первый с помощью /order 🌹")
+            return
+
+        lines = [
+            f"{STATUS_EMOJIS.get(order['status'], '📋')} №{order['id']} от "
+            f"{timezone.localtime(order['created_at']).strftime('%d.%m.%Y')} - "
+            f"{get_status_display(order['status'])}, {order['total_price']} ₽"
+            for order in orders
+        ]
+        await update.message.reply_text("🧾 Ваши последние заказы:\n\n" + "\n".join(lines))
+
     # Команды для проверки статуса заказа
     async def start_status_check(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Начинает процесс проверки статуса заказа."""
@@ -308,32 +337,13 @@ class Command(BaseCommand):
                 await update.message.reply_text(f"❌ {error}")
                 return ConversationHandler.END
 
-            # Форматируем статус заказа
-            status_emojis = {
-                'new': '🆕',
-                'confirmed': '✅',
-                'processing': '🔧',
-                'in_progress': '🚚',
-                'delivered': '📦',
-                'cancelled': '❌'
-            }
-
-            status_emoji = status_emojis.get(order.status, '📋')
-            status_text = order.get_status_display()
-
             status_message = (
-                f"{status_emoji} **Заказ №{order.id}**\n\n"
-                f"**Статус:** {status_text}\n"
-                f"**Имя:** {order.customer_name}\n"
-                f"**Телефон:** {order.customer_phone}\n"
-                f"**Адрес:** {order.delivery_address}\n"
-                f"**Создан:** {order.created_at.strftime('%d.%m.%Y %H:%M')}\n"
-                f"**Сумма:** {order.total_price} ₽"
+                f"{STATUS_EMOJIS.get(order['status'], '📋')} **Заказ №{order['id']}**\n\n"
+                f"**Статус:** {get_status_display(order['status'])}\n"
+                f"**Создан:** {timezone.localtime(order['created_at']).strftime('%d.%m.%Y %H:%M')}\n"
+                f"**Сумма:** {order['total_price']} ₽"
             )
 
-            if order.comment:
-                status_message += f"\n**Комментарий:** {order.comment}"
-
             await update.message.reply_text(status_message)
 
         except Exception as e:
@@ -354,8 +364,36 @@ class Command(BaseCommand):
         context.user_data.clear()
         return ConversationHandler.END
 
-    def handle(self, *args, **options):
-        application = ApplicationBuilder().token(settings.TELEGRAM_BOT_TOKEN).build()
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--set-webhook',
+            action='store_true',
+            help='Зарегистрировать TELEGRAM_WEBHOOK_URL и выйти (обновления примет ASGI-приложение)',
+        )
+        parser.add_argument(
+            '--delete-webhook',
+            action='store_true',
+            help='Удалить webhook, чтобы снова работать через long polling',
+        )
+
+    def build_application(self, webhook=False):
+        """
+        Собирает приложение бота.
+        webhook=True - без Updater: обновления передаются из bot.webhook.
+        """
+        # Состояние диалогов хранится в базе и переживает перезапуск бота;
+        # обновления разных чатов обрабатываются параллельно, одного чата - по очереди
+        builder = (
+            ApplicationBuilder()
+            .token(settings.TELEGRAM_BOT_TOKEN)
+            .persistence(DjangoPersistence())
+            .concurrent_updates(
+                ChatSerializedUpdateProcessor(getattr(settings, 'BOT_CONCURRENT_UPDATES', 64))
+            )
+        )
+        if webhook:
+            builder = builder.updater(None)
+        application = builder.build()
 
         # Настраиваем обработчик диалога для заказов
         order_conv_handler = ConversationHandler(
@@ -367,6 +405,8 @@ class Command(BaseCommand):
                 GET_FLOWERS: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.get_flowers)],
             },
             fallbacks=[CommandHandler('cancel', self.cancel)],
+            name='order',
+            persistent=True,
         )
 
         # Настраиваем обработчик диалога для проверки статуса
@@ -376,13 +416,44 @@ class Command(BaseCommand):
                 GET_ORDER_NUMBER: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.get_order_status)],
             },
             fallbacks=[CommandHandler('cancel', self.cancel)],
+            name='status',
+            persistent=True,
         )
 
+        # Проверка частоты сообщений раньше всех остальных обработчиков
+        application.add_handler(TypeHandler(Update, self.check_rate_limit), group=-1)
+
         # Добавляем обработчики команд
         application.add_handler(order_conv_handler)
         application.add_handler(status_conv_handler)
         application.add_handler(CommandHandler("start", self.start))
         application.add_handler(CommandHandler("help", self.help_command))
+        application.add_handler(CommandHandler("stats", self.stats_command))
+        application.add_handler(CommandHandler("myorders", self.my_orders_command))
+        return application
 
+    def handle(self, *args, **options):
+        if options['set_webhook'] and not settings.TELEGRAM_WEBHOOK_SECRET:
+            # Без секрета любой, кто знает адрес, мог бы присылать обновления от имени Telegram
+            raise CommandError('Для webhook задайте TELEGRAM_WEBHOOK_SECRET')
+        if options['set_webhook'] or options['delete_webhook']:
+            asyncio.run(self.configure_webhook(delete=options['delete_webhook']))
+            return
+
+        application = self.build_application()
         self.stdout.write(self.style.SUCCESS('🤖 Бот запущен с функцией проверки статуса...'))
-        application.run_polling()
\ No newline at end of file
+        application.run_polling()
+
+    async def configure_webhook(self, delete=False):
+        bot = Bot(settings.TELEGRAM_BOT_TOKEN)
+        async with bot:
+            if delete:
+                await bot.delete_webhook()
+                self.stdout.write(self.style.SUCCESS('Webhook удален'))
+                return
+            await bot.set_webhook(
+                url=settings.TELEGRAM_WEBHOOK_URL,
+                secret_token=settings.TELEGRAM_WEBHOOK_SECRET,
+                max_connections=getattr(settings, 'BOT_CONCURRENT_UPDATES', 64),
+            )
+        self.stdout.write(self.style.SUCCESS(f'Webhook установлен: {settings.TELEGRAM_WEBHOOK_URL}'))
\ No newline at end of file
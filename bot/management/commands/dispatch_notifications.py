@@ -0,0 +1,35 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+from bot.notifications import OutboxDispatcher, NOTIFICATION_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Отправляет уведомления из очереди в Telegram'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Отправить одну пачку и завершиться')
+        parser.add_argument('--batch-size', type=int, default=NOTIFICATION_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=1.0, help='Пауза между опросами очереди, сек')
+
+    async def dispatch(self, options):
+        # Один клиент с пулом соединений на все сообщения
+        bot = Bot(
+            token=settings.TELEGRAM_BOT_TOKEN,
+            request=HTTPXRequest(connection_pool_size=8),
+        )
+        async with bot:
+            dispatcher = OutboxDispatcher(bot, batch_size=options['batch_size'])
+            if options['once']:
+                return await dispatcher.dispatch_once()
+            await dispatcher.run(poll_interval=options['interval'])
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('📨 Диспетчер уведомлений запущен...'))
+        processed = asyncio.run(self.dispatch(options))
+        if options['once']:
+            self.stdout.write(f'Обработано уведомлений: {processed}')
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BotUserData',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.BigIntegerField(unique=True, verbose_name='ID пользователя Telegram')),
+                ('data', models.JSONField(default=dict, verbose_name='Данные')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Данные пользователя бота',
+                'verbose_name_plural': 'Данные пользователей бота',
+            },
+        ),
+        migrations.CreateModel(
+            name='BotConversationState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, verbose_name='Диалог')),
+                ('key', models.CharField(max_length=128, verbose_name='Ключ диалога')),
+                ('state', models.JSONField(verbose_name='Состояние')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Состояние диалога',
+                'verbose_name_plural': 'Состояния диалогов',
+                'constraints': [models.UniqueConstraint(fields=('name', 'key'), name='unique_bot_conversation_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0002_bot_persistence'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notificationoutbox',
+            name='status',
+            field=models.CharField(choices=[('pending', 'В очереди'), ('sent', 'Отправлено'), ('superseded', 'Заменено более новым'), ('failed', 'Ошибка')], default='pending', max_length=20, verbose_name='Состояние'),
+        ),
+    ]
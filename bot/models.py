@@ -1,3 +1,83 @@
 from django.db import models
+from django.utils import timezone
+from orders.models import Order
 
-# Create your models here.
+
+class NotificationOutbox(models.Model):
+    """
+    Очередь исходящих уведомлений Telegram (transactional outbox).
+    Запись создается в той же транзакции, что и изменение заказа,
+    а отправкой занимается команда dispatch_notifications.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('sent', 'Отправлено'),
+        ('superseded', 'Заменено более новым'),
+        ('failed', 'Ошибка'),
+    ]
+
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        related_name='notifications',
+        verbose_name='Заказ',
+        null=True,
+        blank=True
+    )
+    chat_id = models.BigIntegerField(verbose_name='ID чата Telegram')
+    order_status = models.CharField(max_length=20, blank=True, verbose_name='Статус заказа')
+    text = models.TextField(verbose_name='Текст сообщения')
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending',
+        verbose_name='Состояние'
+    )
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток отправки')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата отправки')
+
+    class Meta:
+        verbose_name = 'Уведомление'
+        verbose_name_plural = 'Очередь уведомлений'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"Уведомление #{self.id} для чата {self.chat_id}"
+
+
+class BotConversationState(models.Model):
+    """Состояние диалога ConversationHandler (см. bot.persistence)"""
+    name = models.CharField(max_length=64, verbose_name='Диалог')
+    key = models.CharField(max_length=128, verbose_name='Ключ диалога')
+    state = models.JSONField(verbose_name='Состояние')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+
+    class Meta:
+        verbose_name = 'Состояние диалога'
+        verbose_name_plural = 'Состояния диалогов'
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'key'], name='unique_bot_conversation_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} {self.key}: {self.state}"
+
+
+class BotUserData(models.Model):
+    """context.user_data пользователя Telegram"""
+    user_id = models.BigIntegerField(unique=True, verbose_name='ID пользователя Telegram')
+    data = models.JSONField(default=dict, verbose_name='Данные')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+
+    class Meta:
+        verbose_name = 'Данные пользователя бота'
+        verbose_name_plural = 'Данные пользователей бота'
+
+    def __str__(self):
+        return f"Данные пользователя {self.user_id}"
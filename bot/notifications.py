@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from .models import NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram: ~30 сообщений в секунду всего и ~1 сообщение в секунду в один чат
+NOTIFICATION_BATCH_SIZE = getattr(settings, 'NOTIFICATION_BATCH_SIZE', 100)
+NOTIFICATION_GLOBAL_RATE = getattr(settings, 'NOTIFICATION_GLOBAL_RATE', 25)
+NOTIFICATION_PER_CHAT_INTERVAL = getattr(settings, 'NOTIFICATION_PER_CHAT_INTERVAL', 1.0)
+NOTIFICATION_MAX_ATTEMPTS = getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 5)
+NOTIFICATION_BACKOFF = getattr(settings, 'NOTIFICATION_BACKOFF', 5)
+# На это время выбранные записи скрываются от других диспетчеров
+# (диспетчер добавляет время на отправку всей пачки, см. OutboxDispatcher)
+NOTIFICATION_LEASE = 60
+# Максимальная длина сообщения Telegram
+MESSAGE_MAX_LENGTH = 4096
+
+STATUS_MESSAGES = {
+    'new': "🆕 Ваш заказ №{id} принят в обработку!",
+    'confirmed': "✅ Заказ №{id} подтвержден! Готовим ваш букет.",
+    'processing': "🔧 Заказ №{id} собирается нашими флористами.",
+    'in_progress': "🚚 Заказ №{id} передан курьеру! Ожидайте доставку.",
+    'delivered': "📦 Заказ №{id} доставлен! Спасибо за покупку! 🌹",
+    'cancelled': "❌ Заказ №{id} отменен.",
+}
+
+
+def build_status_message(order_id, status):
+    template = STATUS_MESSAGES.get(status)
+    return template.format(id=order_id) if template else None
+
+
+def enqueue_notification(chat_id, text, order=None, order_status=''):
+    """Ставит сообщение в очередь отправки"""
+    return NotificationOutbox.objects.create(
+        order=order,
+        chat_id=chat_id,
+        text=text,
+        order_status=order_status,
+    )
+
+
+def get_coalesce_window():
+    """
+    Сколько секунд уведомление о статусе ждет отправки.
+    Если за это время статус заказа снова изменится, уйдет только последний.
+    """
+    return getattr(settings, 'NOTIFICATION_COALESCE_WINDOW', 0)
+
+
+def supersede_pending(order_ids):
+    """
+    Помечает еще не отправленные уведомления о статусах заказов устаревшими,
+    в том числе ждущие повтора: иначе старый статус мог бы прийти после нового.
+    Записи, уже взятые диспетчером, будут отправлены, но повторять их
+    при ошибке он не станет (mark_retry).
+    """
+    return NotificationOutbox.objects.filter(
+        order_id__in=order_ids,
+        status='pending',
+    ).exclude(order_status='').update(status='superseded')
+
+
+def enqueue_status_notification(order):
+    """
+    Ставит в очередь уведомление о статусе заказа.
+    Вызывается внутри транзакции, изменившей заказ.
+    """
+    if not order.telegram_chat_id:
+        return None
+    message = build_status_message(order.id, order.status)
+    if not message:
+        return None
+    supersede_pending([order.pk])
+    return NotificationOutbox.objects.create(
+        order=order,
+        chat_id=order.telegram_chat_id,
+        text=message,
+        order_status=order.status,
+        next_attempt_at=timezone.now() + timedelta(seconds=get_coalesce_window()),
+    )
+
+
+def enqueue_status_notifications(orders):
+    """Ставит в очередь уведомления о статусе для списка заказов: один UPDATE и один INSERT"""
+    next_attempt_at = timezone.now() + timedelta(seconds=get_coalesce_window())
+    notifications = []
+    for order in orders:
+        message = build_status_message(order.id, order.status) if order.telegram_chat_id else None
+        if message:
+            notifications.append(NotificationOutbox(
+                order=order,
+                chat_id=order.telegram_chat_id,
+                text=message,
+                order_status=order.status,
+                next_attempt_at=next_attempt_at,
+            ))
+    if notifications:
+        supersede_pending([notification.order_id for notification in notifications])
+    return NotificationOutbox.objects.bulk_create(notifications, batch_size=500)
+
+
+def claim_batch(batch_size=NOTIFICATION_BATCH_SIZE, lease=NOTIFICATION_LEASE):
+    """
+    Забирает пачку готовых к отправке уведомлений.
+    Записи «арендуются» сдвигом next_attempt_at на lease секунд, поэтому
+    несколько диспетчеров не отправят одно сообщение дважды.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            NotificationOutbox.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if batch:
+            NotificationOutbox.objects.filter(id__in=[item.id for item in batch]).update(
+                next_attempt_at=now + timedelta(seconds=lease)
+            )
+    return batch
+
+
+def _truncate(text, limit=MESSAGE_MAX_LENGTH):
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+def _split_messages(notifications, limit=MESSAGE_MAX_LENGTH):
+    """
+    Делит уведомления на сообщения не длиннее limit символов.
+    Возвращает список (записи, текст); слишком длинный текст одного
+    уведомления обрезается.
+    """
+    chunks = []
+    current, texts, length = [], [], 0
+    for notification in notifications:
+        text = _truncate(notification.text, limit)
+        if current and length + 1 + len(text) > limit:
+            chunks.append((current, '\n'.join(texts)))
+            current, texts, length = [], [], 0
+        length += len(text) + (1 if current else 0)
+        current.append(notification)
+        texts.append(text)
+    if current:
+        chunks.append((current, '\n'.join(texts)))
+    return chunks
+
+
+def coalesce(batch):
+    """
+    Группирует пачку уведомлений в сообщения.
+    Уведомления о статусах одного чата склеиваются в одно сообщение
+    (или несколько, если текст длиннее MESSAGE_MAX_LENGTH),
+    из нескольких статусов одного заказа остается последний.
+    Возвращает список (отправляемые записи, устаревшие записи, текст).
+    """
+    groups = {}
+    for notification in batch:
+        if notification.order_status:
+            key = ('chat', notification.chat_id)
+        else:
+            key = ('single', notification.id)
+        groups.setdefault(key, []).append(notification)
+
+    messages = []
+    for group in groups.values():
+        latest = {}
+        superseded = []
+        for notification in sorted(group, key=lambda item: item.id):
+            previous = latest.get(notification.order_id or notification.id)
+            if previous is not None:
+                superseded.append(previous)
+            latest[notification.order_id or notification.id] = notification
+        for to_send, text in _split_messages(list(latest.values())):
+            messages.append((to_send, superseded, text))
+            superseded = []
+    return messages
+
+
+def mark_superseded(notification_ids):
+    NotificationOutbox.objects.filter(id__in=notification_ids).update(status='superseded')
+
+
+def mark_sent(notification_ids):
+    NotificationOutbox.objects.filter(id__in=notification_ids).update(
+        status='sent',
+        sent_at=timezone.now(),
+        last_error='',
+    )
+
+
+def _mark_attempt(notifications, fields):
+    """Одна попытка для записей одного сообщения - один UPDATE"""
+    for notification in notifications:
+        for name, value in fields.items():
+            setattr(notification, name, value)
+    # Устаревшие за время отправки записи не возвращаются в очередь
+    NotificationOutbox.objects.filter(
+        id__in=[notification.id for notification in notifications],
+        status='pending',
+    ).update(**fields)
+
+
+def mark_retry(notifications, error, delay=None):
+    """
+    Откладывает повторную отправку с экспоненциальной задержкой.
+    Записи уходят одним сообщением, поэтому и попытки у них общие.
+    """
+    attempts = max(notification.attempts for notification in notifications) + 1
+    fields = {'attempts': attempts, 'last_error': str(error)}
+    if attempts >= NOTIFICATION_MAX_ATTEMPTS:
+        fields['status'] = 'failed'
+    else:
+        if delay is None:
+            delay = NOTIFICATION_BACKOFF * 2 ** (attempts - 1)
+        fields['next_attempt_at'] = timezone.now() + timedelta(seconds=delay)
+    _mark_attempt(notifications, fields)
+
+
+def mark_failed(notifications, error):
+    attempts = max(notification.attempts for notification in notifications) + 1
+    _mark_attempt(notifications, {'attempts': attempts, 'status': 'failed', 'last_error': str(error)})
+
+
+class SendRateLimiter:
+    """
+    Ограничение частоты отправки: общий лимит сообщений в секунду
+    и минимальный интервал между сообщениями в один чат.
+    """
+
+    def __init__(self, global_rate=NOTIFICATION_GLOBAL_RATE, per_chat_interval=NOTIFICATION_PER_CHAT_INTERVAL):
+        self.global_interval = 1.0 / global_rate if global_rate else 0
+        self.per_chat_interval = per_chat_interval
+        self._next_global = 0.0
+        self._next_chat = {}
+
+    def delay_for(self, chat_id):
+        now = time.monotonic()
+        ready_at = max(self._next_global, self._next_chat.get(chat_id, 0.0))
+        return max(0.0, ready_at - now)
+
+    async def wait(self, chat_id):
+        delay = self.delay_for(chat_id)
+        if delay:
+            await asyncio.sleep(delay)
+        now = time.monotonic()
+        self._next_global = now + self.global_interval
+        self._next_chat[chat_id] = now + self.per_chat_interval
+
+    def pause(self, seconds):
+        """Общая пауза после ответа 429 от Telegram"""
+        self._next_global = max(self._next_global, time.monotonic() + seconds)
+
+
+class OutboxDispatcher:
+    """Отправляет накопленные уведомления через один общий клиент бота"""
+
+    def __init__(self, bot, batch_size=NOTIFICATION_BATCH_SIZE, rate_limiter=None):
+        self.bot = bot
+        self.batch_size = batch_size
+        self.rate_limiter = rate_limiter or SendRateLimiter()
+        # Аренда переживает отправку всей пачки, даже если все сообщения в один чат
+        self.lease = NOTIFICATION_LEASE + batch_size * max(
+            self.rate_limiter.per_chat_interval, self.rate_limiter.global_interval
+        )
+
+    async def send(self, notifications, text):
+        """
+        Отправляет одно сообщение за группу уведомлений одного чата.
+        Возвращает True, если сообщение доставлено.
+        """
+        chat_id = notifications[0].chat_id
+        await self.rate_limiter.wait(chat_id)
+        try:
+            await self.bot.send_message(chat_id=chat_id, text=text)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            self.rate_limiter.pause(retry_after)
+            await sync_to_async(mark_retry)(notifications, e, delay=retry_after)
+        except (BadRequest, Forbidden) as e:
+            # Чат недоступен или сообщение некорректно - повтор не поможет
+            await sync_to_async(mark_failed)(notifications, e)
+        except TelegramError as e:
+            await sync_to_async(mark_retry)(notifications, e)
+        else:
+            return True
+        logger.warning('Не удалось отправить уведомление в чат %s: %s', chat_id, notifications[0].last_error)
+        return False
+
+    async def dispatch_once(self):
+        """Отправляет одну пачку, возвращает количество обработанных записей"""
+        batch = await sync_to_async(claim_batch)(self.batch_size, self.lease)
+        messages = coalesce(batch)
+        superseded = [notification.id for _, outdated, _ in messages for notification in outdated]
+        if superseded:
+            await sync_to_async(mark_superseded)(superseded)
+        for notifications, outdated, text in messages:
+            if await self.send(notifications, text):
+                # Отмечаем сразу: при сбое диспетчера посреди пачки
+                # отправленное не уйдет повторно после окончания аренды
+                await sync_to_async(mark_sent)([notification.id for notification in notifications])
+        return len(batch)
+
+    async def run(self, poll_interval=1.0):
+        while True:
+            processed = await self.dispatch_once()
+            if processed < self.batch_size:
+                await asyncio.sleep(poll_interval)
@@ -0,0 +1,168 @@
+import asyncio
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from telegram.ext import BasePersistence, PersistenceInput
+
+from .executor import database_sync_to_async
+from .models import BotConversationState, BotUserData
+
+# Как часто Application сбрасывает изменения в хранилище, секунд
+BOT_PERSISTENCE_INTERVAL = getattr(settings, 'BOT_PERSISTENCE_INTERVAL', 5)
+
+
+def _encode_key(key):
+    return json.dumps(list(key), separators=(',', ':'))
+
+
+def _decode_key(key):
+    return tuple(json.loads(key))
+
+
+class DjangoPersistence(BasePersistence):
+    """
+    Хранение состояния диалогов и context.user_data в базе.
+
+    Application вызывает update_* для всех изменений раз в update_interval.
+    Изменения одного прохода копятся в памяти и записываются одной
+    транзакцией пакетными запросами; при остановке бота вызывается flush().
+    Состояние читается при запуске, поэтому после перезапуска диалоги
+    продолжаются с того же шага. Во время работы база не перечитывается:
+    состоянием владеет единственный процесс бота (см. README).
+    """
+
+    def __init__(self, update_interval=BOT_PERSISTENCE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self._user_updates = {}
+        self._user_drops = set()
+        # {(name, key): state или None для завершенного диалога}
+        self._conversation_updates = {}
+        self._flush_task = None
+
+    # Загрузка
+
+    async def get_user_data(self):
+        return await database_sync_to_async(self._load_user_data)()
+
+    def _load_user_data(self):
+        return {user_id: data for user_id, data in BotUserData.objects.values_list('user_id', 'data')}
+
+    async def get_conversations(self, name):
+        return await database_sync_to_async(self._load_conversations)(name)
+
+    def _load_conversations(self, name):
+        return {
+            _decode_key(key): state
+            for key, state in BotConversationState.objects.filter(name=name).values_list('key', 'state')
+        }
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    # Изменения
+
+    async def update_user_data(self, user_id, data):
+        if not data:
+            # Пустые данные (например, после /cancel) не храним
+            await self.drop_user_data(user_id)
+            return
+        self._user_drops.discard(user_id)
+        self._user_updates[user_id] = data
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id):
+        self._user_updates.pop(user_id, None)
+        self._user_drops.add(user_id)
+        self._schedule_flush()
+
+    async def update_conversation(self, name, key, new_state):
+        self._conversation_updates[(name, _encode_key(key))] = new_state
+        self._schedule_flush()
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    # Запись
+
+    def _has_pending(self):
+        return bool(self._user_updates or self._user_drops or self._conversation_updates)
+
+    def _schedule_flush(self):
+        """
+        Одна запись на проход update_persistence, а не на каждое изменение.
+        Изменения, пришедшие во время записи, запишет та же задача следом.
+        """
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_soon())
+
+    async def _flush_soon(self):
+        # Даем остальным update_* текущего прохода попасть в буфер
+        await asyncio.sleep(0)
+        while self._has_pending():
+            await self.flush()
+
+    async def flush(self):
+        user_updates, self._user_updates = self._user_updates, {}
+        user_drops, self._user_drops = self._user_drops, set()
+        conversation_updates, self._conversation_updates = self._conversation_updates, {}
+        if user_updates or user_drops or conversation_updates:
+            await database_sync_to_async(self._write)(user_updates, user_drops, conversation_updates)
+
+    def _write(self, user_updates, user_drops, conversation_updates):
+        now = timezone.now()
+        finished = {}
+        states = []
+        for (name, key), state in conversation_updates.items():
+            if state is None:
+                finished.setdefault(name, []).append(key)
+            else:
+                states.append(BotConversationState(name=name, key=key, state=state, updated_at=now))
+
+        with transaction.atomic():
+            if user_updates:
+                BotUserData.objects.bulk_create(
+                    [BotUserData(user_id=user_id, data=data, updated_at=now) for user_id, data in user_updates.items()],
+                    update_conflicts=True,
+                    unique_fields=['user_id'],
+                    update_fields=['data', 'updated_at'],
+                )
+            if user_drops:
+                BotUserData.objects.filter(user_id__in=user_drops).delete()
+            if states:
+                BotConversationState.objects.bulk_create(
+                    states,
+                    update_conflicts=True,
+                    unique_fields=['name', 'key'],
+                    update_fields=['state', 'updated_at'],
+                )
+            for name, keys in finished.items():
+                BotConversationState.objects.filter(name=name, key__in=keys).delete()
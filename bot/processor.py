@@ -0,0 +1,52 @@
+import asyncio
+
+from telegram.ext import BaseUpdateProcessor
+
+
+def _chat_key(update):
+    chat = getattr(update, 'effective_chat', None)
+    if chat is not None:
+        return chat.id
+    user = getattr(update, 'effective_user', None)
+    return ('user', user.id) if user is not None else None
+
+
+class ChatSerializedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Параллельная обработка обновлений разных чатов, но по одному на чат.
+
+    ConversationHandler читает и меняет шаг диалога без блокировок, поэтому
+    два сообщения одного чата, обработанные одновременно, могут перезаписать
+    состояние друг друга. Обновления чата ждут своей очереди до того, как
+    займут место среди max_concurrent_updates.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        # {чат: [Lock, число обновлений, ждущих или обрабатываемых]}
+        self._chat_locks = {}
+
+    async def process_update(self, update, coroutine):
+        key = _chat_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        entry = self._chat_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await super().process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[key]
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from orders.models import Order
+
+# Короткое время жизни: статус меняется редко, а /status присылают часто
+ORDER_STATUS_CACHE_TIMEOUT = getattr(settings, 'ORDER_STATUS_CACHE_TIMEOUT', 60)
+RECENT_ORDERS_LIMIT = 5
+
+# Компактная проекция заказа для ответов бота
+STATUS_FIELDS = ('id', 'status', 'total_price', 'created_at')
+
+_MISSING = object()
+
+
+def _order_key(telegram_chat_id, order_id):
+    return f'bot:order-status:{telegram_chat_id}:{order_id}'
+
+
+def _recent_key(telegram_chat_id):
+    return f'bot:recent-orders:{telegram_chat_id}'
+
+
+def get_status_display(status):
+    return dict(Order.STATUS_CHOICES).get(status, status)
+
+
+def get_order_status(telegram_chat_id, order_id):
+    """
+    Статус заказа чата: словарь с полями STATUS_FIELDS или None.
+    Чужие и несуществующие заказы тоже кэшируются (как None),
+    поиск идет по индексу (telegram_chat_id, created_at).
+    """
+    key = _order_key(telegram_chat_id, order_id)
+    info = cache.get(key, _MISSING)
+    if info is _MISSING:
+        info = (
+            Order.objects
+            .filter(telegram_chat_id=telegram_chat_id, id=order_id)
+            .values(*STATUS_FIELDS)
+            .first()
+        )
+        cache.set(key, info, ORDER_STATUS_CACHE_TIMEOUT)
+    return info
+
+
+def get_recent_orders(telegram_chat_id, limit=RECENT_ORDERS_LIMIT):
+    """Последние заказы чата в той же проекции"""
+    key = _recent_key(telegram_chat_id)
+    orders = cache.get(key)
+    if orders is None:
+        orders = list(
+            Order.objects
+            .filter(telegram_chat_id=telegram_chat_id)
+            .order_by('-created_at')
+            .values(*STATUS_FIELDS)[:RECENT_ORDERS_LIMIT]
+        )
+        cache.set(key, orders, ORDER_STATUS_CACHE_TIMEOUT)
+    return orders[:limit]
+
+
+def invalidate_order_status(orders):
+    """
+    Сбрасывает кэш статусов для заказов с чатом Telegram.
+    Ключи удаляются сразу и еще раз после фиксации транзакции:
+    до нее бот мог снова закэшировать старый статус.
+    """
+    keys = set()
+    for order in orders:
+        if order.telegram_chat_id:
+            keys.add(_order_key(order.telegram_chat_id, order.pk))
+            keys.add(_recent_key(order.telegram_chat_id))
+    if not keys:
+        return
+    keys = list(keys)
+    cache.delete_many(keys)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: cache.delete_many(keys))
@@ -1,3 +1,581 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from telegram.error import Forbidden, RetryAfter
+from orders.models import Order
+from .models import NotificationOutbox
+from flower_project.testing import LOCMEM_CACHES
+from .notifications import OutboxDispatcher, SendRateLimiter
 
-# Create your tests here.
+
+class FakeBot:
+    """Бот-заглушка: запоминает сообщения или выбрасывает заданную ошибку"""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        if self.error:
+            raise self.error
+        self.sent.append((chat_id, text))
+
+
+class BotTestMixin:
+    def setUp(self):
+        from django.core.cache import cache
+        from catalog.system import clear_system_products
+        # Служебные товары запоминаются в процессе, а тесты откатывают их создание
+        cache.clear()
+        clear_system_products()
+
+    def create_order(self, **kwargs):
+        data = {
+            'customer_name': 'Покупатель',
+            'customer_phone': '+79999999999',
+            'delivery_address': 'ул. Цветочная, 1',
+            'delivery_time': timezone.now(),
+            'telegram_chat_id': 12345,
+        }
+        data.update(kwargs)
+        return Order.objects.create(**data)
+
+    def dispatch(self, bot):
+        dispatcher = OutboxDispatcher(bot, rate_limiter=SendRateLimiter(global_rate=0, per_chat_interval=0))
+        return async_to_sync(dispatcher.dispatch_once)()
+
+
+@override_settings(NOTIFICATION_COALESCE_WINDOW=0)
+class NotificationOutboxTest(BotTestMixin, TestCase):
+    def test_order_save_enqueues(self):
+        """Тест: сохранение заказа ставит уведомление в очередь, а не отправляет его"""
+        order = self.create_order()
+        notification = NotificationOutbox.objects.get()
+        self.assertEqual(notification.order, order)
+        self.assertEqual(notification.chat_id, 12345)
+        self.assertEqual(notification.status, 'pending')
+
+    def test_no_chat_no_notification(self):
+        self.create_order(telegram_chat_id=None)
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_dispatch_sends(self):
+        """Тест отправки пачки уведомлений"""
+        self.create_order()
+        bot = FakeBot()
+        self.assertEqual(self.dispatch(bot), 1)
+        self.assertEqual(len(bot.sent), 1)
+        self.assertEqual(NotificationOutbox.objects.get().status, 'sent')
+        # Повторно ничего не отправляется
+        self.assertEqual(self.dispatch(bot), 0)
+
+    def test_dispatch_retry_after(self):
+        """Тест отложенного повтора при ответе 429"""
+        self.create_order()
+        self.dispatch(FakeBot(RetryAfter(30)))
+        notification = NotificationOutbox.objects.get()
+        self.assertEqual(notification.status, 'pending')
+        self.assertEqual(notification.attempts, 1)
+        self.assertGreater(notification.next_attempt_at, timezone.now())
+
+    def test_sent_marked_before_batch_ends(self):
+        """Тест: уведомление отмечается отправленным сразу, а не после всей пачки"""
+        class CrashingBot(FakeBot):
+            async def send_message(self, chat_id, text):
+                if self.sent:
+                    raise RuntimeError('Диспетчер остановлен')
+                await super().send_message(chat_id, text)
+
+        self.create_order()
+        self.create_order(telegram_chat_id=777)
+        with self.assertRaises(RuntimeError):
+            self.dispatch(CrashingBot())
+        self.assertEqual(NotificationOutbox.objects.filter(status='sent').count(), 1)
+
+    def test_lease_covers_throttled_batch(self):
+        """Тест: аренда пачки дольше ее отправки с ограничением частоты"""
+        from datetime import timedelta
+        from .notifications import claim_batch
+        self.create_order()
+        dispatcher = OutboxDispatcher(FakeBot(), batch_size=100, rate_limiter=SendRateLimiter(per_chat_interval=1.0))
+        claim_batch(dispatcher.batch_size, dispatcher.lease)
+        self.assertGreater(
+            NotificationOutbox.objects.get().next_attempt_at,
+            timezone.now() + timedelta(seconds=100),
+        )
+
+    def test_dispatch_forbidden(self):
+        """Тест: заблокированный бот не повторяет отправку"""
+        self.create_order()
+        self.dispatch(FakeBot(Forbidden('bot was blocked by the user')))
+        self.assertEqual(NotificationOutbox.objects.get().status, 'failed')
+
+
+@override_settings(NOTIFICATION_COALESCE_WINDOW=30)
+class NotificationCoalescingTest(BotTestMixin, TestCase):
+    def release(self):
+        """Имитирует окончание окна ожидания"""
+        NotificationOutbox.objects.filter(status='pending').update(next_attempt_at=timezone.now())
+
+    def test_held_for_window(self):
+        """Тест: уведомление ждет окончания окна"""
+        self.create_order()
+        bot = FakeBot()
+        self.assertEqual(self.dispatch(bot), 0)
+        self.release()
+        self.assertEqual(self.dispatch(bot), 1)
+        self.assertEqual(len(bot.sent), 1)
+
+    def test_quick_transitions_send_latest(self):
+        """Тест: из быстрых смен статуса уходит только последняя"""
+        order = self.create_order()
+        for status in ['confirmed', 'processing', 'in_progress']:
+            order.status = status
+            order.save()
+        self.assertEqual(NotificationOutbox.objects.filter(status='pending').count(), 1)
+        self.assertEqual(NotificationOutbox.objects.filter(status='superseded').count(), 3)
+
+        self.release()
+        bot = FakeBot()
+        self.dispatch(bot)
+        self.assertEqual(bot.sent, [(12345, f"🚚 Заказ №{order.id} передан курьеру! Ожидайте доставку.")])
+
+    def test_chat_messages_combined(self):
+        """Тест: уведомления о нескольких заказах одного чата уходят одним сообщением"""
+        orders = [self.create_order() for _ in range(3)]
+        self.create_order(telegram_chat_id=777)
+        Order.objects.filter(pk__in=[order.pk for order in orders]).update_status('confirmed')
+        self.release()
+
+        bot = FakeBot()
+        self.dispatch(bot)
+        messages = dict(bot.sent)
+        self.assertEqual(len(bot.sent), 2)
+        self.assertEqual(messages[12345].count('подтвержден'), 3)
+        self.assertFalse(NotificationOutbox.objects.filter(status='pending').exists())
+
+    def test_retry_single_update(self):
+        """Тест: повтор склеенного сообщения - один UPDATE на все его записи"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .notifications import coalesce
+        for _ in range(3):
+            self.create_order()
+        self.release()
+        [(notifications, _, text)] = coalesce(list(NotificationOutbox.objects.all()))
+        dispatcher = OutboxDispatcher(FakeBot(RetryAfter(30)), rate_limiter=SendRateLimiter(global_rate=0, per_chat_interval=0))
+        with CaptureQueriesContext(connection) as queries:
+            async_to_sync(dispatcher.send)(notifications, text)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(set(NotificationOutbox.objects.values_list('attempts', flat=True)), {1})
+
+    def test_long_messages_split(self):
+        """Тест: склеенные уведомления не превышают лимит длины сообщения Telegram"""
+        from .notifications import MESSAGE_MAX_LENGTH, enqueue_notification
+        orders = [self.create_order() for _ in range(3)]
+        NotificationOutbox.objects.all().delete()
+        for order in orders:
+            enqueue_notification(12345, 'ж' * 3000, order=order, order_status='confirmed')
+        enqueue_notification(777, 'ж' * 5000)
+
+        bot = FakeBot()
+        self.dispatch(bot)
+        self.assertEqual(len(bot.sent), 4)
+        self.assertTrue(all(len(text) <= MESSAGE_MAX_LENGTH for _, text in bot.sent))
+        self.assertEqual(NotificationOutbox.objects.filter(status='sent').count(), 4)
+
+    def test_retried_notification_superseded(self):
+        """Тест: ждущее повтора уведомление о старом статусе не придет после нового"""
+        order = self.create_order()
+        self.release()
+        self.dispatch(FakeBot(RetryAfter(1)))
+        order.status = 'confirmed'
+        order.save()
+        NotificationOutbox.objects.filter(status='pending').update(next_attempt_at=timezone.now())
+
+        bot = FakeBot()
+        self.dispatch(bot)
+        self.assertEqual(bot.sent, [(12345, f"✅ Заказ №{order.id} подтвержден! Готовим ваш букет.")])
+
+
+class BotOrderNotificationTest(BotTestMixin, TestCase):
+    def test_single_accepted_notification(self):
+        """Тест: заказ из бота порождает одно уведомление о приеме"""
+        from .management.commands.bot import create_order_sync
+        order = create_order_sync(
+            {'name': 'Анна', 'phone': '+79999999999', 'address': 'ул. Цветочная, 1', 'flowers': 'Розы'},
+            telegram_chat_id=777,
+        )
+        self.assertEqual(order.telegram_chat_id, 777)
+        self.assertEqual(NotificationOutbox.objects.filter(chat_id=777).count(), 1)
+
+    def test_admin_bulk_status_notifies(self):
+        """Тест: массовая смена статуса ставит уведомления в очередь"""
+        orders = [self.create_order() for _ in range(3)]
+        NotificationOutbox.objects.all().delete()
+        Order.objects.filter(pk__in=[order.pk for order in orders]).update_status('in_progress')
+        self.assertEqual(NotificationOutbox.objects.filter(order_status='in_progress').count(), 3)
+
+
+class BotOrderCreationTest(BotTestMixin, TestCase):
+    user_data = {'name': 'Анна', 'phone': '+79999999999', 'address': 'ул. Цветочная, 1', 'flowers': 'Розы'}
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_base_product_created_once(self):
+        """Тест: базовый товар создается один раз и запоминается"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from catalog.models import Product
+        from catalog.system import INDIVIDUAL_BOUQUET, get_system_product
+        product = get_system_product(INDIVIDUAL_BOUQUET)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(get_system_product(INDIVIDUAL_BOUQUET), product)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(Product.objects.filter(system_key=INDIVIDUAL_BOUQUET).count(), 1)
+
+    def test_base_product_change_invalidates(self):
+        """Тест: изменение базового товара сбрасывает запомненное значение"""
+        from catalog.system import INDIVIDUAL_BOUQUET, get_system_product
+        product = get_system_product(INDIVIDUAL_BOUQUET)
+        product.price = 1500
+        product.save()
+        self.assertEqual(get_system_product(INDIVIDUAL_BOUQUET).price, 1500)
+
+    def test_order_written_once(self):
+        """Тест: заказ из бота записывается один раз вместе с позицией"""
+        from django.db.models.signals import post_save
+        from catalog.system import INDIVIDUAL_BOUQUET, get_system_product
+        from .management.commands.bot import create_order_sync
+        get_system_product(INDIVIDUAL_BOUQUET)
+        saves = []
+
+        def on_save(sender, instance, **kwargs):
+            saves.append(instance.pk)
+
+        post_save.connect(on_save, sender=Order)
+        try:
+            order = create_order_sync(self.user_data, telegram_chat_id=777)
+        finally:
+            post_save.disconnect(on_save, sender=Order)
+
+        self.assertEqual(saves, [order.pk])
+        self.assertEqual(order.total_price, 1000)
+        self.assertEqual(order.items.get().product.system_key, INDIVIDUAL_BOUQUET)
+
+    def test_order_uses_current_price(self):
+        """Тест: заказ берет цену из базы, даже если запомненный товар устарел"""
+        from catalog.models import Product
+        from catalog.system import INDIVIDUAL_BOUQUET, get_system_product
+        from .management.commands.bot import create_order_sync
+        product = get_system_product(INDIVIDUAL_BOUQUET)
+        # Изменение без сигналов (как из другого процесса без общего кэша)
+        Product.objects.filter(pk=product.pk).update(price=1700)
+
+        order = create_order_sync(self.user_data, telegram_chat_id=777)
+        self.assertEqual(order.total_price, 1700)
+        self.assertEqual(order.items.get().price, 1700)
+
+    def test_deleted_base_product_recreated(self):
+        """Тест: удаленный в другом процессе базовый товар создается заново"""
+        from catalog.models import Product
+        from catalog.system import INDIVIDUAL_BOUQUET, get_system_product
+        from .management.commands.bot import create_order_sync
+        product = get_system_product(INDIVIDUAL_BOUQUET)
+        Product.objects.filter(pk=product.pk).delete()
+
+        order = create_order_sync(self.user_data, telegram_chat_id=777)
+        self.assertNotEqual(order.items.get().product_id, product.pk)
+
+
+class OrderStatusLookupTest(BotTestMixin, TestCase):
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_status_cached(self):
+        """Тест: повторный /status отвечает из кэша"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .status import get_order_status
+        order = self.create_order()
+        self.assertEqual(get_order_status(12345, order.id)['status'], 'new')
+        with CaptureQueriesContext(connection) as queries:
+            info = get_order_status(12345, order.id)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(set(info), {'id', 'status', 'total_price', 'created_at'})
+
+    def test_other_chat_order_hidden(self):
+        from .status import get_order_status
+        order = self.create_order()
+        self.assertIsNone(get_order_status(999, order.id))
+
+    def test_status_change_invalidates(self):
+        """Тест: смена статуса сбрасывает кэш, в том числе при массовой смене"""
+        from .status import get_order_status
+        order = self.create_order()
+        get_order_status(12345, order.id)
+        order.status = 'confirmed'
+        order.save()
+        self.assertEqual(get_order_status(12345, order.id)['status'], 'confirmed')
+
+        Order.objects.filter(pk=order.pk).update_status('processing')
+        self.assertEqual(get_order_status(12345, order.id)['status'], 'processing')
+
+    def test_status_cached_before_commit_reset(self):
+        """Тест: статус, закэшированный до фиксации смены, сбрасывается после нее"""
+        from django.core.cache import cache
+        from django.db import transaction
+        from .status import _order_key, get_order_status
+        order = self.create_order()
+        stale = get_order_status(12345, order.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                order.status = 'confirmed'
+                order.save()
+                # Бот прочитал статус из базы до фиксации транзакции
+                cache.set(_order_key(12345, order.id), stale)
+        self.assertEqual(get_order_status(12345, order.id)['status'], 'confirmed')
+
+    def test_recent_orders(self):
+        """Тест: последние заказы чата, новые первыми"""
+        from datetime import timedelta
+        from .status import get_recent_orders
+        older = self.create_order()
+        Order.objects.filter(pk=older.pk).update(created_at=timezone.now() - timedelta(days=1))
+        newer = self.create_order()
+        self.create_order(telegram_chat_id=999)
+        self.assertEqual([order['id'] for order in get_recent_orders(12345)], [newer.id, older.id])
+
+        # Новый заказ сбрасывает список
+        latest = self.create_order()
+        self.assertEqual(get_recent_orders(12345)[0]['id'], latest.id)
+
+
+class BotRateLimitTest(TestCase):
+    def setUp(self):
+        from flower_project.ratelimit import get_backend
+        get_backend.cache_clear()
+
+    def make_update(self, chat_id, replies):
+        from types import SimpleNamespace
+
+        async def reply_text(text):
+            replies.append(text)
+
+        return SimpleNamespace(
+            effective_chat=SimpleNamespace(id=chat_id),
+            effective_message=SimpleNamespace(reply_text=reply_text),
+        )
+
+    def test_chat_flood_stopped(self):
+        """Тест: сообщения сверх лимита чата не обрабатываются, предупреждение одно"""
+        from django.test import override_settings
+        from telegram.ext import ApplicationHandlerStop
+        from .management.commands.bot import Command
+        command = Command()
+        replies = []
+        with override_settings(RATE_LIMITS={'bot': '2/m', 'bot-warning': '1/m'}, BOT_ORM_WORKERS=0):
+            for _ in range(2):
+                async_to_sync(command.check_rate_limit)(self.make_update(1, replies), None)
+            for _ in range(3):
+                with self.assertRaises(ApplicationHandlerStop):
+                    async_to_sync(command.check_rate_limit)(self.make_update(1, replies), None)
+            # Другой чат не ограничен
+            async_to_sync(command.check_rate_limit)(self.make_update(2, replies), None)
+        self.assertEqual(len(replies), 1)
+
+
+# Запросы через общий поток Django: тестовая транзакция не видна потокам пула
+@override_settings(BOT_ORM_WORKERS=0)
+class DjangoPersistenceTest(TestCase):
+    def update(self, persistence, users):
+        async def run():
+            for user_id in users:
+                await persistence.update_user_data(user_id, {'name': f'Покупатель {user_id}'})
+                await persistence.update_conversation('order', (user_id, user_id), 1)
+            # Изменения прохода записываются одной пачкой после него
+            await persistence._flush_task
+        async_to_sync(run)()
+
+    def test_state_survives_restart(self):
+        """Тест: состояние диалога и user_data восстанавливаются новым экземпляром"""
+        from .persistence import DjangoPersistence
+        self.update(DjangoPersistence(), [1, 2])
+
+        restarted = DjangoPersistence()
+        self.assertEqual(async_to_sync(restarted.get_conversations)('order'), {(1, 1): 1, (2, 2): 1})
+        self.assertEqual(async_to_sync(restarted.get_user_data)()[2], {'name': 'Покупатель 2'})
+
+    def test_finished_conversation_removed(self):
+        """Тест: завершенный диалог и пустые данные удаляются"""
+        from .models import BotConversationState, BotUserData
+        from .persistence import DjangoPersistence
+        persistence = DjangoPersistence()
+        self.update(persistence, [1])
+
+        async def finish():
+            await persistence.update_conversation('order', (1, 1), None)
+            await persistence.update_user_data(1, {})
+            await persistence.flush()
+        async_to_sync(finish)()
+
+        self.assertFalse(BotConversationState.objects.exists())
+        self.assertFalse(BotUserData.objects.exists())
+
+    def test_writes_batched(self):
+        """Тест: число запросов записи не зависит от числа пользователей"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .persistence import DjangoPersistence
+        with CaptureQueriesContext(connection) as small:
+            self.update(DjangoPersistence(), [1])
+        with CaptureQueriesContext(connection) as large:
+            self.update(DjangoPersistence(), range(2, 50))
+        self.assertEqual(len(small), len(large))
+
+    def test_changes_during_flush_written(self):
+        """Тест: изменение, пришедшее во время записи, тоже попадает в базу"""
+        from .models import BotUserData
+        from .persistence import DjangoPersistence
+        persistence = DjangoPersistence()
+        write = persistence._write
+
+        def slow_write(*args):
+            write(*args)
+            # Следующий проход update_persistence пришелся на запись
+            async_to_sync(persistence.update_user_data)(2, {'name': 'Позже'})
+            persistence._write = write
+        persistence._write = slow_write
+
+        self.update(persistence, [1])
+        self.assertEqual(BotUserData.objects.get(user_id=2).data, {'name': 'Позже'})
+
+
+class FakeApplication:
+    """Приложение бота-заглушка для проверки webhook"""
+
+    def __init__(self):
+        import asyncio
+        self.bot = None
+        self.update_queue = asyncio.Queue()
+        self.started = False
+        self.stopped = False
+
+    async def initialize(self):
+        pass
+
+    async def start(self):
+        self.started = True
+
+    async def stop(self):
+        self.stopped = True
+
+    async def shutdown(self):
+        pass
+
+
+class TelegramWebhookTest(TestCase):
+    def setUp(self):
+        from .webhook import TelegramWebhook, mount_webhook
+        self.fake = FakeApplication()
+        self.webhook = TelegramWebhook(path='/hook/', secret='s3cret', application_factory=lambda: self.fake)
+        self.django_requests = []
+
+        async def django_application(scope, receive, send):
+            self.django_requests.append(scope['path'])
+
+        self.application = mount_webhook(django_application, webhook=self.webhook)
+
+    def request(self, path, body=b'', method='POST', secret=b's3cret'):
+        import json
+        responses = []
+        scope = {
+            'type': 'http',
+            'path': path,
+            'method': method,
+            'headers': [(b'x-telegram-bot-api-secret-token', secret)],
+        }
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            responses.append(message)
+
+        if isinstance(body, dict):
+            body = json.dumps(body).encode()
+        async_to_sync(self.application)(scope, receive, send)
+        return responses[0]['status'] if responses else None
+
+    def test_update_queued(self):
+        """Тест: обновление от Telegram ставится в очередь приложения бота"""
+        status = self.request('/hook/', {'update_id': 1, 'message': {
+            'message_id': 1, 'date': 0, 'chat': {'id': 5, 'type': 'private'}, 'text': '/start',
+        }})
+        self.assertEqual(status, 200)
+        self.assertTrue(self.fake.started)
+        update = self.fake.update_queue.get_nowait()
+        self.assertEqual(update.update_id, 1)
+        self.assertEqual(update.message.text, '/start')
+
+    def test_wrong_secret_rejected(self):
+        self.assertEqual(self.request('/hook/', {'update_id': 1}, secret=b'wrong'), 403)
+        self.assertTrue(self.fake.update_queue.empty())
+
+    def test_other_paths_go_to_django(self):
+        self.assertIsNone(self.request('/catalog/', method='GET'))
+        self.assertEqual(self.django_requests, ['/catalog/'])
+
+    def test_secret_required(self):
+        """Тест: без секрета webhook не запускается и не принимает обновления"""
+        from django.core.exceptions import ImproperlyConfigured
+        from django.core.management import CommandError, call_command
+        from .webhook import TelegramWebhook
+        with self.assertRaises(ImproperlyConfigured):
+            TelegramWebhook(path='/hook/', secret='')
+        self.webhook.secret = ''
+        self.assertEqual(self.request('/hook/', {'update_id': 1}, secret=b''), 403)
+        with override_settings(TELEGRAM_WEBHOOK_URL='https://example.com/hook/', TELEGRAM_WEBHOOK_SECRET=''):
+            with self.assertRaises(CommandError):
+                call_command('bot', '--set-webhook')
+
+
+class ChatSerializedUpdateProcessorTest(TestCase):
+    def test_one_update_per_chat(self):
+        """Тест: обновления одного чата обрабатываются по очереди, разных - параллельно"""
+        import asyncio
+        from types import SimpleNamespace
+        from .processor import ChatSerializedUpdateProcessor
+        processor = ChatSerializedUpdateProcessor(8)
+        running = {}
+        overlaps = []
+
+        async def handle(chat_id):
+            running[chat_id] = running.get(chat_id, 0) + 1
+            overlaps.append((chat_id, running[chat_id], sum(running.values())))
+            await asyncio.sleep(0.01)
+            running[chat_id] -= 1
+
+        async def run():
+            updates = [SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id)) for chat_id in [1, 1, 1, 2]]
+            await asyncio.gather(*(
+                processor.process_update(update, handle(update.effective_chat.id)) for update in updates
+            ))
+        async_to_sync(run)()
+
+        self.assertEqual(max(per_chat for _, per_chat, _ in overlaps), 1)
+        self.assertEqual(max(total for _, _, total in overlaps), 2)
+        self.assertEqual(processor._chat_locks, {})
+
+
+class DatabaseSyncToAsyncTest(TestCase):
+    def test_runs_in_bot_pool(self):
+        """Тест: ORM-функции бота выполняются в отдельном пуле потоков"""
+        import threading
+        from django.test import override_settings
+        from .executor import database_sync_to_async
+
+        def current_thread():
+            return threading.current_thread().name
+
+        with override_settings(BOT_ORM_WORKERS=4):
+            self.assertTrue(async_to_sync(database_sync_to_async(current_thread))().startswith('bot-orm'))
+        with override_settings(BOT_ORM_WORKERS=0):
+            self.assertFalse(async_to_sync(database_sync_to_async(current_thread))().startswith('bot-orm'))
@@ -0,0 +1,138 @@
+import asyncio
+import hmac
+import json
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+
+def build_webhook_application():
+    from bot.management.commands.bot import Command
+
+    return Command().build_application(webhook=True)
+
+
+async def _read_body(receive):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+async def _respond(send, status):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'text/plain; charset=utf-8')],
+    })
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+class TelegramWebhook:
+    """
+    ASGI-приложение, принимающее обновления Telegram.
+
+    Обновление кладется в очередь Application и сразу подтверждается,
+    а обрабатывается параллельно с другими (до BOT_CONCURRENT_UPDATES),
+    ORM-запросы идут в пуле потоков bot.executor.
+
+    Запросы принимаются только с заголовком X-Telegram-Bot-Api-Secret-Token,
+    поэтому без TELEGRAM_WEBHOOK_SECRET webhook не запускается. Состояние
+    диалогов и очередь по чатам держит один процесс: webhook обслуживает
+    ровно один ASGI-воркер (см. README).
+    """
+
+    def __init__(self, path=None, secret=None, application_factory=build_webhook_application):
+        self.path = path or settings.TELEGRAM_WEBHOOK_PATH
+        self.secret = settings.TELEGRAM_WEBHOOK_SECRET if secret is None else secret
+        if not self.secret:
+            raise ImproperlyConfigured('Для webhook задайте TELEGRAM_WEBHOOK_SECRET')
+        self.application_factory = application_factory
+        self.application = None
+        self._lock = asyncio.Lock()
+
+    async def get_application(self):
+        """Приложение бота запускается при первом обновлении"""
+        if self.application is None:
+            async with self._lock:
+                if self.application is None:
+                    application = self.application_factory()
+                    await application.initialize()
+                    await application.start()
+                    self.application = application
+        return self.application
+
+    async def shutdown(self):
+        """Дожидается обработки очереди и сохраняет состояние диалогов"""
+        if self.application is not None:
+            await self.application.stop()
+            await self.application.shutdown()
+            self.application = None
+
+    def is_authorized(self, scope):
+        if not self.secret:
+            return False
+        headers = dict(scope.get('headers', []))
+        token = headers.get(b'x-telegram-bot-api-secret-token', b'')
+        return hmac.compare_digest(token, self.secret.encode())
+
+    async def __call__(self, scope, receive, send):
+        if scope['method'] != 'POST':
+            await _respond(send, 405)
+            return
+        if not self.is_authorized(scope):
+            await _respond(send, 403)
+            return
+
+        try:
+            data = json.loads(await _read_body(receive))
+        except ValueError:
+            await _respond(send, 400)
+            return
+
+        application = await self.get_application()
+        await application.update_queue.put(Update.de_json(data, application.bot))
+        await _respond(send, 200)
+
+
+async def _lifespan(webhook, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            try:
+                await webhook.shutdown()
+            except Exception:
+                logger.exception('Ошибка при остановке бота')
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def mount_webhook(django_application, webhook=None):
+    """
+    Подключает webhook бота к ASGI-приложению Django:
+    запросы на TELEGRAM_WEBHOOK_PATH обрабатывает бот, остальные - Django.
+    Без TELEGRAM_WEBHOOK_URL приложение Django возвращается без изменений.
+    """
+    if webhook is None:
+        if not settings.TELEGRAM_WEBHOOK_URL:
+            return django_application
+        webhook = TelegramWebhook()
+
+    async def application(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await _lifespan(webhook, receive, send)
+        elif scope['type'] == 'http' and scope['path'] == webhook.path:
+            await webhook(scope, receive, send)
+        else:
+            await django_application(scope, receive, send)
+
+    return application
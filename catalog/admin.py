@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from .models import Category, Product
+from .search import matching_product_ids
+from .thumbnails import rendition_url
 
 
 @admin.register(Category)
@@ -12,9 +14,9 @@ class CategoryAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at']
 
     def product_count(self, obj):
-        return obj.products.count()
+        return obj.available_product_count
 
-    product_count.short_description = 'Количество товаров'
+    product_count.short_description = 'Товаров в наличии'
 
 
 @admin.register(Product)
@@ -28,7 +30,8 @@ class ProductAdmin(admin.ModelAdmin):
         'created_at'
     ]
     list_filter = ['category', 'is_available', 'created_at']
-    search_fields = ['name', 'description']
+    # Подстроки ищутся в коротких полях, слова описания - по индексу
+    search_fields = ['name', 'slug']
     prepopulated_fields = {'slug': ('name',)}
     readonly_fields = ['created_at', 'updated_at', 'image_preview_large']
     fieldsets = (
@@ -51,17 +54,27 @@ class ProductAdmin(admin.ModelAdmin):
         if obj.image:
             return format_html(
                 '<img src="{}" width="50" height="50" style="object-fit: cover;" />',
-                obj.image.url
+                rendition_url(obj, 'thumb')
             )
         return "-"
 
     image_preview.short_description = 'Изображение'
 
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Обычный поиск по search_fields (подстроки названия и slug) плюс товары,
+        найденные по инвертированному индексу, вместо icontains по описаниям.
+        """
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            results |= queryset.filter(pk__in=matching_product_ids(search_term))
+        return results, may_have_duplicates
+
     def image_preview_large(self, obj):
         if obj.image:
             return format_html(
                 '<img src="{}" width="200" height="200" style="object-fit: cover;" />',
-                obj.image.url
+                rendition_url(obj, 'card')
             )
         return "Нет изображения"
 
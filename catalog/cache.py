@@ -0,0 +1,84 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Category
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 15)
+
+
+def _initial_version():
+    # Версия после потери ключа в кэше не совпадает ни с одной прежней
+    return int(time.time() * 1000)
+
+
+def get_catalog_version():
+    """Возвращает текущую версию каталога"""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, _initial_version(), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """
+    Увеличивает версию каталога.
+    Все ключи со старой версией перестают использоваться и вытесняются сами.
+    """
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        version = _initial_version()
+        cache.set(CATALOG_VERSION_KEY, version, None)
+        return version
+
+
+def make_key(*parts, version=None):
+    """Собирает ключ кэша каталога с учетом версии"""
+    if version is None:
+        version = get_catalog_version()
+    return ':'.join(['catalog', f'v{version}'] + [str(part) for part in parts])
+
+
+def get_active_categories():
+    """Активные категории для сайдбара (кэшируются до изменения каталога)"""
+    key = make_key('categories')
+    categories = cache.get(key)
+    if categories is None:
+        categories = list(Category.objects.filter(is_active=True))
+        cache.set(key, categories, CATALOG_CACHE_TIMEOUT)
+    return categories
+
+
+def get_active_category(slug):
+    """Активная категория по slug из кэшированного списка"""
+    for category in get_active_categories():
+        if category.slug == slug:
+            return category
+    return None
+
+
+def product_page_key(category_slug, filters, page):
+    """
+    Ключ страницы списка товаров.
+    filters - очищенные значения ProductFilterForm.
+    """
+    filter_parts = [
+        f'{name}={"" if value is None else value}'
+        for name, value in sorted(filters.items())
+    ]
+    filters_hash = hashlib.md5('&'.join(filter_parts).encode()).hexdigest()
+    return make_key('products', category_slug or '-', filters_hash, page)
+
+
+def get_product_page(key):
+    """Возвращает {'ids': [...], 'count': N, 'number': N} или None"""
+    return cache.get(key)
+
+
+def set_product_page(key, ids, count, number):
+    cache.set(key, {'ids': list(ids), 'count': count, 'number': number}, CATALOG_CACHE_TIMEOUT)
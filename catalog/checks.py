@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Кэш в памяти процесса: сброс версии каталога не дойдет до других процессов
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_CACHES:
+        return [Warning(
+            'Кэш по умолчанию не общий для процессов: версия каталога, статусы '
+            'заказов и лимиты запросов не будут согласованы между воркерами и ботом.',
+            hint='Используйте DatabaseCache, Redis или Memcached.',
+            id='catalog.W001',
+        )]
+    return []
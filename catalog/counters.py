@@ -0,0 +1,53 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Category, Product
+
+
+def adjust_available_count(category_id, delta):
+    """Изменяет счетчик товаров в наличии без чтения категории"""
+    if category_id and delta:
+        Category.objects.filter(pk=category_id).update(
+            available_product_count=F('available_product_count') + delta
+        )
+
+
+def recount_available_products(categories=None):
+    """
+    Пересчитывает счетчики одним UPDATE с подзапросом.
+    categories - queryset категорий (по умолчанию все).
+    """
+    if categories is None:
+        categories = Category.objects.all()
+    available = Product.objects.filter(
+        category=OuterRef('pk'), is_available=True
+    ).order_by().values('category').annotate(count=Count('pk')).values('count')
+    return categories.update(available_product_count=Coalesce(Subquery(available), 0))
+
+
+def track_product_save(product, created):
+    """Учитывает создание, перенос в другую категорию и смену is_available"""
+    new = (product.category_id, product.is_available)
+    old = None if created else getattr(product, '_loaded_availability', None)
+
+    if created:
+        if product.is_available:
+            adjust_available_count(product.category_id, 1)
+    elif old is None:
+        # Исходное состояние неизвестно - пересчитываем затронутую категорию
+        recount_available_products(Category.objects.filter(pk=product.category_id))
+    elif old != new:
+        old_category_id, old_available = old
+        if old_available:
+            adjust_available_count(old_category_id, -1)
+        if product.is_available:
+            adjust_available_count(product.category_id, 1)
+
+    product.remember_availability()
+
+
+def track_product_delete(product):
+    state = getattr(product, '_loaded_availability', None)
+    category_id, is_available = state or (product.category_id, product.is_available)
+    if is_available:
+        adjust_available_count(category_id, -1)
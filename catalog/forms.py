@@ -1,8 +1,15 @@
 from django import forms
 from .models import Product, Category
+from .cache import get_active_categories
 
 
 class ProductFilterForm(forms.Form):
+    q = forms.CharField(
+        required=False,
+        max_length=200,
+        label='Поиск',
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Розы, тюльпаны...'})
+    )
     category = forms.ChoiceField(
         required=False,
         label='Категория',
@@ -24,6 +31,6 @@ class ProductFilterForm(forms.Form):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         categories = [('', 'Все категории')] + [
-            (cat.id, cat.name) for cat in Category.objects.filter(is_active=True)
+            (cat.id, cat.name) for cat in get_active_categories()
         ]
         self.fields['category'].choices = categories
\ No newline at end of file
@@ -0,0 +1,49 @@
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .cache import CATALOG_CACHE_TIMEOUT, get_catalog_version, make_key
+from .thumbnails import needs_renditions
+
+PRODUCT_CARD_TEMPLATE = 'catalog/includes/_product_card.html'
+# Подставляется вместо CSRF-токена в кэшируемую карточку и заменяется
+# токеном текущего посетителя при выводе
+CSRF_PLACEHOLDER = 'csrf-token-placeholder'
+
+
+def product_card_key(product, version):
+    """
+    Ключ карточки: товар, время его изменения и версия каталога
+    (название категории). Отдельно учитывается, построены ли копии
+    изображения - они записываются без изменения updated_at.
+    """
+    images = 'ready' if product.image and not needs_renditions(product) else 'source'
+    return make_key('card', product.pk, product.updated_at.timestamp(), images, version=version)
+
+
+def render_product_card(product):
+    return render_to_string(PRODUCT_CARD_TEMPLATE, {'product': product, 'csrf_token': CSRF_PLACEHOLDER})
+
+
+def render_product_cards(products, csrf_token=''):
+    """
+    HTML карточек товаров. Все карточки страницы читаются из кэша одним
+    get_many, недостающие рендерятся и записываются одним set_many.
+    Возвращает [(товар, html)] в исходном порядке.
+    """
+    products = list(products)
+    version = get_catalog_version()
+    keys = [product_card_key(product, version) for product in products]
+    cached = cache.get_many(keys)
+
+    missing = {}
+    cards = []
+    for product, key in zip(products, keys):
+        html = cached.get(key)
+        if html is None:
+            html = missing[key] = render_product_card(product)
+        cards.append((product, mark_safe(html.replace(CSRF_PLACEHOLDER, str(csrf_token)))))
+
+    if missing:
+        cache.set_many(missing, CATALOG_CACHE_TIMEOUT)
+    return cards
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from catalog.cache import bump_catalog_version
+from catalog.recommendations import RECOMMENDATIONS_LIMIT, build_recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рекомендации товаров по совместным покупкам. '
+        'Запускается периодически (например, раз в сутки из cron)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=RECOMMENDATIONS_LIMIT, help='Рекомендаций на товар')
+        parser.add_argument('--days', type=int, default=None, help='Учитывать заказы за последние N дней')
+
+    def handle(self, *args, **options):
+        created = build_recommendations(options['limit'], options['days'])
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f'Сохранено рекомендаций: {created}'))
@@ -0,0 +1,90 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import F
+from catalog.cache import bump_catalog_version
+from catalog.models import Category, Product
+from catalog.thumbnails import (
+    get_executor, mark_renditions_failed, plan_renditions, read_source, render, store_renditions,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит уменьшенные копии изображений товаров и категорий. '
+        'С --interval работает постоянно и подхватывает новые загрузки'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--force', action='store_true', help='Перестроить копии для всех изображений')
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Проверять новые изображения каждые N секунд, не завершаясь',
+        )
+
+    def handle(self, *args, **options):
+        force = options['force']
+        while True:
+            total = 0
+            for model in (Category, Product):
+                total += self.process(model, options['batch_size'], force)
+            if total or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(f'Обработано изображений: {total}'))
+            if not options['interval']:
+                return
+            force = False
+            close_old_connections()
+            time.sleep(options['interval'])
+
+    def process(self, model, batch_size, force):
+        objects = model.objects.exclude(image='').exclude(image__isnull=True).order_by('id')
+        if not force:
+            # Обработанные изображения отсеиваются запросом, а не перебором всех записей
+            objects = objects.exclude(renditions_source=F('image'))
+        processed = 0
+        last_id = 0
+        while True:
+            batch = list(objects.filter(id__gt=last_id).only('id', 'image')[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            # Сжатие всей пачки идет параллельно в пуле процессов
+            jobs = []
+            for instance in batch:
+                try:
+                    source = read_source(instance.image)
+                    renditions, missing = plan_renditions(source)
+                    if getattr(settings, 'THUMBNAIL_SYNC', False) or not missing:
+                        result = render(source, missing) if missing else {}
+                    else:
+                        result = get_executor().submit(render, source, missing)
+                except Exception as e:
+                    self.record_failure(model, instance, e)
+                    continue
+                jobs.append((instance, renditions, result))
+
+            stored = 0
+            for instance, renditions, result in jobs:
+                try:
+                    files = result if isinstance(result, dict) else result.result()
+                except Exception as e:
+                    # Pillow не смог разобрать файл (UnidentifiedImageError и т.п.)
+                    self.record_failure(model, instance, e)
+                    continue
+                store_renditions(model, instance.pk, instance.image.name, renditions, files, bump_version=False)
+                stored += 1
+            if stored:
+                # Один сброс кэша каталога на пачку, а не на каждое изображение
+                bump_catalog_version()
+            processed += stored
+        return processed
+
+    def record_failure(self, model, instance, error):
+        self.stderr.write(f'{instance.image.name}: {error}')
+        mark_renditions_failed(model, instance.pk, instance.image.name, error)
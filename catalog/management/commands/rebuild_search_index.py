@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from catalog.models import Product
+from catalog.search import index_products
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает поисковый индекс товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        products = Product.objects.select_related('category').order_by('id')
+        total = 0
+        last_id = 0
+        while True:
+            batch = list(products.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            index_products(batch)
+            total += len(batch)
+            last_id = batch[-1].id
+
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано товаров: {total}'))
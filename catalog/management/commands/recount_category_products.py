@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from catalog.cache import bump_catalog_version
+from catalog.counters import recount_available_products
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает количество товаров в наличии для категорий'
+
+    def handle(self, *args, **options):
+        updated = recount_available_products()
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f'Обновлено категорий: {updated}'))
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:17
+
+from django.db import migrations, models
+
+
+def fill_available_product_count(apps, schema_editor):
+    Category = apps.get_model('catalog', 'Category')
+    Product = apps.get_model('catalog', 'Product')
+    for category in Category.objects.all():
+        Category.objects.filter(pk=category.pk).update(
+            available_product_count=Product.objects.filter(category=category, is_available=True).count()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_product_catalog_pro_created_da1d60_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='available_product_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Товаров в наличии'),
+        ),
+        migrations.RunPython(fill_available_product_count, migrations.RunPython.noop),
+    ]
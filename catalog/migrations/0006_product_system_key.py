@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:33
+
+from django.db import migrations, models
+
+
+def mark_individual_bouquet(apps, schema_editor):
+    # Товар, который бот раньше искал по названию
+    Product = apps.get_model('catalog', 'Product')
+    product = Product.objects.filter(name='Индивидуальный букет').order_by('id').first()
+    if product is not None:
+        Product.objects.filter(pk=product.pk).update(system_key='individual_bouquet')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_category_available_product_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='system_key',
+            field=models.CharField(blank=True, editable=False, max_length=50, null=True, unique=True, verbose_name='Системный ключ'),
+        ),
+        migrations.RunPython(mark_individual_bouquet, migrations.RunPython.noop),
+    ]
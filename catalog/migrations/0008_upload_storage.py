@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:43
+
+import flower_project.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='category',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=flower_project.storage.get_upload_storage, upload_to='categories/', verbose_name='Изображение'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(storage=flower_project.storage.get_upload_storage, upload_to='products/', verbose_name='Изображение'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+from catalog.search import build_terms
+
+
+def build_search_index(apps, schema_editor):
+    """Индексирует товары, созданные до появления поискового индекса"""
+    Product = apps.get_model('catalog', 'Product')
+    ProductSearchTerm = apps.get_model('catalog', 'ProductSearchTerm')
+    products = Product.objects.select_related('category').filter(search_terms__isnull=True).order_by('id')
+    last_id = 0
+    while True:
+        batch = list(products.filter(id__gt=last_id)[:500])
+        if not batch:
+            break
+        ProductSearchTerm.objects.bulk_create(
+            [
+                ProductSearchTerm(product=product, term=term, weight=weight)
+                for product in batch
+                for term, weight in build_terms(product).items()
+            ],
+            batch_size=1000,
+        )
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_product_recommendation'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
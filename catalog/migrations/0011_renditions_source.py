@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:25
+
+from django.db import migrations, models
+
+
+def fill_renditions_source(apps, schema_editor):
+    """Изображения, копии которых уже построены, не обрабатываются заново"""
+    for name in ('Category', 'Product'):
+        model = apps.get_model('catalog', name)
+        for pk, renditions in model.objects.exclude(image_renditions={}).values_list('id', 'image_renditions'):
+            if renditions.get('source'):
+                model.objects.filter(pk=pk).update(renditions_source=renditions['source'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_backfill_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='renditions_source',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='renditions_source',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(fill_renditions_source, migrations.RunPython.noop),
+    ]
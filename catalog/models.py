@@ -4,14 +4,26 @@ from django.core.validators import MinValueValidator
 from django.utils import timezone
 from django.utils.text import slugify
 
+from flower_project.storage import get_upload_storage
+
 
 class Category(models.Model):
     name = models.CharField(max_length=100, verbose_name='Название категории')
     description = models.TextField(blank=True, verbose_name='Описание')
     slug = models.SlugField(max_length=100, unique=True, verbose_name='URL', blank=True)  # Добавлено blank=True
-    image = models.ImageField(upload_to='categories/', blank=True, null=True, verbose_name='Изображение')
+    image = models.ImageField(upload_to='categories/', storage=get_upload_storage, blank=True, null=True, verbose_name='Изображение')
+    # Уменьшенные копии изображения, см. catalog.thumbnails
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False, verbose_name='Копии изображения')
+    # Изображение, для которого копии уже построены (или построить не удалось)
+    renditions_source = models.CharField(max_length=100, blank=True, default='', db_index=True, editable=False)
     is_active = models.BooleanField(default=True, verbose_name='Активна')
     created_at = models.DateTimeField(default=timezone.now, verbose_name='Дата создания')
+    # Поддерживается сигналами товаров, пересчет - команда recount_category_products
+    available_product_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Товаров в наличии'
+    )
 
     class Meta:
         verbose_name = 'Категория'
@@ -24,6 +36,12 @@ class Category(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Счетчик меняется только атомарными UPDATE, не перезаписываем его
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'available_product_count'
+            ]
         super().save(*args, **kwargs)
 
     def get_absolute_url(self):
@@ -39,7 +57,9 @@ class Product(models.Model):
         verbose_name='Цена',
         validators=[MinValueValidator(0)]
     )
-    image = models.ImageField(upload_to='products/', verbose_name='Изображение')
+    image = models.ImageField(upload_to='products/', storage=get_upload_storage, verbose_name='Изображение')
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False, verbose_name='Копии изображения')
+    renditions_source = models.CharField(max_length=100, blank=True, default='', db_index=True, editable=False)
     category = models.ForeignKey(
         Category,
         on_delete=models.CASCADE,
@@ -50,6 +70,15 @@ class Product(models.Model):
     slug = models.SlugField(max_length=200, unique=True, verbose_name='URL', blank=True)  # Добавлено blank=True
     created_at = models.DateTimeField(default=timezone.now, verbose_name='Дата создания')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+    # Ключ служебного товара (например, для заказов из бота), см. catalog.system
+    system_key = models.CharField(
+        max_length=50,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Системный ключ'
+    )
 
     class Meta:
         verbose_name = 'Товар'
@@ -59,11 +88,26 @@ class Product(models.Model):
             models.Index(fields=['slug']),
             models.Index(fields=['category']),
             models.Index(fields=['is_available']),
+            models.Index(fields=['created_at', 'id']),
         ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Состояние при загрузке для учета счетчика товаров категории
+        instance.remember_availability()
+        return instance
+
+    def remember_availability(self):
+        deferred = self.get_deferred_fields()
+        if 'category_id' in deferred or 'is_available' in deferred:
+            self._loaded_availability = None
+        else:
+            self._loaded_availability = (self.category_id, self.is_available)
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
@@ -71,4 +115,58 @@ class Product(models.Model):
 
     def get_absolute_url(self):
         """Возвращает URL детальной страницы товара"""
-        return reverse('catalog:product_detail', kwargs={'slug': self.slug})
\ No newline at end of file
+        return reverse('catalog:product_detail', kwargs={'slug': self.slug})
+
+
+class ProductRecommendation(models.Model):
+    """
+    Предрассчитанная рекомендация: товары, которые покупают вместе
+    с product, дополненные товарами той же категории (см. catalog.recommendations)
+    """
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='recommendations',
+        verbose_name='Товар'
+    )
+    recommended = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='recommended_for',
+        verbose_name='Рекомендуемый товар'
+    )
+    position = models.PositiveSmallIntegerField(verbose_name='Позиция')
+    # Число заказов, где товары куплены вместе; 0 - товар той же категории
+    score = models.PositiveIntegerField(default=0, verbose_name='Совместных покупок')
+
+    class Meta:
+        verbose_name = 'Рекомендация'
+        verbose_name_plural = 'Рекомендации'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'position'], name='unique_recommendation_position'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.recommended_id}"
+
+
+class ProductSearchTerm(models.Model):
+    """Запись инвертированного индекса: основа слова -> товар"""
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='search_terms',
+        verbose_name='Товар'
+    )
+    term = models.CharField(max_length=64, verbose_name='Основа слова')
+    weight = models.PositiveIntegerField(default=1, verbose_name='Вес')
+
+    class Meta:
+        verbose_name = 'Термин поискового индекса'
+        verbose_name_plural = 'Поисковый индекс'
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'product'], name='unique_search_term_product'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> {self.product_id}"
@@ -0,0 +1,104 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from orders.models import OrderItem
+from .models import Product, ProductRecommendation
+
+# Сколько рекомендаций хранится для каждого товара
+RECOMMENDATIONS_LIMIT = getattr(settings, 'RECOMMENDATIONS_LIMIT', 8)
+
+
+def count_co_purchases(days=None):
+    """
+    Сколько заказов содержат каждую пару товаров (отмененные не учитываются).
+    Пары считаются одним запросом с самосоединением позиций заказа.
+    Возвращает {товар: {другой товар: заказов}}.
+    """
+    items = OrderItem.objects.exclude(order__status='cancelled').filter(
+        product__system_key__isnull=True,
+        order__items__product__system_key__isnull=True,
+        # Каждая пара один раз: (a, b) при a < b
+        order__items__product_id__gt=F('product_id'),
+    )
+    if days:
+        items = items.filter(order__created_at__gte=timezone.now() - timedelta(days=days))
+    pairs = items.values('product_id', other_id=F('order__items__product_id')).annotate(
+        orders=Count('order_id', distinct=True)
+    ).order_by()
+
+    counts = defaultdict(dict)
+    for pair in pairs:
+        counts[pair['product_id']][pair['other_id']] = pair['orders']
+        counts[pair['other_id']][pair['product_id']] = pair['orders']
+    return counts
+
+
+def build_recommendations(limit=RECOMMENDATIONS_LIMIT, days=None):
+    """
+    Пересчитывает таблицу рекомендаций: для каждого товара в наличии
+    до limit товаров, чаще всего покупаемых вместе с ним, а если таких
+    меньше - новинки той же категории. Таблица заменяется целиком
+    в одной транзакции. Возвращает число записей.
+    """
+    counts = count_co_purchases(days)
+    products = list(
+        Product.objects.filter(is_available=True, system_key__isnull=True)
+        .order_by('-created_at', '-id')
+        .values_list('id', 'category_id')
+    )
+    available = {product_id for product_id, category_id in products}
+    by_category = defaultdict(list)
+    for product_id, category_id in products:
+        by_category[category_id].append(product_id)
+
+    recommendations = []
+    for product_id, category_id in products:
+        bought_together = sorted(
+            (
+                (orders, other_id) for other_id, orders in counts.get(product_id, {}).items()
+                if other_id in available
+            ),
+            key=lambda item: (-item[0], item[1]),
+        )[:limit]
+        picks = [(other_id, orders) for orders, other_id in bought_together]
+        chosen = {product_id} | {other_id for other_id, orders in picks}
+        for other_id in by_category[category_id]:
+            if len(picks) >= limit:
+                break
+            if other_id not in chosen:
+                picks.append((other_id, 0))
+
+        recommendations.extend(
+            ProductRecommendation(product_id=product_id, recommended_id=other_id, position=position, score=score)
+            for position, (other_id, score) in enumerate(picks)
+        )
+
+    with transaction.atomic():
+        ProductRecommendation.objects.all().delete()
+        ProductRecommendation.objects.bulk_create(recommendations, batch_size=1000)
+    return len(recommendations)
+
+
+def get_related_products(product, limit=4):
+    """
+    Рекомендации для страницы товара одним запросом по индексу
+    (product, position). Для товаров, добавленных после последнего
+    пересчета, - товары той же категории.
+    """
+    related = list(
+        Product.objects.filter(recommended_for__product=product, is_available=True)
+        .select_related('category')
+        .order_by('recommended_for__position')[:limit]
+    )
+    if not related:
+        related = list(
+            Product.objects.filter(category_id=product.category_id, is_available=True)
+            .exclude(id=product.id)
+            .select_related('category')[:limit]
+        )
+    return related
@@ -0,0 +1,192 @@
+import re
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Sum
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND_1 = ('вшись', 'вши', 'в')
+PERFECTIVE_GERUND_2 = ('ившись', 'ывшись', 'ивши', 'ывши', 'ив', 'ыв')
+REFLEXIVE = ('ся', 'сь')
+ADJECTIVE = (
+    'ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое', 'ей', 'ий', 'ый', 'ой',
+    'ем', 'им', 'ым', 'ом', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+)
+PARTICIPLE_1 = ('ем', 'нн', 'вш', 'ющ', 'щ')
+PARTICIPLE_2 = ('ивш', 'ывш', 'ующ')
+VERB_1 = ('ете', 'йте', 'ешь', 'нно', 'ла', 'на', 'ли', 'ем', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'й', 'л', 'н')
+VERB_2 = (
+    'ейте', 'уйте', 'ила', 'ыла', 'ена', 'ите', 'или', 'ыли', 'ило', 'ыло', 'ено', 'ует', 'уют',
+    'ены', 'ить', 'ыть', 'ишь', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ят', 'ит', 'ыт', 'ую', 'ю',
+)
+NOUN = (
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ев', 'ов', 'ие', 'ье', 'еи', 'ии', 'ей', 'ой',
+    'ий', 'ям', 'ем', 'ам', 'ом', 'ах', 'ях', 'ию', 'ью', 'ия', 'ья', 'а', 'е', 'и', 'й', 'о', 'у',
+    'ы', 'ь', 'ю', 'я',
+)
+DERIVATIONAL = ('ость', 'ост')
+SUPERLATIVE = ('ейше', 'ейш')
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Вес термина в зависимости от поля товара
+FIELD_WEIGHTS = {
+    'name': 5,
+    'category': 3,
+    'description': 1,
+}
+
+
+def _regions(word):
+    """Возвращает начало областей RV и R2 (алгоритм Snowball)"""
+    rv = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+
+    def next_region(start):
+        for i in range(start + 1, len(word)):
+            if word[i] not in VOWELS and word[i - 1] in VOWELS:
+                return i + 1
+        return len(word)
+
+    r1 = next_region(0)
+    r2 = next_region(r1)
+    return rv, r2
+
+
+def _strip(rv, endings, preceded_by=None):
+    """
+    Удаляет самое длинное окончание из endings.
+    preceded_by - буквы, одна из которых должна стоять перед окончанием.
+    """
+    for ending in sorted(endings, key=len, reverse=True):
+        if not rv.endswith(ending):
+            continue
+        stem = rv[:-len(ending)]
+        if preceded_by is None or (stem and stem[-1] in preceded_by):
+            return stem
+    return None
+
+
+def _strip_group(rv, group_1, group_2):
+    """Окончания первой группы допустимы только после «а» или «я»"""
+    candidates = []
+    for stem in (_strip(rv, group_1, 'ая'), _strip(rv, group_2)):
+        if stem is not None:
+            candidates.append(stem)
+    if not candidates:
+        return None
+    # Побеждает самое длинное окончание, то есть самая короткая основа
+    return min(candidates, key=len)
+
+
+def stem(word):
+    """Стеммер Портера (Snowball) для русского языка"""
+    word = word.lower().replace('ё', 'е')
+    rv_start, r2_start = _regions(word)
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # Шаг 1
+    result = _strip_group(rv, PERFECTIVE_GERUND_1, PERFECTIVE_GERUND_2)
+    if result is not None:
+        rv = result
+    else:
+        result = _strip(rv, REFLEXIVE)
+        if result is not None:
+            rv = result
+        result = _strip(rv, ADJECTIVE)
+        if result is not None:
+            participle = _strip_group(result, PARTICIPLE_1, PARTICIPLE_2)
+            rv = participle if participle is not None else result
+        else:
+            result = _strip_group(rv, VERB_1, VERB_2)
+            if result is None:
+                result = _strip(rv, NOUN)
+            if result is not None:
+                rv = result
+
+    # Шаг 2
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # Шаг 3
+    r2 = (prefix + rv)[r2_start:] if r2_start < len(prefix + rv) else ''
+    for ending in DERIVATIONAL:
+        if r2.endswith(ending):
+            rv = rv[:-len(ending)]
+            break
+
+    # Шаг 4
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    else:
+        result = _strip(rv, SUPERLATIVE)
+        if result is not None:
+            rv = result[:-1] if result.endswith('нн') else result
+        elif rv.endswith('ь'):
+            rv = rv[:-1]
+
+    return prefix + rv
+
+
+def tokenize(text):
+    """Разбивает текст на основы слов"""
+    return [stem(token) for token in TOKEN_RE.findall(text or '') if len(token) > 1]
+
+
+def build_terms(product):
+    """Возвращает {основа: вес} для товара"""
+    terms = Counter()
+    fields = {
+        'name': product.name,
+        'category': product.category.name,
+        'description': product.description,
+    }
+    for field, text in fields.items():
+        for term in tokenize(text):
+            terms[term[:64]] += FIELD_WEIGHTS[field]
+    return terms
+
+
+def index_products(products):
+    """Перестраивает записи инвертированного индекса для товаров"""
+    from .models import ProductSearchTerm
+
+    products = list(products)
+    entries = [
+        ProductSearchTerm(product=product, term=term, weight=weight)
+        for product in products
+        for term, weight in build_terms(product).items()
+    ]
+    with transaction.atomic():
+        ProductSearchTerm.objects.filter(product__in=products).delete()
+        ProductSearchTerm.objects.bulk_create(entries, batch_size=1000)
+
+
+def index_product(product):
+    index_products([product])
+
+
+def matching_product_ids(query):
+    """Подзапрос id товаров, у которых в индексе есть хотя бы одна основа запроса"""
+    from .models import ProductSearchTerm
+
+    return ProductSearchTerm.objects.filter(term__in=set(tokenize(query))).values('product_id')
+
+
+def search_products(queryset, query):
+    """
+    Фильтрует queryset товаров по запросу и сортирует по релевантности.
+    Поиск идет по индексу основ, без сканирования описаний.
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return queryset.none()
+    return queryset.filter(
+        search_terms__term__in=terms
+    ).annotate(
+        search_rank=Sum('search_terms__weight')
+    ).order_by('-search_rank', '-created_at')
@@ -0,0 +1,59 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Category, Product
+from .cache import bump_catalog_version
+from .search import index_product, index_products
+from .counters import track_product_save, track_product_delete
+from .system import clear_system_products
+from .thumbnails import needs_renditions, schedule_renditions
+
+
+@receiver(post_save, sender=Product)
+def update_category_product_count(sender, instance, created, raw=False, **kwargs):
+    """Поддерживает Category.available_product_count"""
+    if not raw:
+        track_product_save(instance, created)
+
+
+@receiver(post_delete, sender=Product)
+def decrease_category_product_count(sender, instance, **kwargs):
+    track_product_delete(instance)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_cache(sender, **kwargs):
+    """
+    Сбрасывает кэш каталога при изменении товара или категории.
+    Другие процессы сбрасывают запомненные служебные товары по версии
+    каталога, текущий - сразу.
+    """
+    bump_catalog_version()
+    clear_system_products()
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_index(sender, instance, raw=False, **kwargs):
+    """
+    Обновляет поисковый индекс товара.
+    При удалении записи индекса удаляются каскадно.
+    """
+    if not raw:
+        index_product(instance)
+
+
+@receiver(post_save, sender=Category)
+def update_category_search_index(sender, instance, created, raw=False, **kwargs):
+    """Название категории входит в индекс ее товаров"""
+    if not created and not raw:
+        index_products(instance.products.select_related('category'))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+def generate_image_renditions(sender, instance, raw=False, **kwargs):
+    """Уменьшенные копии нового изображения строит generate_thumbnails (или сразу при THUMBNAIL_SYNC)"""
+    if not raw and needs_renditions(instance):
+        schedule_renditions(instance)
@@ -0,0 +1,82 @@
+import threading
+
+from .cache import get_catalog_version
+from .models import Category, Product
+
+INDIVIDUAL_BOUQUET = 'individual_bouquet'
+
+# Служебные товары: создаются при первом обращении
+SYSTEM_PRODUCTS = {
+    INDIVIDUAL_BOUQUET: {
+        'category': {
+            'slug': 'individual-orders',
+            'name': 'Индивидуальные заказы',
+            'description': 'Категория для индивидуальных заказов из Telegram',
+        },
+        'product': {
+            'slug': 'individual-bouquet',
+            'name': 'Индивидуальный букет',
+            'description': 'Индивидуальный букет по пожеланиям клиента',
+            'price': 1000,
+            'is_available': True,
+        },
+    },
+}
+
+_products = {}
+_lock = threading.Lock()
+
+
+def _resolve_system_product(key):
+    """
+    Находит служебный товар по уникальному ключу или создает его.
+    get_or_create по уникальным полям не создает дубликатов
+    при одновременных заказах.
+    """
+    spec = SYSTEM_PRODUCTS[key]
+    product = Product.objects.select_related('category').filter(system_key=key).first()
+    if product is not None:
+        return product
+
+    category_spec = dict(spec['category'])
+    category, _ = Category.objects.get_or_create(slug=category_spec.pop('slug'), defaults=category_spec)
+    product, _ = Product.objects.get_or_create(
+        system_key=key,
+        defaults=dict(spec['product'], category=category),
+    )
+    return product
+
+
+def get_system_product(key):
+    """
+    Служебный товар по ключу из SYSTEM_PRODUCTS.
+    Запоминается в процессе до смены версии каталога. QuerySet.update()
+    версию не меняет - цену для заказа берите из get_system_product_for_order().
+    """
+    cached = _products.get(key)
+    if cached is not None and cached[0] == get_catalog_version():
+        return cached[1]
+    with _lock:
+        product = _resolve_system_product(key)
+        # Версия берется после возможного создания товара, которое ее меняет
+        _products[key] = (get_catalog_version(), product)
+    return product
+
+
+def get_system_product_for_order(key):
+    """
+    Служебный товар с ценой, прочитанной из базы одним запросом.
+    Вызывается в транзакции заказа: запомненный товар мог устареть.
+    """
+    product = get_system_product(key)
+    price = Product.objects.filter(pk=product.pk).values_list('price', flat=True).first()
+    if price is None:
+        # Товар удален - создаем заново
+        clear_system_products()
+        return get_system_product(key)
+    product.price = price
+    return product
+
+
+def clear_system_products():
+    _products.clear()
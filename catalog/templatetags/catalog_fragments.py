@@ -0,0 +1,14 @@
+from django import template
+
+from catalog.fragments import render_product_cards
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def product_cards(context, products):
+    """
+    Закэшированные карточки товаров:
+    {% product_cards products as cards %}{% for product, card in cards %}{{ card }}{% endfor %}
+    """
+    return render_product_cards(products, context.get('csrf_token') or '')
@@ -0,0 +1,37 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from catalog.thumbnails import RENDITIONS, rendition_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def rendition(instance, name, fmt='jpeg'):
+    """URL уменьшенной копии изображения товара или категории"""
+    return rendition_url(instance, name, fmt)
+
+
+@register.simple_tag
+def picture(instance, name, css_class='', alt=''):
+    """
+    <picture> с копией в WebP и JPEG для остальных браузеров.
+    Пока копии не построены, выводится оригинал.
+    """
+    if not instance.image:
+        return ''
+    renditions = instance.image_renditions or {}
+    paths = renditions.get(name) if renditions.get('source') == instance.image.name else None
+    if not paths:
+        return format_html(
+            '<img src="{}" class="{}" alt="{}" loading="lazy">',
+            instance.image.url, css_class, alt
+        )
+    width, height, crop = RENDITIONS[name]
+    size = format_html(' width="{}" height="{}"', width, height) if crop else ''
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}">'
+        '<img src="{}" class="{}" alt="{}" loading="lazy"{}></picture>',
+        default_storage.url(paths['webp']), default_storage.url(paths['jpeg']), css_class, alt, size
+    )
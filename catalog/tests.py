@@ -1,3 +1,541 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from .models import Category, Product
+from flower_project.testing import LOCMEM_CACHES
+from .cache import get_catalog_version
 
-# Create your tests here.
+
+class CatalogTestMixin:
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Розы', slug='roses')
+        self.product = Product.objects.create(
+            name='Букет из красных роз',
+            slug='red-roses',
+            description='Букет из 25 алых роз',
+            price=2500,
+            image='products/roses.jpg',
+            category=self.category,
+        )
+
+
+class ProductListCacheTest(CatalogTestMixin, TestCase):
+    def test_cached_page_skips_product_queries(self):
+        """Тест повторного запроса страницы каталога из кэша"""
+        url = reverse('catalog:category', kwargs={'category_slug': 'roses'})
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+
+        # Товары выбираются по id, без постраничного запроса с LIMIT и списка категорий
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url)
+        sql = [query['sql'] for query in queries.captured_queries]
+        self.assertFalse(any('LIMIT 12' in query for query in sql))
+        self.assertFalse(any(query.startswith('SELECT "catalog_category"') for query in sql))
+        self.assertEqual(list(second.context['products']), [self.product])
+        self.assertEqual(second.context['paginator'].count, 1)
+
+    def test_product_save_bumps_version(self):
+        """Тест сброса кэша при изменении товара"""
+        version = get_catalog_version()
+        self.product.price = 3000
+        self.product.save()
+        self.assertGreater(get_catalog_version(), version)
+
+    def test_price_change_is_visible(self):
+        """Тест отсутствия устаревших данных после изменения цены"""
+        url = reverse('catalog:product_list')
+        self.client.get(url, {'price_min': 2000})
+        self.product.price = 1500
+        self.product.save()
+        response = self.client.get(url, {'price_min': 2000})
+        self.assertEqual(list(response.context['products']), [])
+
+    def test_inactive_category_404(self):
+        """Тест 404 для неактивной категории"""
+        self.category.is_active = False
+        self.category.save()
+        response = self.client.get(reverse('catalog:category', kwargs={'category_slug': 'roses'}))
+        self.assertEqual(response.status_code, 404)
+
+
+class ProductSearchTest(CatalogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tulips = Product.objects.create(
+            name='Весенние тюльпаны',
+            slug='tulips',
+            description='Нежные тюльпаны и одна роза',
+            price=1500,
+            image='products/tulips.jpg',
+            category=Category.objects.create(name='Тюльпаны', slug='tulips'),
+        )
+
+    def test_stem(self):
+        """Тест стемминга словоформ"""
+        from .search import stem
+        self.assertEqual(stem('розами'), stem('розы'))
+        self.assertEqual(stem('букетов'), stem('букет'))
+
+    def test_search_ranking(self):
+        """Тест ранжирования: совпадение в названии важнее описания"""
+        response = self.client.get(reverse('catalog:product_list'), {'q': 'розы'})
+        self.assertEqual(list(response.context['products']), [self.product, self.tulips])
+
+    def test_admin_search(self):
+        """Тест: поиск в админке находит и подстроки названия и slug, и словоформы по индексу"""
+        from django.contrib.admin.sites import site
+        from django.test import RequestFactory
+        model_admin = site._registry[Product]
+        request = RequestFactory().get('/admin/catalog/product/')
+        for term, expected in [('тюльп', {self.tulips}), ('tuli', {self.tulips}), ('одной', {self.tulips})]:
+            results, _ = model_admin.get_search_results(request, Product.objects.all(), term)
+            self.assertEqual(set(results), expected, term)
+
+    def test_index_updated_on_save(self):
+        """Тест инкрементального обновления индекса"""
+        self.tulips.name = 'Весенние пионы'
+        self.tulips.description = 'Пионы'
+        self.tulips.save()
+        response = self.client.get(reverse('catalog:product_list'), {'q': 'тюльпан'})
+        self.assertEqual(list(response.context['products']), [self.tulips])
+        response = self.client.get(reverse('catalog:product_list'), {'q': 'пион'})
+        self.assertEqual(list(response.context['products']), [self.tulips])
+
+    def test_migration_indexes_existing_products(self):
+        """Тест: миграция строит индекс для товаров, созданных до него"""
+        from importlib import import_module
+        from django.apps import apps
+        from .models import ProductSearchTerm
+        migration = import_module('catalog.migrations.0010_backfill_search_index')
+        ProductSearchTerm.objects.filter(product=self.tulips).delete()
+        migration.build_search_index(apps, None)
+        response = self.client.get(reverse('catalog:product_list'), {'q': 'тюльпан'})
+        self.assertEqual(list(response.context['products']), [self.tulips])
+
+    def test_raw_save_not_indexed(self):
+        """Тест: при загрузке фикстур индекс не строится по неполным объектам"""
+        from django.core import serializers
+        from .models import ProductSearchTerm
+        data = serializers.serialize('json', [self.tulips])
+        ProductSearchTerm.objects.filter(product=self.tulips).delete()
+        for obj in serializers.deserialize('json', data):
+            obj.save()
+        self.assertFalse(ProductSearchTerm.objects.filter(product=self.tulips).exists())
+
+
+class ProductListCursorTest(CatalogTestMixin, TestCase):
+    @override_settings(CATALOG_CURSOR_PAGINATION=True)
+    def test_cursor_mode(self):
+        """Тест постраничного вывода каталога по курсору"""
+        for i in range(13):
+            Product.objects.create(
+                name=f'Букет {i}', slug=f'bouquet-{i}', description='Букет',
+                price=1000, image='products/b.jpg', category=self.category,
+            )
+        first = self.client.get(reverse('catalog:product_list'))
+        page_obj = first.context['page_obj']
+        self.assertEqual(len(page_obj), 12)
+        second = self.client.get(reverse('catalog:product_list'), {'cursor': page_obj.next_cursor})
+        self.assertEqual(len(second.context['page_obj']), 2)
+        self.assertContains(second, 'Назад')
+
+
+class CategoryProductCountTest(CatalogTestMixin, TestCase):
+    def count(self, category):
+        return Category.objects.get(pk=category.pk).available_product_count
+
+    def test_counter_maintenance(self):
+        """Тест поддержки счетчика при создании, переносе, скрытии и удалении"""
+        self.assertEqual(self.count(self.category), 1)
+        other = Category.objects.create(name='Тюльпаны', slug='tulips')
+
+        product = Product.objects.get(pk=self.product.pk)
+        product.category = other
+        product.save()
+        self.assertEqual(self.count(self.category), 0)
+        self.assertEqual(self.count(other), 1)
+
+        product.is_available = False
+        product.save()
+        self.assertEqual(self.count(other), 0)
+
+        product.is_available = True
+        product.save()
+        product.delete()
+        self.assertEqual(self.count(other), 0)
+
+    def test_category_save_keeps_counter(self):
+        """Тест: сохранение категории не затирает счетчик"""
+        self.category.description = 'Новое описание'
+        self.category.save()
+        self.assertEqual(self.count(self.category), 1)
+
+    def test_recount_command(self):
+        """Тест пересчета счетчиков командой"""
+        from io import StringIO
+        from django.core.management import call_command
+        Category.objects.update(available_product_count=42)
+        call_command('recount_category_products', stdout=StringIO())
+        self.assertEqual(self.count(self.category), 1)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_category_list_queries(self):
+        """Тест: страница категорий не считает товары по каждой категории"""
+        for i in range(5):
+            Category.objects.create(name=f'Категория {i}', slug=f'category-{i}')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('catalog:category_list'))
+        self.assertContains(response, '1 товаров')
+        self.assertFalse(any('COUNT' in query['sql'] for query in queries.captured_queries))
+
+
+class MediaTestMixin(CatalogTestMixin):
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.test import override_settings
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, THUMBNAIL_SYNC=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        super().setUp()
+
+    def upload(self, name='bouquet.jpg', size=(1200, 900)):
+        import io
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (200, 30, 60)).save(buffer, 'JPEG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def save_image(self, product, upload):
+        product.image = upload
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        product.refresh_from_db()
+        return product
+
+
+class ThumbnailTest(MediaTestMixin, TestCase):
+    def test_renditions_generated_on_upload(self):
+        """Тест: после загрузки изображения строятся копии WebP и JPEG"""
+        from django.core.files.storage import default_storage
+        from PIL import Image
+        product = self.save_image(self.product, self.upload())
+        renditions = product.image_renditions
+        self.assertEqual(renditions['source'], product.image.name)
+        with default_storage.open(renditions['card']['webp']) as card:
+            image = Image.open(card)
+            self.assertEqual((image.format, image.size), ('WEBP', (480, 360)))
+        with default_storage.open(renditions['detail']['jpeg']) as detail:
+            self.assertEqual(Image.open(detail).size, (1000, 750))
+
+    def test_same_content_same_files(self):
+        """Тест: имена копий зависят от содержимого, одинаковые изображения не дублируются"""
+        first = self.save_image(self.product, self.upload('a.jpg'))
+        other = Product.objects.create(
+            name='Другой букет', slug='other', description='Букет', price=100,
+            image='products/none.jpg', category=self.category,
+        )
+        second = self.save_image(other, self.upload('b.jpg'))
+        self.assertEqual(first.image_renditions['thumb'], second.image_renditions['thumb'])
+
+    def test_picture_tag(self):
+        """Тест: шаблонный тег выводит копию, а до ее построения - оригинал"""
+        from django.template import Context, Template
+        template = Template("{% load catalog_images %}{% picture product 'card' 'card-img-top' product.name %}")
+        html = template.render(Context({'product': self.product}))
+        self.assertIn(self.product.image.url, html)
+
+        product = self.save_image(self.product, self.upload())
+        html = template.render(Context({'product': product}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(product.image_renditions['card']['jpeg'], html)
+
+    def test_generate_thumbnails_command(self):
+        """Тест: команда строит копии для изображений без них"""
+        from io import StringIO
+        from django.core.files.storage import default_storage
+        from django.core.management import call_command
+        path = default_storage.save('products/existing.jpg', self.upload())
+        Product.objects.filter(pk=self.product.pk).update(image=path)
+        out = StringIO()
+        call_command('generate_thumbnails', stdout=out)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.image_renditions['source'], path)
+        self.assertIn('1', out.getvalue())
+
+    def test_upload_left_for_command(self):
+        """Тест: без THUMBNAIL_SYNC веб-процесс не строит копии и не запускает потоков"""
+        import threading
+        from io import StringIO
+        from django.core.management import call_command
+        from django.test import override_settings
+        from . import thumbnails
+        threads = threading.active_count()
+        with override_settings(THUMBNAIL_SYNC=False):
+            product = self.save_image(self.product, self.upload())
+        self.assertEqual(threading.active_count(), threads)
+        self.assertIsNone(thumbnails._executor)
+        self.assertTrue(thumbnails.needs_renditions(product))
+
+        call_command('generate_thumbnails', stdout=StringIO())
+        product.refresh_from_db()
+        self.assertEqual(product.image_renditions['source'], product.image.name)
+
+    def test_broken_image_skipped(self):
+        """Тест: поврежденное изображение не останавливает команду и не обрабатывается повторно"""
+        from io import StringIO
+        from unittest import mock
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+        from django.core.management import call_command
+        from . import cache as catalog_cache
+        broken = default_storage.save('products/broken.jpg', ContentFile(b'not an image'))
+        Product.objects.filter(pk=self.product.pk).update(image=broken)
+        good = Product.objects.create(
+            name='Другой букет', slug='other', description='Букет', price=100,
+            image=default_storage.save('products/good.jpg', self.upload()), category=self.category,
+        )
+
+        err = StringIO()
+        with mock.patch('catalog.management.commands.generate_thumbnails.bump_catalog_version',
+                        wraps=catalog_cache.bump_catalog_version) as bump:
+            call_command('generate_thumbnails', stdout=StringIO(), stderr=err)
+        self.assertIn('broken.jpg', err.getvalue())
+        self.assertEqual(bump.call_count, 1)
+        good.refresh_from_db()
+        self.assertEqual(good.image_renditions['source'], good.image.name)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.renditions_source, broken)
+        self.assertIn('error', self.product.image_renditions)
+
+        # Повторный запуск ничего не выбирает
+        with self.assertNumQueries(2):
+            call_command('generate_thumbnails', stdout=StringIO())
+
+
+class ContentAddressedStorageTest(MediaTestMixin, TestCase):
+    def test_identical_uploads_stored_once(self):
+        """Тест: одинаковые изображения хранятся одним файлом с именем по содержимому"""
+        import os
+        from django.conf import settings
+        first = self.save_image(self.product, self.upload('first.JPG'))
+        other = Product.objects.create(
+            name='Другой букет', slug='other', description='Букет', price=100,
+            image='products/none.jpg', category=self.category,
+        )
+        second = self.save_image(other, self.upload('second.jpg'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^products/[0-9a-f]{2}/[0-9a-f]{32}\.jpg$')
+        self.assertEqual(len(os.listdir(os.path.dirname(first.image.path))), 1)
+        self.assertTrue(first.image.path.startswith(settings.MEDIA_ROOT))
+
+    def test_hashed_media_served_as_immutable(self):
+        """Тест: файлы с хэшем в имени отдаются с кэшированием на год"""
+        from django.conf import settings
+        from django.core.files.storage import default_storage
+        from django.test import RequestFactory
+        from flower_project.storage import serve_immutable
+        product = self.save_image(self.product, self.upload())
+        request = RequestFactory().get('/media/')
+        response = serve_immutable(request, product.image.name, document_root=settings.MEDIA_ROOT)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+        legacy = default_storage.save('products/roses.jpg', self.upload())
+        response = serve_immutable(request, legacy, document_root=settings.MEDIA_ROOT)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+
+    def test_hashed_name_patterns(self):
+        """Тест: неизменяемыми считаются только имена, которые строят хранилища проекта"""
+        from flower_project.storage import is_hashed_name
+        for path in [
+            'products/ab/' + 'ab' * 16 + '.jpg',
+            'renditions/3f/3f2a1b9c8d7e6f50-card.webp',
+            'css/style.3f2a1b9c8d7e.css',
+        ]:
+            self.assertTrue(is_hashed_name(path), path)
+        for path in [
+            'products/photo-202401011230.jpg',
+            'products/2024-01-01-123456789012.jpg',
+            'products/deadbeefcafe1234.jpg',
+            'css/style.css',
+        ]:
+            self.assertFalse(is_hashed_name(path), path)
+
+    def test_static_url_without_manifest(self):
+        """Тест: без collectstatic статика отдается под исходными именами"""
+        from django.templatetags.static import static
+        self.assertEqual(static('css/style.css'), '/static/css/style.css')
+
+
+
+class ProductCardCacheTest(CatalogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('catalog:product_list')
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_cards_rendered_once(self):
+        """Тест: карточки рендерятся один раз и читаются из кэша одним запросом"""
+        from unittest import mock
+        from . import fragments
+        Product.objects.create(
+            name='Тюльпаны', slug='tulips', description='Букет тюльпанов', price=900,
+            image='products/tulips.jpg', category=self.category,
+        )
+        with mock.patch.object(fragments, 'render_product_card', wraps=fragments.render_product_card) as render:
+            first = self.client.get(self.url)
+            self.assertEqual(render.call_count, 2)
+            with mock.patch.object(fragments.cache, 'get_many', wraps=fragments.cache.get_many) as get_many:
+                second = self.client.get(self.url)
+            self.assertEqual(render.call_count, 2)
+            self.assertEqual(get_many.call_count, 1)
+        self.assertContains(first, 'Тюльпаны')
+        self.assertContains(second, 'Тюльпаны')
+
+    def test_csrf_token_per_visitor(self):
+        """Тест: в закэшированную карточку подставляется CSRF-токен посетителя"""
+        from django.test import Client
+        from .fragments import CSRF_PLACEHOLDER
+        first = self.client.get(self.url)
+        second = Client().get(self.url)
+        for response in (first, second):
+            self.assertNotContains(response, CSRF_PLACEHOLDER)
+            self.assertContains(response, 'name="csrfmiddlewaretoken"')
+        self.assertNotEqual(first.cookies['csrftoken'].value, second.cookies['csrftoken'].value)
+
+    def test_card_invalidated_on_save(self):
+        """Тест: после изменения товара карточка рендерится заново"""
+        self.client.get(self.url)
+        self.product.name = 'Букет из белых роз'
+        self.product.save()
+        self.assertContains(self.client.get(self.url), 'Букет из белых роз')
+
+
+class RecommendationTest(CatalogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tulips = self.create_product('Тюльпаны', 'tulips')
+        self.lilies = self.create_product('Лилии', 'lilies')
+        self.peonies = self.create_product('Пионы', 'peonies')
+        other = Category.objects.create(name='Подарки', slug='gifts')
+        self.card = self.create_product('Открытка', 'postcard', category=other)
+        self.candy = self.create_product('Конфеты', 'candy', category=other)
+
+    def create_product(self, name, slug, category=None):
+        return Product.objects.create(
+            name=name, slug=slug, description=name, price=500,
+            image=f'products/{slug}.jpg', category=category or self.category,
+        )
+
+    def create_order(self, *products, status='new'):
+        from django.utils import timezone
+        from orders.models import Order, OrderItem
+        order = Order.objects.create(
+            customer_name='Покупатель', customer_phone='+79999999999',
+            delivery_address='ул. Цветочная, 1', delivery_time=timezone.now(), status=status,
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, price=product.price) for product in products
+        )
+
+    def test_build_ranks_co_purchases(self):
+        """Тест: сначала товары, купленные вместе чаще, затем товары той же категории"""
+        from .recommendations import build_recommendations, get_related_products
+        self.create_order(self.product, self.card, self.candy)
+        self.create_order(self.product, self.candy)
+        self.create_order(self.product, self.card, status='cancelled')
+        self.create_order(self.product, self.card, status='cancelled')
+        build_recommendations(limit=4)
+
+        related = get_related_products(self.product)
+        self.assertEqual(related[:2], [self.candy, self.card])
+        self.assertEqual(set(related[2:]), {self.peonies, self.lilies})
+        rows = self.product.recommendations.order_by('position')
+        self.assertEqual([row.score for row in rows], [2, 1, 0, 0])
+
+    def test_related_products_single_query(self):
+        """Тест: страница товара читает рекомендации одним запросом"""
+        from django.core.management import call_command
+        from io import StringIO
+        from .recommendations import get_related_products
+        self.create_order(self.product, self.card)
+        call_command('build_recommendations', stdout=StringIO())
+        with self.assertNumQueries(1):
+            related = get_related_products(self.product)
+        self.assertEqual(related[0], self.card)
+        self.assertNotIn(self.product, related)
+
+        response = self.client.get(self.product.get_absolute_url())
+        self.assertEqual(response.context['related_products'][0], self.card)
+
+    def test_fallback_to_category(self):
+        """Тест: без рассчитанных рекомендаций показываются товары той же категории"""
+        from .recommendations import get_related_products
+        related = get_related_products(self.product)
+        self.assertEqual(set(related), {self.tulips, self.lilies, self.peonies})
+
+
+class ConditionalGetTest(CatalogTestMixin, TestCase):
+    def revisit(self, url):
+        # Первый визит выдает CSRF-cookie, от которой зависит ETag
+        self.client.get(url)
+        etag = self.client.get(url)['ETag']
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_pages_not_modified(self):
+        """Тест: повторный запрос неизменившейся страницы каталога - 304"""
+        for url in (
+            reverse('catalog:product_list'),
+            self.product.get_absolute_url(),
+            reverse('catalog:category_list'),
+        ):
+            response = self.revisit(url)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertIn('private', response['Cache-Control'])
+
+    def test_product_change_modifies_pages(self):
+        """Тест: после изменения товара страница отдается заново"""
+        url = reverse('catalog:product_list')
+        etag = self.client.get(url)['ETag']
+        self.product.price = 3000
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_visitor_state_in_etag(self):
+        """Тест: ETag зависит от пользователя и корзины"""
+        from django.contrib.auth.models import User
+        url = self.product.get_absolute_url()
+        anonymous = self.client.get(url)['ETag']
+        self.client.force_login(User.objects.create_user(username='buyer', password='testpass123'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=anonymous).status_code, 200)
+
+        etag = self.client.get(url)['ETag']
+        self.client.post(reverse('orders:cart_add', args=[self.product.id]))
+        list(self.client.get(reverse('orders:cart_detail')).context['messages'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_no_etag_with_pending_messages(self):
+        """Тест: страница с непоказанными сообщениями не подтверждается как прежняя"""
+        url = reverse('catalog:product_list')
+        self.client.post(reverse('orders:cart_add', args=[self.product.id]))
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(len(response.context['messages']), 1)
+
+
+class SharedCacheCheckTest(TestCase):
+    def test_process_local_cache_warned(self):
+        """Тест: check --deploy предупреждает о кэше, не общем для процессов"""
+        from .checks import check_shared_cache
+        self.assertEqual(check_shared_cache(None), [])
+        with override_settings(CACHES=LOCMEM_CACHES):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['catalog.W001'])
@@ -0,0 +1,177 @@
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .cache import bump_catalog_version
+
+logger = logging.getLogger(__name__)
+
+# Размеры копий: (ширина, высота, обрезать до точного размера)
+RENDITIONS = getattr(settings, 'THUMBNAIL_RENDITIONS', {
+    'thumb': (100, 100, True),
+    'card': (480, 360, True),
+    'detail': (1000, 1000, False),
+})
+# Форматы копий и параметры сохранения Pillow
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+RENDITIONS_DIR = 'renditions'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def rendition_name(source_hash, name, fmt):
+    """Имя файла зависит от содержимого оригинала и параметров копии"""
+    width, height, crop = RENDITIONS[name]
+    quality = FORMATS[fmt][1]['quality']
+    spec = f'{source_hash}:{width}x{height}:{int(crop)}:{fmt}:{quality}'
+    digest = hashlib.sha256(spec.encode()).hexdigest()[:16]
+    return f'{RENDITIONS_DIR}/{digest[:2]}/{digest}-{name}.{fmt}'
+
+
+def render(source, renditions):
+    """
+    Строит копии изображения. Выполняется в отдельном процессе,
+    поэтому принимает и возвращает только байты.
+    source - содержимое оригинала,
+    renditions - {путь: (ширина, высота, обрезать, формат)}.
+    Возвращает {путь: содержимое}.
+    """
+    with Image.open(io.BytesIO(source)) as original:
+        original = ImageOps.exif_transpose(original).convert('RGB')
+        results = {}
+        for path, (width, height, crop, fmt) in renditions.items():
+            if crop:
+                image = ImageOps.fit(original, (width, height), Image.Resampling.LANCZOS)
+            else:
+                image = original.copy()
+                image.thumbnail((width, height), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            pil_format, options = FORMATS[fmt]
+            image.save(buffer, pil_format, **options)
+            results[path] = buffer.getvalue()
+    return results
+
+
+def plan_renditions(source):
+    """
+    Пути копий для оригинала и список тех, которых еще нет в хранилище.
+    Возвращает (renditions для поля image_renditions, задания для render()).
+    """
+    source_hash = hashlib.sha256(source).hexdigest()
+    renditions = {}
+    missing = {}
+    for name, (width, height, crop) in RENDITIONS.items():
+        renditions[name] = {}
+        for fmt in FORMATS:
+            path = rendition_name(source_hash, name, fmt)
+            renditions[name][fmt] = path
+            if not default_storage.exists(path):
+                missing[path] = (width, height, crop, fmt)
+    return renditions, missing
+
+
+def read_source(image):
+    with image.open('rb') as source:
+        return source.read()
+
+
+def store_renditions(model, pk, source_name, renditions, files, bump_version=True):
+    """
+    Сохраняет файлы копий и записывает их пути в базу без сигналов save.
+    bump_version=False - версию каталога сбросит вызывающий, один раз на пачку.
+    """
+    for path, content in files.items():
+        if not default_storage.exists(path):
+            default_storage.save(path, ContentFile(content))
+    renditions = dict(renditions, source=source_name)
+    # Если за это время загрузили другое изображение, его копии запишет своя задача
+    updated = model.objects.filter(pk=pk, image=source_name).update(
+        image_renditions=renditions, renditions_source=source_name
+    )
+    if updated and bump_version:
+        # Страницы и карточки с этим изображением теперь выводят копии
+        bump_catalog_version()
+    return renditions
+
+
+def mark_renditions_failed(model, pk, source_name, error):
+    """
+    Отмечает изображение, копии которого построить нельзя (файл поврежден
+    или не читается): выводится оригинал, повторных попыток нет до новой загрузки.
+    """
+    logger.warning('Не удалось построить копии изображения %s: %s', source_name, error)
+    model.objects.filter(pk=pk, image=source_name).update(
+        image_renditions={'source': source_name, 'error': str(error)},
+        renditions_source=source_name,
+    )
+
+
+def generate_renditions(instance):
+    """Синхронно строит копии изображения объекта (товара или категории)"""
+    source = read_source(instance.image)
+    renditions, missing = plan_renditions(source)
+    files = render(source, missing) if missing else {}
+    instance.image_renditions = store_renditions(
+        type(instance), instance.pk, instance.image.name, renditions, files
+    )
+    return instance.image_renditions
+
+
+def get_executor():
+    """
+    Пул процессов для обработки изображений (THUMBNAIL_WORKERS).
+    Используется только командой generate_thumbnails: процессы веб-сервера
+    не порождают дочерних процессов и потоков.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2))
+    return _executor
+
+
+def needs_renditions(instance):
+    return bool(instance.image) and instance.image_renditions.get('source') != instance.image.name
+
+
+def schedule_renditions(instance):
+    """
+    При THUMBNAIL_SYNC строит копии сразу после фиксации транзакции
+    (разработка, тесты). Иначе изображение ждет команду generate_thumbnails
+    (manage.py generate_thumbnails --interval N): по renditions_source она
+    находит изображения без копий, а до тех пор выводится оригинал.
+    """
+    if not getattr(settings, 'THUMBNAIL_SYNC', False):
+        return
+    model, pk, source_name = type(instance), instance.pk, instance.image.name
+
+    def run():
+        try:
+            generate_renditions(model.objects.get(pk=pk, image=source_name))
+        except model.DoesNotExist:
+            pass
+        except (OSError, ValueError) as e:
+            mark_renditions_failed(model, pk, source_name, e)
+
+    transaction.on_commit(run)
+
+
+def rendition_url(instance, name, fmt='jpeg'):
+    """URL копии, а если ее еще нет - оригинала"""
+    path = (instance.image_renditions or {}).get(name, {}).get(fmt) if instance.image else None
+    if path and instance.image_renditions.get('source') == instance.image.name:
+        return default_storage.url(path)
+    return instance.image.url if instance.image else ''
@@ -1,28 +1,57 @@
-from django.shortcuts import render, get_object_or_404
+from django.conf import settings
+from django.core.paginator import Paginator, Page
+from django.http import Http404
+from django.shortcuts import render
+from django.utils.decorators import method_decorator
 from django.views.generic import ListView, DetailView
-from django.db.models import Q
-from .models import Product, Category
+from .models import Product
 from .forms import ProductFilterForm
+from .search import search_products
+from .recommendations import get_related_products
+from . import cache as catalog_cache
+from flower_project.conditional import conditional_page
+from flower_project.pagination import CursorPaginator, InvalidCursor
 
 
+def catalog_version(request, *args, **kwargs):
+    """Версия для ETag страниц каталога: меняется при любом изменении товаров и категорий"""
+    return (catalog_cache.get_catalog_version(),)
+
+
+class CachedCountPaginator(Paginator):
+    """Пагинатор с заранее известным количеством объектов (без COUNT(*))"""
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count = count
+
+
+@method_decorator(conditional_page(catalog_version), name='dispatch')
 class ProductListView(ListView):
     model = Product
     template_name = 'catalog/product_list.html'
     context_object_name = 'products'
     paginate_by = 12
+    cursor_count_limit = 1000
 
     def get_queryset(self):
         queryset = Product.objects.filter(is_available=True).select_related('category')
 
         # Фильтрация по категории
+        self.category = None
         category_slug = self.kwargs.get('category_slug')
         if category_slug:
-            category = get_object_or_404(Category, slug=category_slug, is_active=True)
-            queryset = queryset.filter(category=category)
+            self.category = catalog_cache.get_active_category(category_slug)
+            if self.category is None:
+                raise Http404('Категория не найдена')
+            queryset = queryset.filter(category=self.category)
 
         # Фильтрация через форму
         self.form = ProductFilterForm(self.request.GET)
+        self.filters = {}
         if self.form.is_valid():
+            self.filters = self.form.cleaned_data
+            query = self.form.cleaned_data.get('q')
             category_id = self.form.cleaned_data.get('category')
             price_min = self.form.cleaned_data.get('price_min')
             price_max = self.form.cleaned_data.get('price_max')
@@ -34,21 +63,67 @@ class ProductListView(ListView):
             if price_max:
                 queryset = queryset.filter(price__lte=price_max)
 
+            # Полнотекстовый поиск с сортировкой по релевантности
+            if query:
+                queryset = search_products(queryset, query)
+
         return queryset
 
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Пагинация через кэш каталога: на странице хранятся только id товаров
+        и общее количество, поэтому при попадании в кэш нет ни COUNT(*),
+        ни запроса с OFFSET.
+        """
+        if self.get_cursor_pagination():
+            return self.paginate_by_cursor(queryset, page_size)
+
+        page_number = self.kwargs.get(self.page_kwarg) or self.request.GET.get(self.page_kwarg) or 1
+        key = catalog_cache.product_page_key(self.kwargs.get('category_slug'), self.filters, page_number)
+        cached = catalog_cache.get_product_page(key)
+
+        if cached is None:
+            paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, page_size)
+            catalog_cache.set_product_page(
+                key, [product.id for product in page.object_list], paginator.count, page.number
+            )
+            return paginator, page, page.object_list, is_paginated
+
+        products = queryset.in_bulk(cached['ids'])
+        object_list = [products[pk] for pk in cached['ids'] if pk in products]
+        paginator = CachedCountPaginator(
+            queryset, page_size, cached['count'],
+            orphans=self.get_paginate_orphans(),
+            allow_empty_first_page=self.get_allow_empty(),
+        )
+        page = Page(object_list, cached['number'], paginator)
+        return paginator, page, object_list, page.has_other_pages()
+
+    def get_cursor_pagination(self):
+        """Пагинация по курсору вместо номера страницы (CATALOG_CURSOR_PAGINATION, не для поиска)"""
+        return getattr(settings, 'CATALOG_CURSOR_PAGINATION', False) and not self.filters.get('q')
+
+    def paginate_by_cursor(self, queryset, page_size):
+        paginator = CursorPaginator(queryset, page_size, count_limit=self.cursor_count_limit)
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        return paginator, page, page.object_list, page.has_other_pages()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.filter(is_active=True)
+        context['categories'] = catalog_cache.get_active_categories()
         context['form'] = getattr(self, 'form', ProductFilterForm())
 
         # Текущая категория для breadcrumbs
-        category_slug = self.kwargs.get('category_slug')
-        if category_slug:
-            context['current_category'] = get_object_or_404(Category, slug=category_slug)
+        if getattr(self, 'category', None):
+            context['current_category'] = self.category
 
         return context
 
 
+@method_decorator(conditional_page(catalog_version), name='dispatch')
 class ProductDetailView(DetailView):
     model = Product
     template_name = 'catalog/product_detail.html'
@@ -61,14 +136,12 @@ class ProductDetailView(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Похожие товары из той же категории
-        context['related_products'] = Product.objects.filter(
-            category=self.object.category,
-            is_available=True
-        ).exclude(id=self.object.id)[:4]
+        # Товары, которые покупают вместе с этим, или товары той же категории
+        context['related_products'] = get_related_products(self.object)
         return context
 
 
+@conditional_page(catalog_version)
 def category_list(request):
-    categories = Category.objects.filter(is_active=True)
+    categories = catalog_cache.get_active_categories()
     return render(request, 'catalog/category_list.html', {'categories': categories})
\ No newline at end of file
@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'flower_project.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from bot.webhook import mount_webhook  # noqa: E402
+
+# При заданном TELEGRAM_WEBHOOK_URL обновления бота принимаются здесь же
+application = mount_webhook(django_application)
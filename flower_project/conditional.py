@@ -0,0 +1,59 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+
+def visitor_state(request):
+    """
+    Части страницы, зависящие от посетителя: пользователь в шапке,
+    CSRF-cookie (от него зависит токен в формах) и счетчик корзины.
+    """
+    user = request.user
+    parts = [f'{user.pk}:{user.get_username()}' if user.is_authenticated else '-']
+    parts.append(request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''))
+    cart = getattr(request, 'cart', None)
+    if cart is not None:
+        parts.append(f'{len(cart)}:{cart.get_total_price()}')
+    return parts
+
+
+def page_etag(request, *parts):
+    """
+    ETag страницы из версий данных parts и состояния посетителя.
+    Пока есть непоказанные сообщения, возвращает None: страница
+    с ними показывается один раз и не должна подтверждаться как прежняя.
+    """
+    if len(get_messages(request)):
+        return None
+    source = ':'.join(str(part) for part in (*parts, *visitor_state(request)))
+    return f'"{hashlib.md5(source.encode()).hexdigest()}"'
+
+
+def conditional_page(version_func):
+    """
+    Декоратор представления: ответ 304 на повторный запрос неизменившейся
+    страницы. version_func(request, *args, **kwargs) должна дешево (без
+    запросов или одним агрегатом) вернуть кортеж версий данных страницы
+    или None, если проверить их нельзя - тогда страница рендерится как обычно.
+    Страницы зависят от посетителя, поэтому помечаются private и браузер
+    подтверждает их при каждом открытии.
+    """
+    def etag_func(request, *args, **kwargs):
+        parts = version_func(request, *args, **kwargs)
+        return None if parts is None else page_etag(request, *parts)
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.has_header('ETag'):
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
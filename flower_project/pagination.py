@@ -0,0 +1,149 @@
+import base64
+import json
+from collections.abc import Sequence
+
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class CursorPaginator:
+    """
+    Пагинация по ключу (keyset): страница выбирается условием
+    WHERE (created_at, id) < (:created_at, :id) вместо OFFSET,
+    поэтому N-я страница стоит столько же, сколько первая.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-id'), count_limit=None):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        # Если задан, count считается не дальше этого предела
+        self.count_limit = count_limit
+
+    def _fields(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def encode_cursor(self, obj, reverse=False):
+        values = []
+        for name in self._fields():
+            value = getattr(obj, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        payload = json.dumps({'v': values, 'r': reverse}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padding = '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(cursor + padding).decode())
+            fields = self._fields()
+            if len(payload['v']) != len(fields):
+                raise ValueError
+            values = [
+                self.queryset.model._meta.get_field(name).to_python(value)
+                for name, value in zip(fields, payload['v'])
+            ]
+            return values, bool(payload.get('r'))
+        except Exception:
+            raise InvalidCursor('Неверный курсор')
+
+    def _position_filter(self, values, reverse):
+        """
+        Условие «после позиции» для заданного порядка сортировки:
+        (a > x) OR (a = x AND b > y) ...
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            lookup = f'{name}__lt' if descending else f'{name}__gt'
+            condition |= Q(**equal, **{lookup: value})
+            equal[name] = value
+        return condition
+
+    def page(self, cursor=None):
+        reverse = False
+        queryset = self.queryset
+        if cursor:
+            values, reverse = self.decode_cursor(cursor)
+            queryset = queryset.filter(self._position_filter(values, reverse))
+
+        if reverse:
+            ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+        else:
+            ordering = list(self.ordering)
+
+        rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if reverse:
+            rows.reverse()
+            return CursorPage(rows, self, has_next=True, has_previous=has_more)
+        return CursorPage(rows, self, has_next=has_more, has_previous=bool(cursor))
+
+    def _get_count(self):
+        if not hasattr(self, '_count'):
+            if self.count_limit is None:
+                self._count = self.queryset.count()
+            else:
+                # COUNT по подзапросу с LIMIT: не дороже count_limit строк
+                self._count = self.queryset[:self.count_limit + 1].count()
+        return self._count
+
+    @property
+    def count(self):
+        """Количество объектов (не больше count_limit, если он задан)"""
+        count = self._get_count()
+        if self.count_limit is not None:
+            return min(count, self.count_limit)
+        return count
+
+    @property
+    def count_is_approximate(self):
+        """Реальное количество больше count_limit"""
+        return self.count_limit is not None and self._get_count() > self.count_limit
+
+
+class CursorPage(Sequence):
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<CursorPage ({len(self.object_list)} objects)>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return None
+        return self.paginator.encode_cursor(self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return None
+        return self.paginator.encode_cursor(self.object_list[0], reverse=True)
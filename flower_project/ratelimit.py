@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600}
+
+
+def parse_rate(rate):
+    """'30/m' -> (токенов в секунду, емкость корзины)"""
+    count, period = rate.split('/')
+    count = int(count)
+    return count / PERIODS[period], count
+
+
+def take_token(state, rate, capacity, now):
+    """
+    Один шаг алгоритма token bucket.
+    state - (токены, время обновления) или None для нового ключа.
+    Возвращает (разрешено, новое состояние, секунд до следующего токена).
+    """
+    tokens, updated = state if state is not None else (capacity, now)
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return True, (tokens - 1, now), 0
+    return False, (tokens, now), (1 - tokens) / rate
+
+
+class MemoryRateLimitBackend:
+    """
+    Состояние в памяти процесса (по умолчанию): проверка без обращений
+    к базе и кэшу, но у каждого процесса своя квота.
+    Давно не использованные ключи вытесняются.
+    """
+    max_keys = 10000
+
+    def __init__(self):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, rate, capacity):
+        now = time.monotonic()
+        with self._lock:
+            allowed, state, retry_after = take_token(self._buckets.get(key), rate, capacity, now)
+            if allowed:
+                self._buckets[key] = state
+            if key in self._buckets:
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+
+class CacheRateLimitBackend:
+    """
+    Состояние в кэше Django, общее для процессов. Рассчитан на Redis или
+    Memcached: с DatabaseCache каждая проверка - несколько запросов к базе,
+    которую лимит и должен защищать. Обращение к кэшу синхронное,
+    из асинхронного кода вызывайте через sync_to_async. Чтение и запись
+    не атомарны, поэтому при одновременных запросах лимит соблюдается
+    приблизительно; для защиты от флуда этого достаточно.
+    """
+
+    def hit(self, key, rate, capacity):
+        now = time.time()
+        cache_key = f'ratelimit:{key}'
+        allowed, state, retry_after = take_token(cache.get(cache_key), rate, capacity, now)
+        # Отказ корзину не меняет: токены досчитываются по времени прошлой записи.
+        # Ключ живет, пока корзина не наполнится снова
+        if allowed:
+            cache.set(cache_key, state, int(capacity / rate) + 1)
+        return allowed, retry_after
+
+
+@lru_cache(maxsize=None)
+def get_backend(path):
+    return import_string(path)()
+
+
+def hit(scope, identity):
+    """
+    Расходует токен из корзины scope для identity (чата, пользователя, IP).
+    Лимиты задаются в RATE_LIMITS, например {'cart': '30/m'};
+    scope без лимита не ограничивается.
+    Возвращает (разрешено, секунд до повтора).
+    """
+    rate = getattr(settings, 'RATE_LIMITS', {}).get(scope)
+    if not rate:
+        return True, 0
+    backend = get_backend(getattr(settings, 'RATE_LIMIT_BACKEND', 'flower_project.ratelimit.MemoryRateLimitBackend'))
+    return backend.hit(f'{scope}:{identity}', *parse_rate(rate))
+
+
+def client_address(request):
+    """
+    IP-адрес клиента. За RATE_LIMIT_PROXY_COUNT доверенными прокси он берется
+    из X-Forwarded-For: каждый прокси дописывает адрес справа, поэтому
+    значения левее добавленных ими могут быть подделаны клиентом.
+    """
+    proxies = getattr(settings, 'RATE_LIMIT_PROXY_COUNT', 0)
+    if proxies:
+        forwarded = [
+            address.strip() for address in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if address.strip()
+        ]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def client_identity(request):
+    """
+    Пользователь, а для анонимного посетителя - IP-адрес. Сессия не подходит:
+    до первого изменения корзины ее нет, а без cookie каждый запрос получал бы новую.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    return f'ip:{client_address(request)}'
+
+
+def ratelimit(scope):
+    """Декоратор представления: ответ 429 при превышении лимита scope"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            allowed, retry_after = hit(scope, client_identity(request))
+            if not allowed:
+                response = HttpResponse('Слишком много запросов. Попробуйте позже.', status=429)
+                response['Retry-After'] = str(int(retry_after) + 1)
+                return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
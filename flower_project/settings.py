@@ -3,6 +3,33 @@ from pathlib import Path
 
 TELEGRAM_BOT_TOKEN = 'Токен бота'
 
+# Режим webhook: пустой URL - бот работает через long polling (manage.py bot)
+TELEGRAM_WEBHOOK_URL = ''
+TELEGRAM_WEBHOOK_PATH = '/telegram/webhook/'
+# Обязателен для webhook: им Telegram подписывает запросы
+TELEGRAM_WEBHOOK_SECRET = ''
+# Обновлений, обрабатываемых одновременно (обновления одного чата - по очереди).
+# Webhook должен принимать ровно один ASGI-воркер (uvicorn --workers 1)
+BOT_CONCURRENT_UPDATES = 64
+BOT_ORM_WORKERS = 16  # потоков для запросов к базе из бота
+
+# Очередь уведомлений Telegram (команда dispatch_notifications)
+NOTIFICATION_BATCH_SIZE = 100
+NOTIFICATION_GLOBAL_RATE = 25  # сообщений в секунду на всех
+NOTIFICATION_PER_CHAT_INTERVAL = 1.0  # секунд между сообщениями в один чат
+NOTIFICATION_MAX_ATTEMPTS = 5
+# Уведомления о статусе ждут столько секунд: быстрые смены статуса уходят одним сообщением
+NOTIFICATION_COALESCE_WINDOW = 10
+
+# Как часто бот сохраняет состояние диалогов в базу, секунд
+BOT_PERSISTENCE_INTERVAL = 5
+
+# Сколько секунд хранится статистика заказов (профиль, /stats в боте)
+ORDER_STATS_TIMEOUT = 5 * 60
+
+# Сколько секунд бот отвечает на /status из кэша
+ORDER_STATUS_CACHE_TIMEOUT = 60
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = 'ваш-секретный-ключ'  # Замените в продакшене!
@@ -31,6 +58,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'orders.middleware.CartMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -61,12 +89,59 @@ DATABASES = {
     }
 }
 
+# Кэш должен быть общим для всех процессов (воркеры сайта, manage.py bot,
+# dispatch_notifications): через него расходятся версия каталога, сброс
+# статусов заказов и лимиты запросов. По умолчанию - таблица в базе
+# (python manage.py createcachetable); Redis или Memcached тоже подходят.
+# LocMemCache годится только для одного процесса.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'flower_delivery_cache',
+    }
+}
+
+# Время жизни закэшированных страниц каталога (сбрасываются по версии каталога)
+CATALOG_CACHE_TIMEOUT = 60 * 15
+
+# Уменьшенные копии изображений (catalog.thumbnails)
+# Копии строит отдельный процесс: manage.py generate_thumbnails --interval 10
+THUMBNAIL_WORKERS = 2  # процессов команды generate_thumbnails для обработки изображений
+THUMBNAIL_SYNC = False  # строить копии сразу в процессе, сохранившем изображение (разработка)
+
+# Рекомендаций на товар (manage.py build_recommendations)
+RECOMMENDATIONS_LIMIT = 8
+
+# Ограничение частоты запросов (token bucket): 'N/s', 'N/m' или 'N/h'
+# Лимиты в памяти процесса; общий для процессов CacheRateLimitBackend -
+# только с Redis или Memcached (с DatabaseCache проверка нагружает базу)
+RATE_LIMIT_BACKEND = 'flower_project.ratelimit.MemoryRateLimitBackend'
+# Число доверенных прокси перед сайтом (nginx - 1): адрес клиента берется из X-Forwarded-For
+RATE_LIMIT_PROXY_COUNT = 0
+RATE_LIMITS = {
+    'cart': '60/m',  # изменения корзины одним пользователем или с одного IP
+    'bot': '20/m',  # сообщения боту из одного чата
+    'bot-warning': '1/m',  # предупреждения о превышении лимита
+}
+
+# Хранилище корзины: SessionCartStore, DatabaseCartStore или MemoryCartStore
+CART_STORE = 'orders.cart_storage.DatabaseCartStore'
+
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Статика с хэшем в именах (после collectstatic), изображения товаров
+# и категорий - с именами по содержимому; такие URL кэшируются на год
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'uploads': {'BACKEND': 'flower_project.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'flower_project.storage.ManifestStaticStorage'},
+}
+
 LOGIN_REDIRECT_URL = 'profile'
 LOGIN_URL = 'login'
 LOGOUT_REDIRECT_URL = 'logout'
@@ -0,0 +1,95 @@
+import hashlib
+import logging
+import os
+import posixpath
+import re
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, storages
+from django.views.static import serve
+
+logger = logging.getLogger(__name__)
+
+# Год - столько браузеры и прокси хранят файлы с хэшем в имени
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+# Имена с хэшем содержимого (проверяется только имя файла, без каталога):
+# ContentAddressedStorage - products/ab/<32 hex>.jpg,
+# копии catalog.thumbnails - renditions/ab/<16 hex>-card.webp,
+# ManifestStaticFilesStorage - css/style.<12 hex>.css.
+# Прочие имена (photo-202401011230.jpg) могут перезаписываться и не кэшируются навсегда
+HASHED_NAME_RE = re.compile(
+    r'^(?:[0-9a-f]{32}\.\w+|[0-9a-f]{16}-[a-z]+\.\w+|.+\.[0-9a-f]{12}\.\w+)$'
+)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище загрузок с именами по содержимому.
+
+    Файл сохраняется как <каталог>/<2 символа хэша>/<sha256>.<расширение>,
+    поэтому один и тот же снимок, загруженный дважды, хранится один раз,
+    а содержимое по URL никогда не меняется и кэшируется навсегда.
+    Файлы могут использоваться несколькими записями, поэтому не удаляются.
+    """
+    hash_length = 32
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()[:self.hash_length]
+        directory = posixpath.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+
+class ManifestStaticStorage(ManifestStaticFilesStorage):
+    """
+    Статика с хэшем содержимого в именах (после collectstatic).
+    Пока манифеста нет (разработка, тесты), отдаются исходные имена.
+    """
+    manifest_strict = False
+
+    def url(self, name, force=False):
+        try:
+            return super().url(name, force)
+        except ValueError:
+            logger.debug('Нет хэшированного имени для %s, нужен collectstatic', name)
+            return FileSystemStorage.url(self, name)
+
+
+def get_upload_storage():
+    """Хранилище изображений товаров и категорий (STORAGES['uploads'])"""
+    return storages['uploads']
+
+
+def is_hashed_name(path):
+    return bool(HASHED_NAME_RE.search(posixpath.basename(path)))
+
+
+def serve_immutable(request, path, document_root=None, show_indexes=False):
+    """
+    django.views.static.serve с заголовками кэширования: файлы с хэшем
+    в имени помечаются неизменяемыми на год, остальные браузер перепроверяет.
+    Подключается только при DEBUG; в production те же заголовки
+    выставляет веб-сервер (пример для nginx - в README).
+    """
+    response = serve(request, path, document_root=document_root, show_indexes=show_indexes)
+    if response.status_code in (200, 304) and is_hashed_name(path):
+        response['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response['Cache-Control'] = 'no-cache'
+    return response
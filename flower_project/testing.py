@@ -0,0 +1,2 @@
+# Для проверок числа запросов: кэш в базе (DatabaseCache) добавил бы свои запросы
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
@@ -1,6 +1,7 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.utils.html import format_html
-from .models import Order, OrderItem
+from .models import Order, OrderItem, OrderStatusChange
+from .transitions import bulk_transition
 
 
 class OrderItemInline(admin.TabularInline):
@@ -15,6 +16,17 @@ class OrderItemInline(admin.TabularInline):
     get_cost.short_description = 'Стоимость'
 
 
+class OrderStatusChangeInline(admin.TabularInline):
+    model = OrderStatusChange
+    extra = 0
+    can_delete = False
+    readonly_fields = ['old_status', 'new_status', 'changed_by', 'created_at']
+    fields = ['old_status', 'new_status', 'changed_by', 'created_at']
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = [
@@ -29,7 +41,7 @@ class OrderAdmin(admin.ModelAdmin):
     list_filter = ['status', 'payment_method', 'created_at']
     search_fields = ['customer_name', 'customer_phone', 'delivery_address']
     readonly_fields = ['created_at', 'updated_at', 'total_price', 'status_timeline']
-    inlines = [OrderItemInline]
+    inlines = [OrderItemInline, OrderStatusChangeInline]
     fieldsets = (
         ('Основная информация', {
             'fields': ('user', 'session_key', 'status', 'total_price', 'created_at', 'updated_at')
@@ -89,28 +101,41 @@ class OrderAdmin(admin.ModelAdmin):
 
     status_timeline.short_description = 'Временная шкала статусов'
 
+    def transition(self, request, queryset, status):
+        """Массовая смена статуса с проверкой допустимости переходов"""
+        result = bulk_transition(queryset, status, changed_by=request.user)
+        if result.changed:
+            self.message_user(request, f'Статус изменен у заказов: {len(result.changed)}', messages.SUCCESS)
+        if result.rejected:
+            rejected = ', '.join(f'#{order.id}' for order, _ in result.rejected[:20])
+            self.message_user(
+                request,
+                f'Недопустимый переход статуса для заказов: {len(result.rejected)} ({rejected})',
+                messages.WARNING
+            )
+
     def mark_confirmed(self, request, queryset):
-        queryset.update(status='confirmed')
+        self.transition(request, queryset, 'confirmed')
 
     mark_confirmed.short_description = "Перевести в статус 'Подтвержден'"
 
     def mark_processing(self, request, queryset):
-        queryset.update(status='processing')
+        self.transition(request, queryset, 'processing')
 
     mark_processing.short_description = "Перевести в статус 'Обработан'"
 
     def mark_in_progress(self, request, queryset):
-        queryset.update(status='in_progress')
+        self.transition(request, queryset, 'in_progress')
 
     mark_in_progress.short_description = "Перевести в статус 'Доставляется'"
 
     def mark_delivered(self, request, queryset):
-        queryset.update(status='delivered')
+        self.transition(request, queryset, 'delivered')
 
     mark_delivered.short_description = "Перевести в статус 'Доставлен'"
 
     def mark_cancelled(self, request, queryset):
-        queryset.update(status='cancelled')
+        self.transition(request, queryset, 'cancelled')
 
     mark_cancelled.short_description = "Перевести в статус 'Отменен'"
 
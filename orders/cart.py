@@ -1,5 +1,27 @@
-from decimal import Decimal
+from dataclasses import dataclass, field
+
 from catalog.models import Product
+from .cart_storage import from_kopecks, get_cart_store, to_kopecks
+
+# Наибольшее количество одного товара в корзине
+MAX_QUANTITY = 999
+
+# Поля товара, которые нужны корзине и оформлению заказа
+SNAPSHOT_FIELDS = (
+    'id', 'name', 'slug', 'price', 'image', 'image_renditions', 'is_available',
+    'category__id', 'category__name', 'category__slug', 'category__is_active',
+)
+
+
+@dataclass
+class CartChanges:
+    # Список (product, старая цена, новая цена)
+    repriced: list = field(default_factory=list)
+    # Товары, которые больше нельзя заказать
+    removed: list = field(default_factory=list)
+
+    def __bool__(self):
+        return bool(self.repriced or self.removed)
 
 
 class Cart:
@@ -8,96 +30,171 @@ class Cart:
         Инициализация корзины
         """
         self.request = request
-        self.session = request.session
-        cart = self.session.get('cart')
-        if not cart:
-            cart = self.session['cart'] = {}
-        self.cart = cart
+        self.store = get_cart_store(request)
+        # {id товара: (цена в копейках, количество)}
+        self.cart = self.store.load()
+        self._products = {}
+        self._reset()
+
+    def _reset(self):
+        """Сбрасывает вычисленные значения после изменения корзины"""
+        self._lines = None
+        self._total_price = None
+        self._count = None
+        self._changes = None
 
     def add(self, product, quantity=1, update_quantity=False):
         """
-        Добавить продукт в корзину или обновить его количество
+        Добавить продукт в корзину или обновить его количество.
+        Количество ограничивается MAX_QUANTITY, позиция без количества удаляется.
         """
-        product_id = str(product.id)
-        if product_id not in self.cart:
-            self.cart[product_id] = {
-                'quantity': 0,
-                'price': str(product.price)
-            }
-
-        if update_quantity:
-            self.cart[product_id]['quantity'] = quantity
+        price, current = self.cart.get(product.id, (to_kopecks(product.price), 0))
+        quantity = min(quantity if update_quantity else current + quantity, MAX_QUANTITY)
+        if quantity > 0:
+            self.cart[product.id] = (price, quantity)
         else:
-            self.cart[product_id]['quantity'] += quantity
+            self.cart.pop(product.id, None)
+        self.save()
 
+    def merge(self, lines):
+        """
+        Добавляет позиции другой корзины {id товара: (цена в копейках, количество)}.
+        Количества складываются, цена берется из добавляемой корзины.
+        """
+        for product_id, (price, quantity) in lines.items():
+            _, current = self.cart.get(product_id, (price, 0))
+            quantity = min(current + quantity, MAX_QUANTITY)
+            if quantity > 0:
+                self.cart[product_id] = (price, quantity)
         self.save()
 
     def save(self):
         """
-        Сохранить корзину в сессии
+        Сохранить корзину в хранилище
         """
-        self.session['cart'] = self.cart
-        self.session.modified = True
+        self.store.save(self.cart)
+        self._reset()
 
     def remove(self, product):
         """
         Удалить продукт из корзины
         """
-        product_id = str(product.id)
-        if product_id in self.cart:
-            del self.cart[product_id]
+        if product.id in self.cart:
+            del self.cart[product.id]
             self.save()
 
+    def get_lines(self):
+        """
+        Разобранные позиции корзины: {id товара: (цена, количество)}.
+        Цены переводятся в Decimal один раз.
+        """
+        if self._lines is None:
+            self._lines = {
+                product_id: (from_kopecks(price), quantity)
+                for product_id, (price, quantity) in self.cart.items()
+            }
+        return self._lines
+
+    def get_products(self):
+        """
+        Снимок товаров корзины: один запрос с категориями
+        и только нужными полями, не больше раза за запрос.
+        """
+        missing = [product_id for product_id in self.cart if product_id not in self._products]
+        if missing:
+            snapshot = (
+                Product.objects
+                .filter(id__in=missing)
+                .select_related('category')
+                .only(*SNAPSHOT_FIELDS)
+            )
+            self._products.update((product.id, product) for product in snapshot)
+        return self._products
+
+    def revalidate(self):
+        """
+        Сверяет корзину с каталогом: устаревшие цены заменяются текущими,
+        недоступные и удаленные товары убираются.
+        Возвращает CartChanges; корзина сохраняется, только если что-то изменилось.
+        """
+        if self._changes is not None:
+            return self._changes
+
+        products = self.get_products()
+        changes = CartChanges()
+        for product_id, (price, quantity) in list(self.cart.items()):
+            product = products.get(product_id)
+            if product is None or not product.is_available or not product.category.is_active:
+                del self.cart[product_id]
+                if product is not None:
+                    changes.removed.append(product)
+                continue
+            current_price = to_kopecks(product.price)
+            if current_price != price:
+                self.cart[product_id] = (current_price, quantity)
+                changes.repriced.append((product, from_kopecks(price), from_kopecks(current_price)))
+
+        if changes:
+            self.save()
+        self._changes = changes
+        return changes
+
     def __iter__(self):
         """
         Перебор элементов в корзине и получение продуктов из базы данных
         """
-        product_ids = self.cart.keys()
-        products = Product.objects.filter(id__in=product_ids)
-        cart = self.cart.copy()
-
-        for product in products:
-            cart[str(product.id)]['product'] = product
-
-        for item in cart.values():
-            item['price'] = Decimal(item['price'])
-            item['total_price'] = item['price'] * item['quantity']
-            yield item
+        products = self.get_products()
+        for product_id, (price, quantity) in self.get_lines().items():
+            product = products.get(product_id)
+            if product is None:
+                continue
+            yield {
+                'product': product,
+                'quantity': quantity,
+                'price': price,
+                'total_price': price * quantity,
+            }
 
     def __len__(self):
         """
         Подсчет всех товаров в корзине
         """
-        return sum(item['quantity'] for item in self.cart.values())
+        if self._count is None:
+            self._count = sum(quantity for _, quantity in self.cart.values())
+        return self._count
 
     def get_total_price(self):
         """
         Подсчет стоимости товаров в корзине
         """
-        return sum(Decimal(item['price']) * item['quantity'] for item in self.cart.values())
+        if self._total_price is None:
+            self._total_price = from_kopecks(
+                sum(price * quantity for price, quantity in self.cart.values())
+            )
+        return self._total_price
 
     def clear(self):
         """
         Очистка корзины
         """
-        del self.session['cart']
-        self.session.modified = True
+        self.store.clear()
+        self.cart = {}
+        self._reset()
 
     def get_cart_items(self):
         """
         Получить элементы корзины с объектами продуктов
         """
-        product_ids = self.cart.keys()
-        products = Product.objects.filter(id__in=product_ids)
+        return list(self)
 
-        cart_items = []
-        for product in products:
-            product_id = str(product.id)
-            cart_items.append({
-                'product': product,
-                'quantity': self.cart[product_id]['quantity'],
-                'price': Decimal(self.cart[product_id]['price']),
-                'total_price': Decimal(self.cart[product_id]['price']) * self.cart[product_id]['quantity']
-            })
 
-        return cart_items
\ No newline at end of file
+def get_cart(request):
+    """
+    Корзина текущего запроса.
+    CartMiddleware создает ее один раз на запрос; без middleware
+    корзина создается и запоминается при первом обращении.
+    """
+    cart = getattr(request, 'cart', None)
+    if cart is None:
+        cart = request.cart = Cart(request)
+    return cart
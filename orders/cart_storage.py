@@ -0,0 +1,279 @@
+import base64
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import timedelta
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+# Формат: версия, число позиций n, затем n id товаров (int64),
+# n цен в копейках (int64) и n количеств (uint32), little-endian.
+# Столбцы хранятся массивами array и читаются без разбора JSON
+PACK_VERSION = 1
+HEADER = struct.Struct('<BI')
+# Наибольшее количество, которое помещается в uint32
+MAX_PACKED_QUANTITY = 2 ** 32 - 1
+
+DEFAULT_CART_STORE = 'orders.cart_storage.SessionCartStore'
+CART_SESSION_KEY = 'cart'
+
+
+def to_kopecks(price):
+    return int((Decimal(price) * 100).to_integral_value())
+
+
+def from_kopecks(kopecks):
+    return (Decimal(kopecks) / 100).quantize(Decimal('0.01'))
+
+
+def _to_little_endian(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def pack_lines(lines):
+    """
+    Упаковывает позиции корзины {id товара: (цена в копейках, количество)}
+    в компактную бинарную строку. Позиции без количества не сохраняются.
+    """
+    lines = {
+        product_id: (price, min(quantity, MAX_PACKED_QUANTITY))
+        for product_id, (price, quantity) in lines.items()
+        if quantity > 0
+    }
+    ids = array('q', lines.keys())
+    prices = array('q', (price for price, _ in lines.values()))
+    quantities = array('I', (quantity for _, quantity in lines.values()))
+    return HEADER.pack(PACK_VERSION, len(ids)) + b''.join(
+        _to_little_endian(values).tobytes() for values in (ids, prices, quantities)
+    )
+
+
+def unpack_lines(data):
+    """Обратное преобразование pack_lines. Поврежденные данные дают пустую корзину"""
+    if not data:
+        return {}
+    data = bytes(data)
+    try:
+        version, count = HEADER.unpack_from(data)
+    except struct.error:
+        return {}
+    columns = [array('q'), array('q'), array('I')]
+    offset = HEADER.size
+    for values in columns:
+        size = values.itemsize * count
+        chunk = data[offset:offset + size]
+        if version != PACK_VERSION or len(chunk) != size:
+            return {}
+        values.frombytes(chunk)
+        _to_little_endian(values)
+        offset += size
+    ids, prices, quantities = columns
+    return {product_id: (price, quantity) for product_id, price, quantity in zip(ids, prices, quantities)}
+
+
+def load_session_lines(session):
+    """Позиции корзины из сессии: упакованные или в старом формате"""
+    data = session.get(CART_SESSION_KEY)
+    if isinstance(data, dict):
+        # Старый формат {id: {'quantity', 'price'}}
+        return {
+            int(product_id): (to_kopecks(item['price']), item['quantity'])
+            for product_id, item in data.items()
+        }
+    if not data:
+        return {}
+    try:
+        return unpack_lines(base64.b64decode(data))
+    except ValueError:
+        return {}
+
+
+class CartStore:
+    """
+    Хранилище корзины. Работает с упакованным представлением:
+    load() возвращает {id товара: (цена в копейках, количество)},
+    save() записывает его целиком.
+    """
+
+    # Корзина хранится отдельно для каждого пользователя и переживает выход из аккаунта
+    per_user = True
+
+    def __init__(self, request, owner_key=None):
+        self.request = request
+        self._owner_key = owner_key
+
+    def owner_key(self, create=False):
+        """
+        Владелец корзины: пользователь или сессия гостя.
+        При create=True гостю при необходимости создается сессия.
+        """
+        if self._owner_key is not None:
+            return self._owner_key
+        user = getattr(self.request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f'user:{user.pk}'
+        session = self.request.session
+        if session.session_key is None:
+            if not create:
+                return None
+            session.save()
+            # Без этого SessionMiddleware не отправит cookie новой сессии
+            session.modified = True
+        return f'session:{session.session_key}'
+
+    def load(self):
+        raise NotImplementedError
+
+    def save(self, lines):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class SessionCartStore(CartStore):
+    """Корзина внутри сессии в упакованном виде"""
+    # При входе данные сессии сохраняются, поэтому корзина гостя переходит сама
+    per_user = False
+
+    def load(self):
+        return load_session_lines(self.request.session)
+
+    def save(self, lines):
+        self.request.session[CART_SESSION_KEY] = base64.b64encode(pack_lines(lines)).decode()
+
+    def clear(self):
+        self.request.session.pop(CART_SESSION_KEY, None)
+
+
+class DatabaseCartStore(CartStore):
+    """
+    Корзина в отдельной таблице CartRecord: изменение корзины
+    обновляет одну короткую строку, а не всю сессию.
+    Корзина, оставшаяся в сессии от SessionCartStore, переносится
+    в таблицу при первом чтении.
+    """
+
+    def _owner(self, key):
+        kind, value = key.split(':', 1)
+        return {'user_id': value} if kind == 'user' else {'session_key': value}
+
+    def _records(self, key):
+        from .models import CartRecord
+
+        return CartRecord.objects.filter(**self._owner(key))
+
+    def load(self):
+        key = self.owner_key()
+        if key is None:
+            return {}
+        data = self._records(key).values_list('data', flat=True).first()
+        if data is None:
+            return self._migrate_session_cart()
+        return unpack_lines(data)
+
+    def _migrate_session_cart(self):
+        session = getattr(self.request, 'session', None)
+        if session is None or CART_SESSION_KEY not in session:
+            return {}
+        lines = load_session_lines(session)
+        del session[CART_SESSION_KEY]
+        if lines:
+            self.save(lines)
+        return lines
+
+    def save(self, lines):
+        from .models import CartRecord
+
+        key = self.owner_key(create=True)
+        data = pack_lines(lines)
+        if self._records(key).update(data=data, updated_at=timezone.now()):
+            return
+        try:
+            with transaction.atomic():
+                CartRecord.objects.create(data=data, **self._owner(key))
+        except IntegrityError:
+            # Параллельный запрос того же владельца успел создать строку
+            self._records(key).update(data=data, updated_at=timezone.now())
+
+    def clear(self):
+        key = self.owner_key()
+        if key is not None:
+            self._records(key).delete()
+
+
+def delete_orphaned_carts():
+    """
+    Удаляет корзины гостей, сессии которых закончились.
+    При сессиях не в базе - корзины, не менявшиеся дольше SESSION_COOKIE_AGE.
+    Возвращает число удаленных корзин.
+    """
+    from .models import CartRecord
+
+    guest_carts = CartRecord.objects.filter(user__isnull=True)
+    if settings.SESSION_ENGINE in ('django.contrib.sessions.backends.db', 'django.contrib.sessions.backends.cached_db'):
+        from django.contrib.sessions.models import Session
+
+        active = Session.objects.filter(expire_date__gt=timezone.now()).values('session_key')
+        orphaned = guest_carts.exclude(session_key__in=active)
+    else:
+        cutoff = timezone.now() - timedelta(seconds=settings.SESSION_COOKIE_AGE)
+        orphaned = guest_carts.filter(updated_at__lt=cutoff)
+    deleted, _ = orphaned.delete()
+    return deleted
+
+
+class MemoryCartStore(CartStore):
+    """
+    Корзины в памяти процесса с вытеснением давно не использованных (LRU).
+    Подходит для тестов и разработки.
+    """
+    max_size = getattr(settings, 'CART_MEMORY_STORE_SIZE', 1000)
+    _carts = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._carts.clear()
+
+    def load(self):
+        key = self.owner_key()
+        with self._lock:
+            data = self._carts.get(key)
+            if data is not None:
+                self._carts.move_to_end(key)
+        return unpack_lines(data)
+
+    def save(self, lines):
+        key = self.owner_key(create=True)
+        with self._lock:
+            self._carts[key] = pack_lines(lines)
+            self._carts.move_to_end(key)
+            while len(self._carts) > self.max_size:
+                self._carts.popitem(last=False)
+
+    def clear(self):
+        key = self.owner_key()
+        with self._lock:
+            self._carts.pop(key, None)
+
+
+@lru_cache(maxsize=None)
+def _store_class(path):
+    return import_string(path)
+
+
+def get_cart_store(request):
+    """Хранилище корзины, заданное настройкой CART_STORE"""
+    path = getattr(settings, 'CART_STORE', DEFAULT_CART_STORE)
+    return _store_class(path)(request)
@@ -0,0 +1,26 @@
+from django.db import transaction
+
+from .models import OrderItem
+
+
+def place_order(order, lines):
+    """
+    Сохраняет заказ вместе с позициями.
+    lines - словари с ключами product, price, quantity (например, элементы корзины).
+
+    Сумма считается в памяти, поэтому заказ записывается ровно один раз,
+    а все позиции вставляются одним INSERT.
+    """
+    items = [
+        OrderItem(product=line['product'], price=line['price'], quantity=line['quantity'])
+        for line in lines
+    ]
+    order.total_price = sum((item.get_cost() for item in items), 0)
+
+    with transaction.atomic():
+        order.save()
+        for item in items:
+            item.order = order
+        OrderItem.objects.bulk_create(items)
+
+    return order
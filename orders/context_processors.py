@@ -1,7 +1,8 @@
-from .cart import Cart
+from .cart import get_cart
 
 def cart(request):
+    cart = get_cart(request)
     return {
-        'cart_total_items': len(Cart(request)),
-        'cart_total_price': Cart(request).get_total_price()
-    }
\ No newline at end of file
+        'cart_total_items': len(cart),
+        'cart_total_price': cart.get_total_price()
+    }
@@ -0,0 +1,47 @@
+from .cart import Cart
+from .cart_storage import get_cart_store
+from .models import Order
+from .stats import invalidate_order_stats
+
+
+def get_guest_session_key(request):
+    """
+    Ключ сессии гостя. Нужно запомнить до входа:
+    login() меняет ключ сессии.
+    """
+    if request.user.is_authenticated:
+        return None
+    return request.session.session_key
+
+
+def merge_guest_cart(request, session_key):
+    """Переносит корзину гостя в корзину вошедшего пользователя"""
+    store = get_cart_store(request)
+    if session_key and store.per_user:
+        guest_store = type(store)(request, owner_key=f'session:{session_key}')
+        guest_lines = guest_store.load()
+        if guest_lines:
+            Cart(request).merge(guest_lines)
+            guest_store.clear()
+    # Корзина запроса могла быть создана еще для гостя
+    request.cart = Cart(request)
+    return request.cart
+
+
+def claim_guest_orders(user, session_key):
+    """
+    Привязывает заказы, оформленные гостем в этой сессии, к пользователю.
+    Один UPDATE по индексу session_key; возвращает число заказов.
+    """
+    if not session_key:
+        return 0
+    claimed = Order.objects.filter(session_key=session_key, user__isnull=True).update(user=user)
+    if claimed:
+        invalidate_order_stats(user_id=user.pk)
+    return claimed
+
+
+def adopt_guest_data(request, session_key):
+    """Переносит корзину и заказы гостя после входа или регистрации"""
+    merge_guest_cart(request, session_key)
+    return claim_guest_orders(request.user, session_key)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from orders.cart_storage import delete_orphaned_carts
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет корзины гостей с закончившимися сессиями (DatabaseCartStore). '
+        'Запускается периодически вместе с clearsessions'
+    )
+
+    def handle(self, *args, **options):
+        deleted = delete_orphaned_carts()
+        self.stdout.write(self.style.SUCCESS(f'Удалено корзин: {deleted}'))
@@ -0,0 +1,16 @@
+from django.utils.functional import SimpleLazyObject
+from .cart import Cart
+
+
+class CartMiddleware:
+    """
+    Добавляет request.cart - корзину, общую для представлений
+    и контекстного процессора. Создается при первом обращении.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.cart = SimpleLazyObject(lambda: Cart(request))
+        return self.get_response(request)
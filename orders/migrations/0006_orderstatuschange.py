@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_order_orders_orde_user_id_37fed6_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStatusChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('old_status', models.CharField(blank=True, choices=[('new', '🆕 Новый'), ('confirmed', '✅ Подтвержден'), ('processing', '🔧 Обработан'), ('in_progress', '🚚 Доставляется'), ('delivered', '📦 Доставлен'), ('cancelled', '❌ Отменен')], max_length=20, null=True, verbose_name='Предыдущий статус')),
+                ('new_status', models.CharField(choices=[('new', '🆕 Новый'), ('confirmed', '✅ Подтвержден'), ('processing', '🔧 Обработан'), ('in_progress', '🚚 Доставляется'), ('delivered', '📦 Доставлен'), ('cancelled', '❌ Отменен')], max_length=20, verbose_name='Новый статус')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата изменения')),
+                ('changed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Кем изменен')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_changes', to='orders.order', verbose_name='Заказ')),
+            ],
+            options={
+                'verbose_name': 'Смена статуса',
+                'verbose_name_plural': 'История статусов',
+                'ordering': ['created_at', 'id'],
+            },
+        ),
+    ]
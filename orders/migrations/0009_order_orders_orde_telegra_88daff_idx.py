@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_order_orders_orde_session_ad3c0d_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['telegram_chat_id', 'created_at'], name='orders_orde_telegra_88daff_idx'),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from catalog.models import Product
 from django.core.validators import MinValueValidator
@@ -6,6 +8,25 @@ from django.utils import timezone
 from django.urls import reverse
 
 
+class OrderQuerySet(models.QuerySet):
+    def with_items_count(self):
+        """Добавляет items_count - общее количество товаров в заказе"""
+        return self.annotate(items_count=Coalesce(Sum('items__quantity'), 0))
+
+    def with_items(self):
+        """Подгружает позиции заказа вместе с товарами и категориями"""
+        return self.prefetch_related('items__product__category')
+
+    def update_status(self, status, changed_by=None):
+        """
+        Массово переводит заказы в статус status.
+        Возвращает количество измененных заказов.
+        """
+        from .transitions import bulk_transition
+
+        return len(bulk_transition(self, status, changed_by=changed_by).changed)
+
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('new', '🆕 Новый'),
@@ -16,6 +37,10 @@ class Order(models.Model):
         ('cancelled', '❌ Отменен'),
     ]
 
+    # Порядок выполнения заказа и статусы, из которых заказ можно отменить
+    STATUS_FLOW = ['new', 'confirmed', 'processing', 'in_progress', 'delivered']
+    CANCELLABLE_STATUSES = ['new', 'confirmed', 'processing']
+
     PAYMENT_CHOICES = [
         ('cash', '💵 Наличные при получении'),
         ('card', '💳 Онлайн оплата картой'),
@@ -74,6 +99,8 @@ class Order(models.Model):
         verbose_name='ID чата Telegram для уведомлений'
     )
 
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
@@ -82,11 +109,22 @@ class Order(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['created_at']),
             models.Index(fields=['user']),
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['session_key']),
+            models.Index(fields=['telegram_chat_id', 'created_at']),
         ]
 
     def __str__(self):
         return f"Заказ #{self.id} - {self.customer_name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Статус при загрузке - чтобы отличать реальную смену статуса от пересохранения
+        if 'status' not in instance.get_deferred_fields():
+            instance._loaded_status = instance.status
+        return instance
+
     def get_absolute_url(self):
         return reverse('orders:order_detail', kwargs={'order_id': self.id})
 
@@ -111,7 +149,7 @@ class Order(models.Model):
     def get_status_timeline(self):
         """Возвращает временную шкалу статусов"""
         timeline = []
-        status_flow = ['new', 'confirmed', 'processing', 'in_progress', 'delivered']
+        status_flow = self.STATUS_FLOW
 
         for status in status_flow:
             timeline.append({
@@ -126,11 +164,17 @@ class Order(models.Model):
 
     def can_be_cancelled(self):
         """Можно ли отменить заказ"""
-        return self.status in ['new', 'confirmed', 'processing']
+        return self.status in self.CANCELLABLE_STATUSES
 
     def get_items_count(self):
         """Возвращает общее количество товаров в заказе"""
-        return sum(item.quantity for item in self.items.all())
+        # Значение из with_items_count()
+        if hasattr(self, 'items_count'):
+            return self.items_count
+        # Позиции, подгруженные через with_items()
+        if 'items' in getattr(self, '_prefetched_objects_cache', {}):
+            return sum(item.quantity for item in self.items.all())
+        return self.items.aggregate(count=Coalesce(Sum('quantity'), 0))['count']
 
 
 class OrderItem(models.Model):
@@ -164,4 +208,74 @@ class OrderItem(models.Model):
 
     def get_cost(self):
         """Возвращает общую стоимость позиции"""
-        return self.price * self.quantity
\ No newline at end of file
+        return self.price * self.quantity
+
+
+class OrderStatusChange(models.Model):
+    """История смены статусов заказа"""
+    order = models.ForeignKey(
+        Order,
+        related_name='status_changes',
+        on_delete=models.CASCADE,
+        verbose_name='Заказ'
+    )
+    old_status = models.CharField(
+        max_length=20,
+        choices=Order.STATUS_CHOICES,
+        null=True,
+        blank=True,
+        verbose_name='Предыдущий статус'
+    )
+    new_status = models.CharField(
+        max_length=20,
+        choices=Order.STATUS_CHOICES,
+        verbose_name='Новый статус'
+    )
+    changed_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name='Кем изменен'
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата изменения')
+
+    class Meta:
+        verbose_name = 'Смена статуса'
+        verbose_name_plural = 'История статусов'
+        ordering = ['created_at', 'id']
+
+    def __str__(self):
+        return f"Заказ #{self.order_id}: {self.old_status} -> {self.new_status}"
+
+
+class CartRecord(models.Model):
+    """
+    Корзина в упакованном виде (см. orders.cart_storage).
+    Принадлежит пользователю или сессии гостя.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='cart_record',
+        verbose_name='Пользователь'
+    )
+    session_key = models.CharField(
+        max_length=40,
+        unique=True,
+        null=True,
+        blank=True,
+        verbose_name='Ключ сессии'
+    )
+    data = models.BinaryField(default=b'', verbose_name='Позиции')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+
+    class Meta:
+        verbose_name = 'Корзина'
+        verbose_name_plural = 'Корзины'
+
+    def __str__(self):
+        owner = f"пользователь #{self.user_id}" if self.user_id else f"сессия {self.session_key}"
+        return f"Корзина ({owner})"
@@ -1,37 +1,98 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from asgiref.sync import async_to_sync
-from .models import Order
-from django.conf import settings
-from telegram import Bot
-import asyncio
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver, Signal
+from .models import Order, OrderStatusChange
+from .stats import invalidate_order_stats
+from bot.notifications import enqueue_status_notification, enqueue_status_notifications
+from bot.status import invalidate_order_status
+
+# Отправляется только при реальной смене статуса заказа, в том числе
+# для каждого заказа массовой смены (тогда bulk=True).
+# Аргументы: order, old_status (None для нового заказа), new_status, bulk
+order_status_changed = Signal()
+
+# Массовая смена статусов (orders.transitions.bulk_transition).
+# Аргументы: changes - список (order, old_status, new_status), changed_by
+order_statuses_changed = Signal()
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def reset_order_stats(sender, instance, **kwargs):
+    """Сбрасывает закэшированную статистику владельца заказа"""
+    invalidate_order_stats(instance.user_id, instance.telegram_chat_id)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def reset_order_status(sender, instance, **kwargs):
+    """Сбрасывает закэшированный для бота статус заказа"""
+    invalidate_order_status([instance])
 
 
 @receiver(post_save, sender=Order)
-def send_status_notification(sender, instance, **kwargs):
+def detect_status_change(sender, instance, created, raw=False, **kwargs):
+    """
+    Сравнивает статус с загруженным из базы и отправляет order_status_changed.
+    Повторные сохранения без смены статуса сигнал не вызывают.
     """
-    Отправляет уведомление в Telegram при изменении статуса заказа.
+    if raw:
+        return
+    if created:
+        old_status = None
+    elif hasattr(instance, '_loaded_status'):
+        old_status = instance._loaded_status
+    else:
+        # Исходный статус неизвестен (объект не загружался из базы)
+        return
+
+    instance._loaded_status = instance.status
+    if old_status != instance.status:
+        order_status_changed.send(
+            sender=sender, order=instance, old_status=old_status, new_status=instance.status
+        )
+
+
+@receiver(order_status_changed, sender=Order)
+def send_status_notification(sender, order, bulk=False, **kwargs):
     """
-    if instance.telegram_chat_id:
-        # Сообщения для разных статусов
-        status_messages = {
-            'new': f"🆕 Ваш заказ №{instance.id} принят в обработку!",
-            'confirmed': f"✅ Заказ №{instance.id} подтвержден! Готовим ваш букет.",
-            'processing': f"🔧 Заказ №{instance.id} собирается нашими флористами.",
-            'in_progress': f"🚚 Заказ №{instance.id} передан курьеру! Ожидайте доставку.",
-            'delivered': f"📦 Заказ №{instance.id} доставлен! Спасибо за покупку! 🌹",
-            'cancelled': f"❌ Заказ №{instance.id} отменен."
-        }
-
-        message = status_messages.get(instance.status)
-        if message:
-            try:
-                bot = Bot(token=settings.TELEGRAM_BOT_TOKEN)
-                # Используем async_to_sync для вызова асинхронного метода
-                async_to_sync(bot.send_message)(
-                    chat_id=instance.telegram_chat_id,
-                    text=message
-                )
-                print(f"Уведомление отправлено для заказа {instance.id}")
-            except Exception as e:
-                print(f"Ошибка отправки уведомления: {e}")
\ No newline at end of file
+    Ставит в очередь уведомление в Telegram при изменении статуса заказа.
+    Сообщение отправляет команда dispatch_notifications.
+    При массовой смене уведомления ставятся пачкой (send_bulk_status_notifications).
+    """
+    if not bulk:
+        enqueue_status_notification(order)
+
+
+@receiver(order_status_changed, sender=Order)
+def record_status_change(sender, order, old_status, new_status, bulk=False, **kwargs):
+    if not bulk:
+        OrderStatusChange.objects.create(order=order, old_status=old_status, new_status=new_status)
+
+
+@receiver(order_statuses_changed, sender=Order)
+def record_bulk_status_changes(sender, changes, changed_by=None, **kwargs):
+    """История массовой смены статусов одним INSERT"""
+    OrderStatusChange.objects.bulk_create([
+        OrderStatusChange(order=order, old_status=old_status, new_status=new_status, changed_by=changed_by)
+        for order, old_status, new_status in changes
+    ], batch_size=500)
+
+
+@receiver(order_statuses_changed, sender=Order)
+def send_order_status_changed(sender, changes, **kwargs):
+    """Сигнал order_status_changed для каждого заказа массовой смены"""
+    for order, old_status, new_status in changes:
+        order_status_changed.send(
+            sender=sender, order=order, old_status=old_status, new_status=new_status, bulk=True
+        )
+
+
+@receiver(order_statuses_changed, sender=Order)
+def send_bulk_status_notifications(sender, changes, **kwargs):
+    """Все уведомления массовой смены статусов ставятся в очередь одной пачкой"""
+    enqueue_status_notifications([order for order, _, _ in changes])
+
+
+@receiver(order_statuses_changed, sender=Order)
+def reset_bulk_order_statuses(sender, changes, **kwargs):
+    invalidate_order_status([order for order, _, _ in changes])
@@ -0,0 +1,83 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum
+
+from .models import Order
+
+# Статусы, после которых заказ считается завершенным
+FINAL_STATUSES = ('delivered', 'cancelled')
+
+# Статистика сбрасывается при изменении заказов;
+# короткое время жизни ограничивает устаревание, если сброс не дошел
+ORDER_STATS_TIMEOUT = getattr(settings, 'ORDER_STATS_TIMEOUT', 5 * 60)
+
+
+def _stats_key(kind, value):
+    return f'orders:stats:{kind}:{value}'
+
+
+def compute_order_stats(queryset):
+    """
+    Статистика заказов одним сгруппированным запросом:
+    количество по статусам, общее количество, сумма и активные заказы.
+    """
+    stats = {status: 0 for status, _ in Order.STATUS_CHOICES}
+    stats.update({'total': 0, 'active': 0, 'total_amount': Decimal('0')})
+
+    rows = queryset.order_by().values('status').annotate(
+        count=Count('id'),
+        amount=Sum('total_price'),
+    )
+    for row in rows:
+        stats[row['status']] = row['count']
+        stats['total'] += row['count']
+        stats['total_amount'] += row['amount'] or 0
+        if row['status'] not in FINAL_STATUSES:
+            stats['active'] += row['count']
+    return stats
+
+
+def _get_cached_stats(key, queryset):
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_order_stats(queryset)
+        cache.set(key, stats, ORDER_STATS_TIMEOUT)
+    return stats
+
+
+def get_user_order_stats(user):
+    """Статистика заказов пользователя сайта"""
+    return _get_cached_stats(_stats_key('user', user.pk), Order.objects.filter(user=user))
+
+
+def get_chat_order_stats(telegram_chat_id):
+    """Статистика заказов чата Telegram"""
+    return _get_cached_stats(
+        _stats_key('chat', telegram_chat_id),
+        Order.objects.filter(telegram_chat_id=telegram_chat_id)
+    )
+
+
+def invalidate_order_stats(user_id=None, telegram_chat_id=None):
+    keys = []
+    if user_id:
+        keys.append(_stats_key('user', user_id))
+    if telegram_chat_id:
+        keys.append(_stats_key('chat', telegram_chat_id))
+    if keys:
+        cache.delete_many(keys)
+
+
+def invalidate_order_stats_for_owners(owners):
+    """Сбрасывает статистику для пар (user_id, telegram_chat_id)"""
+    keys = set()
+    for user_id, telegram_chat_id in owners:
+        if user_id:
+            keys.add(_stats_key('user', user_id))
+        if telegram_chat_id:
+            keys.add(_stats_key('chat', telegram_chat_id))
+    if keys:
+        cache.delete_many(list(keys))
+
@@ -1,3 +1,693 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from catalog.models import Category, Product
+from django.urls import reverse
+from django.utils import timezone
+from .models import Order, OrderItem
+from flower_project.testing import LOCMEM_CACHES
+from .stats import get_user_order_stats
 
-# Create your tests here.
+
+class OrderTestMixin:
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', password='testpass123')
+
+    def create_order(self, **kwargs):
+        data = {
+            'user': self.user,
+            'customer_name': 'Покупатель',
+            'customer_phone': '+79999999999',
+            'delivery_address': 'ул. Цветочная, 1',
+            'delivery_time': timezone.now(),
+        }
+        data.update(kwargs)
+        return Order.objects.create(**data)
+
+
+class OrderStatsTest(OrderTestMixin, TestCase):
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_stats_single_query(self):
+        """Тест подсчета статистики одним запросом"""
+        self.create_order(status='new', total_price=1000)
+        self.create_order(status='delivered', total_price=2500)
+        self.create_order(status='cancelled', total_price=500)
+
+        with self.assertNumQueries(1):
+            stats = get_user_order_stats(self.user)
+        self.assertEqual(stats['total'], 3)
+        self.assertEqual(stats['active'], 1)
+        self.assertEqual(stats['delivered'], 1)
+        self.assertEqual(stats['total_amount'], 4000)
+
+        # Повторный вызов берется из кэша
+        with self.assertNumQueries(0):
+            get_user_order_stats(self.user)
+
+    def test_stats_invalidated_on_save(self):
+        """Тест сброса статистики при изменении заказа"""
+        order = self.create_order(status='new')
+        self.assertEqual(get_user_order_stats(self.user)['new'], 1)
+        order.status = 'confirmed'
+        order.save()
+        stats = get_user_order_stats(self.user)
+        self.assertEqual(stats['new'], 0)
+        self.assertEqual(stats['confirmed'], 1)
+
+    def test_profile_uses_stats(self):
+        """Тест статистики в личном кабинете"""
+        self.create_order(status='delivered')
+        self.client.login(username='buyer', password='testpass123')
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(response.context['orders_stats']['delivered'], 1)
+
+
+class OrderQueryBudgetTest(OrderTestMixin, TestCase):
+    """
+    Бюджет запросов для страниц заказов: количество запросов
+    не должно зависеть от числа заказов и позиций (нет N+1).
+    """
+    QUERY_BUDGET = 12
+
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Розы', slug='roses')
+        self.products = [
+            Product.objects.create(
+                name=f'Букет {i}', slug=f'bouquet-{i}', description='Букет',
+                price=1000, image='products/b.jpg', category=category,
+            )
+            for i in range(3)
+        ]
+        self.client.login(username='buyer', password='testpass123')
+
+    def create_order_with_items(self):
+        order = self.create_order()
+        for product in self.products:
+            OrderItem.objects.create(order=order, product=product, price=product.price, quantity=2)
+        return order
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, url):
+        self.create_order_with_items()
+        baseline = self.count_queries(url)
+        for _ in range(5):
+            self.create_order_with_items()
+        self.assertEqual(self.count_queries(url), baseline)
+        self.assertLessEqual(baseline, self.QUERY_BUDGET)
+
+    def test_order_history_queries(self):
+        self.assertConstantQueries(reverse('order_history'))
+
+    def test_profile_queries(self):
+        self.assertConstantQueries(reverse('profile'))
+
+    def test_order_list_queries(self):
+        self.assertConstantQueries(reverse('orders:order_list'))
+
+    def test_order_detail_queries(self):
+        """Тест отображения заказа без запросов на каждую позицию"""
+        order = self.create_order_with_items()
+        small = self.count_queries(reverse('orders:order_detail', args=[order.id]))
+        for product in self.products:
+            OrderItem.objects.create(order=order, product=product, price=product.price, quantity=1)
+        self.assertEqual(self.count_queries(reverse('orders:order_detail', args=[order.id])), small)
+
+    def test_items_count(self):
+        """Тест количества товаров из аннотации и из подгруженных позиций"""
+        order = self.create_order_with_items()
+        annotated = Order.objects.with_items_count().get(id=order.id)
+        prefetched = Order.objects.with_items().get(id=order.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(annotated.get_items_count(), 6)
+            self.assertEqual(prefetched.get_items_count(), 6)
+        self.assertEqual(order.get_items_count(), 6)
+
+
+class OrderDetailConditionalTest(OrderTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = self.create_order()
+        self.url = reverse('orders:order_detail', args=[self.order.id])
+        self.client.force_login(self.user)
+
+    def test_unchanged_order_not_modified(self):
+        """Тест: повторное открытие неизменившегося заказа - 304 одним запросом версии"""
+        etag = self.client.get(self.url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(
+            len([query for query in queries.captured_queries if 'orders_order' in query['sql']]), 1
+        )
+
+    def test_status_change_modifies_page(self):
+        """Тест: после смены статуса страница заказа отдается заново"""
+        etag = self.client.get(self.url)['ETag']
+        self.order.status = 'confirmed'
+        self.order.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Подтвержден')
+
+    def test_foreign_order_not_found(self):
+        """Тест: чужой заказ - 404 без ETag"""
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.force_login(other)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class CartProductsMixin(OrderTestMixin):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Розы', slug='roses')
+        self.products = [
+            Product.objects.create(
+                name=f'Букет {i}', slug=f'bouquet-{i}', description='Букет',
+                price=1000 + i, image='products/b.jpg', category=category,
+            )
+            for i in range(5)
+        ]
+
+
+class CheckoutTest(CartProductsMixin, TestCase):
+
+    def checkout(self, products):
+        from datetime import timedelta
+        for product in products:
+            self.client.post(reverse('orders:cart_add', args=[product.id]), {'quantity': 2})
+        delivery_time = timezone.localtime() + timedelta(days=1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('orders:order_create'), {
+                'customer_name': 'Покупатель',
+                'customer_phone': '+79999999999',
+                'delivery_address': 'ул. Цветочная, 1',
+                'delivery_time': delivery_time.strftime('%Y-%m-%dT%H:%M'),
+                'payment_method': 'cash',
+            })
+        self.assertEqual(response.status_code, 302)
+        return len(queries)
+
+    def test_order_written_once(self):
+        """Тест: заказ сохраняется один раз, сумма считается из корзины"""
+        from django.db.models.signals import post_save
+        saves = []
+
+        def on_save(sender, instance, **kwargs):
+            saves.append(instance.pk)
+
+        post_save.connect(on_save, sender=Order)
+        try:
+            self.checkout(self.products[:2])
+        finally:
+            post_save.disconnect(on_save, sender=Order)
+
+        order = Order.objects.get()
+        self.assertEqual(saves, [order.pk])
+        self.assertEqual(order.total_price, (1000 + 1001) * 2)
+        self.assertEqual(order.items.count(), 2)
+
+    def test_checkout_queries_constant(self):
+        """Тест: число запросов оформления не зависит от размера корзины"""
+        small = self.checkout(self.products[:1])
+        self.client.logout()
+        large = self.checkout(self.products)
+        self.assertEqual(small, large)
+
+
+class RequestCartTest(OrderTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Розы', slug='roses')
+        self.products = [
+            Product.objects.create(
+                name=f'Букет {i}', slug=f'bouquet-{i}', description='Букет',
+                price=1000 + i, image='products/b.jpg', category=category,
+            )
+            for i in range(3)
+        ]
+        for product in self.products:
+            self.client.post(reverse('orders:cart_add', args=[product.id]), {'quantity': 2})
+
+    def test_cart_shared_with_context_processor(self):
+        """Тест: представление и контекстный процессор используют одну корзину"""
+        response = self.client.get(reverse('orders:cart_detail'))
+        self.assertIs(response.context['cart'], response.wsgi_request.cart)
+        self.assertEqual(response.context['cart_total_items'], 6)
+        self.assertEqual(response.context['cart_total_price'], (1000 + 1001 + 1002) * 2)
+
+    def test_products_loaded_once(self):
+        """Тест: товары корзины загружаются одним запросом за страницу"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('orders:cart_detail'))
+        self.assertEqual(response.status_code, 200)
+        product_queries = [
+            query for query in queries.captured_queries
+            if 'FROM "catalog_product"' in query['sql']
+        ]
+        self.assertEqual(len(product_queries), 1)
+
+    def test_empty_cart_not_written_to_session(self):
+        """Тест: просмотр страниц с пустой корзиной не создает сессию"""
+        self.client.cookies.clear()
+        response = self.client.get(reverse('orders:cart_detail'))
+        self.assertEqual(response.context['cart_total_items'], 0)
+        self.assertNotIn('sessionid', response.cookies)
+
+
+class CartStorageTest(OrderTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Розы', slug='roses')
+        self.product = Product.objects.create(
+            name='Букет', slug='bouquet', description='Букет',
+            price='1499.90', image='products/b.jpg', category=category,
+        )
+
+    def add(self, quantity=1):
+        return self.client.post(reverse('orders:cart_add', args=[self.product.id]), {'quantity': quantity})
+
+    def test_invalid_quantity(self):
+        """Тест: отрицательное, огромное и нечисловое количество не ломают корзину"""
+        from .cart import MAX_QUANTITY
+        for quantity in [-3, 'много']:
+            self.assertEqual(self.add(quantity).status_code, 302)
+        self.assertEqual(self.client.get(reverse('orders:cart_detail')).context['cart'].cart, {})
+
+        self.add(2 ** 40)
+        cart = self.client.get(reverse('orders:cart_detail')).context['cart']
+        self.assertEqual(cart.cart[self.product.id][1], MAX_QUANTITY)
+
+        self.client.post(reverse('orders:cart_update', args=[self.product.id]), {'quantity': -1})
+        self.assertEqual(self.client.get(reverse('orders:cart_detail')).context['cart'].cart, {})
+
+        from .cart_storage import pack_lines, unpack_lines
+        self.assertEqual(unpack_lines(pack_lines({1: (100, -1), 2: (100, 5)})), {2: (100, 5)})
+
+    def test_pack_roundtrip(self):
+        """Тест: упаковка позиций корзины обратима"""
+        from .cart_storage import pack_lines, unpack_lines
+        lines = {1: (149990, 2), 2 ** 40: (1, 4000000000)}
+        packed = pack_lines(lines)
+        self.assertEqual(unpack_lines(packed), lines)
+        self.assertEqual(len(packed), 5 + 20 * len(lines))
+        self.assertEqual(unpack_lines(packed[:-1]), {})
+
+    @override_settings(CART_STORE='orders.cart_storage.DatabaseCartStore')
+    def test_database_store_does_not_touch_session(self):
+        """Тест: изменение корзины обновляет строку корзины, а не сессию"""
+        from .models import CartRecord
+        self.add()
+        with CaptureQueriesContext(connection) as queries:
+            self.add(2)
+        session_writes = [
+            query for query in queries.captured_queries
+            if 'django_session' in query['sql'] and not query['sql'].startswith('SELECT')
+        ]
+        self.assertEqual(session_writes, [])
+        self.assertEqual(CartRecord.objects.count(), 1)
+
+        response = self.client.get(reverse('orders:cart_detail'))
+        self.assertEqual(response.context['cart_total_items'], 3)
+        self.assertEqual(str(response.context['cart_total_price']), '4499.70')
+
+    @override_settings(CART_STORE='orders.cart_storage.SessionCartStore')
+    def test_session_store_reads_legacy_format(self):
+        """Тест: корзина в старом формате сессии читается"""
+        session = self.client.session
+        session['cart'] = {str(self.product.id): {'quantity': 2, 'price': '1499.90'}}
+        session.save()
+        response = self.client.get(reverse('orders:cart_detail'))
+        self.assertEqual(response.context['cart_total_items'], 2)
+        self.add()
+        self.assertIsInstance(self.client.session['cart'], str)
+
+    @override_settings(CART_STORE='orders.cart_storage.DatabaseCartStore')
+    def test_database_store_migrates_session_cart(self):
+        """Тест: корзина из сессии (до перехода на DatabaseCartStore) переносится в таблицу"""
+        from .models import CartRecord
+        session = self.client.session
+        session['cart'] = {str(self.product.id): {'quantity': 2, 'price': '1499.90'}}
+        session.save()
+        response = self.client.get(reverse('orders:cart_detail'))
+        self.assertEqual(response.context['cart_total_items'], 2)
+        self.assertNotIn('cart', self.client.session)
+        self.assertEqual(CartRecord.objects.get().session_key, self.client.session.session_key)
+
+    @override_settings(CART_STORE='orders.cart_storage.DatabaseCartStore')
+    def test_database_store_concurrent_create(self):
+        """Тест: если строку корзины успел создать параллельный запрос, она обновляется"""
+        from unittest import mock
+        from django.test import RequestFactory
+        from .cart_storage import DatabaseCartStore, unpack_lines
+        from .models import CartRecord
+        request = RequestFactory().get('/')
+        request.user = self.user
+        store = DatabaseCartStore(request)
+        records = store._records
+
+        def created_concurrently(key):
+            # Между UPDATE и INSERT строку создает другой запрос
+            queryset = records(key)
+            if not CartRecord.objects.exists():
+                CartRecord.objects.create(user=self.user)
+                return queryset.none()
+            return queryset
+
+        with mock.patch.object(store, '_records', created_concurrently):
+            store.save({self.product.id: (149990, 3)})
+        self.assertEqual(unpack_lines(CartRecord.objects.get(user=self.user).data), {self.product.id: (149990, 3)})
+
+    @override_settings(CART_STORE='orders.cart_storage.DatabaseCartStore')
+    def test_orphaned_guest_carts_deleted(self):
+        """Тест: clearcarts удаляет корзины гостей без действующей сессии"""
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import CartRecord
+        self.add()
+        CartRecord.objects.create(session_key='expired-session')
+        CartRecord.objects.create(user=self.user)
+        call_command('clearcarts', stdout=StringIO())
+        self.assertEqual(CartRecord.objects.count(), 2)
+        self.assertFalse(CartRecord.objects.filter(session_key='expired-session').exists())
+
+    @override_settings(CART_STORE='orders.cart_storage.MemoryCartStore')
+    def test_memory_store_evicts_least_recent(self):
+        """Тест: хранилище в памяти вытесняет давно не использованные корзины"""
+        from .cart_storage import MemoryCartStore
+        MemoryCartStore.reset()
+        self.addCleanup(MemoryCartStore.reset)
+        self.add()
+        response = self.client.get(reverse('orders:cart_detail'))
+        self.assertEqual(response.context['cart_total_items'], 1)
+
+        MemoryCartStore.max_size, old_size = 1, MemoryCartStore.max_size
+        self.addCleanup(setattr, MemoryCartStore, 'max_size', old_size)
+        other = self.client_class()
+        other.post(reverse('orders:cart_add', args=[self.product.id]))
+        response = self.client.get(reverse('orders:cart_detail'))
+        self.assertEqual(response.context['cart_total_items'], 0)
+
+
+class CartRevalidationTest(CartProductsMixin, TestCase):
+    def fill_cart(self, products):
+        for product in products:
+            self.client.post(reverse('orders:cart_add', args=[product.id]), {'quantity': 2})
+
+    def render_cart(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('orders:cart_detail'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def price_messages(self, response):
+        return [message for message in response.context['messages'] if 'изменилась' in str(message)]
+
+    def test_cart_queries_constant(self):
+        """Тест: страница корзины не делает запросов на каждую позицию"""
+        self.fill_cart(self.products[:1])
+        _, small = self.render_cart()
+        self.fill_cart(self.products[1:])
+        _, large = self.render_cart()
+        self.assertEqual(small, large)
+
+    def test_stale_price_updated(self):
+        """Тест: устаревшая цена в корзине заменяется текущей"""
+        self.fill_cart(self.products[:1])
+        Product.objects.filter(id=self.products[0].id).update(price=1500)
+        response, _ = self.render_cart()
+        self.assertEqual(response.context['cart'].get_total_price(), 3000)
+        self.assertEqual(len(self.price_messages(response)), 1)
+
+        # Повторно об изменении не сообщается
+        response, _ = self.render_cart()
+        self.assertEqual(len(self.price_messages(response)), 0)
+
+    def test_unavailable_product_removed(self):
+        """Тест: недоступный товар убирается из корзины"""
+        self.fill_cart(self.products[:2])
+        Product.objects.filter(id=self.products[0].id).update(is_available=False)
+        response, _ = self.render_cart()
+        items = list(response.context['cart'])
+        self.assertEqual([item['product'].id for item in items], [self.products[1].id])
+
+    def test_checkout_stops_on_price_change(self):
+        """Тест: при изменении цены заказ не оформляется до подтверждения"""
+        from datetime import timedelta
+        self.fill_cart(self.products[:1])
+        Product.objects.filter(id=self.products[0].id).update(price=1500)
+        data = {
+            'customer_name': 'Покупатель',
+            'customer_phone': '+79999999999',
+            'delivery_address': 'ул. Цветочная, 1',
+            'delivery_time': (timezone.localtime() + timedelta(days=1)).strftime('%Y-%m-%dT%H:%M'),
+            'payment_method': 'cash',
+        }
+        response = self.client.post(reverse('orders:order_create'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Order.objects.exists())
+
+        response = self.client.post(reverse('orders:order_create'), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.objects.get().total_price, 3000)
+
+
+class GuestAdoptionTest(CartProductsMixin, TestCase):
+    def add(self, product, quantity=1):
+        self.client.post(reverse('orders:cart_add', args=[product.id]), {'quantity': quantity})
+
+    def login(self):
+        response = self.client.post(reverse('login'), {'username': 'buyer', 'password': 'testpass123'})
+        self.assertEqual(response.status_code, 302)
+        return response
+
+    @override_settings(CART_STORE='orders.cart_storage.DatabaseCartStore')
+    def test_guest_cart_merged_on_login(self):
+        """Тест: корзина гостя объединяется с корзиной пользователя"""
+        from .models import CartRecord
+        self.client.force_login(self.user)
+        self.add(self.products[0], 1)
+        self.client.logout()
+
+        self.add(self.products[0], 2)
+        self.add(self.products[1], 1)
+        self.login()
+
+        response = self.client.get(reverse('orders:cart_detail'))
+        quantities = {item['product'].id: item['quantity'] for item in response.context['cart']}
+        self.assertEqual(quantities, {self.products[0].id: 3, self.products[1].id: 1})
+        self.assertEqual(CartRecord.objects.get().user, self.user)
+
+    def test_guest_orders_claimed_on_login(self):
+        """Тест: заказы гостя привязываются к пользователю одним запросом"""
+        self.add(self.products[0])
+        session_key = self.client.session.session_key
+        guest_order = self.create_order(user=None, session_key=session_key)
+        other_order = self.create_order(user=None, session_key='other')
+        # Статистика закэширована до входа
+        self.assertEqual(get_user_order_stats(self.user)['total'], 0)
+
+        self.login()
+
+        guest_order.refresh_from_db()
+        other_order.refresh_from_db()
+        self.assertEqual(guest_order.user, self.user)
+        self.assertIsNone(other_order.user)
+        self.assertEqual(get_user_order_stats(self.user)['total'], 1)
+
+
+class CartRateLimitTest(CartProductsMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        from flower_project.ratelimit import get_backend
+        # Лимиты хранятся в памяти процесса между тестами
+        get_backend.cache_clear()
+
+    def add(self, client=None, **extra):
+        client = client or self.client
+        return client.post(reverse('orders:cart_add', args=[self.products[0].id]), **extra)
+
+    @override_settings(RATE_LIMITS={'cart': '3/m'})
+    def test_cart_requests_limited(self):
+        """Тест: частые изменения корзины с одного адреса получают 429, включая первый запрос без сессии"""
+        for _ in range(3):
+            self.assertEqual(self.add().status_code, 302)
+        response = self.add()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        # Новая сессия лимит не сбрасывает
+        self.assertEqual(self.add(self.client_class()).status_code, 429)
+
+        # Другие посетители не страдают
+        self.assertEqual(self.add(self.client_class(), REMOTE_ADDR='10.0.0.2').status_code, 302)
+
+    @override_settings(RATE_LIMITS={'cart': '1/m'}, RATE_LIMIT_PROXY_COUNT=1)
+    def test_forwarded_address(self):
+        """Тест: за прокси лимит считается по адресу клиента, а не прокси"""
+        first = {'HTTP_X_FORWARDED_FOR': '203.0.113.1'}
+        self.assertEqual(self.add(**first).status_code, 302)
+        self.assertEqual(self.add(self.client_class(), **first).status_code, 429)
+        # Подделанный клиентом адрес левее добавленного прокси не учитывается
+        spoofed = {'HTTP_X_FORWARDED_FOR': '198.51.100.7, 203.0.113.1'}
+        self.assertEqual(self.add(self.client_class(), **spoofed).status_code, 429)
+        self.assertEqual(self.add(self.client_class(), HTTP_X_FORWARDED_FOR='203.0.113.2').status_code, 302)
+
+    def test_rejected_request_not_written(self):
+        """Тест: отказ не записывает корзину токенов в кэш"""
+        from unittest import mock
+        from flower_project.ratelimit import CacheRateLimitBackend, cache
+        backend = CacheRateLimitBackend()
+        backend.hit('test', 1 / 60, 1)
+        with mock.patch.object(cache, 'set') as cache_set:
+            allowed, _ = backend.hit('test', 1 / 60, 1)
+        self.assertFalse(allowed)
+        cache_set.assert_not_called()
+
+    def test_token_bucket_refills(self):
+        """Тест: токены восстанавливаются со временем"""
+        from flower_project.ratelimit import parse_rate, take_token
+        rate, capacity = parse_rate('2/s')
+        state = None
+        for _ in range(2):
+            allowed, state, _ = take_token(state, rate, capacity, now=100.0)
+            self.assertTrue(allowed)
+        allowed, state, retry_after = take_token(state, rate, capacity, now=100.0)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 0.5)
+        allowed, state, _ = take_token(state, rate, capacity, now=100.5)
+        self.assertTrue(allowed)
+
+
+class OrderStatusChangedTest(OrderTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        from .signals import order_status_changed
+        self.changes = []
+
+        def on_change(sender, order, old_status, new_status, **kwargs):
+            self.changes.append((order.pk, old_status, new_status))
+
+        self.handler = on_change
+        order_status_changed.connect(on_change, sender=Order)
+        self.addCleanup(order_status_changed.disconnect, on_change, sender=Order)
+
+    def test_only_real_transitions(self):
+        """Тест: пересохранение без смены статуса не вызывает сигнал"""
+        order = self.create_order()
+        order.comment = 'Позвонить заранее'
+        order.save()
+        order.update_total_price()
+        order.status = 'confirmed'
+        order.save()
+        self.assertEqual(self.changes, [(order.pk, None, 'new'), (order.pk, 'new', 'confirmed')])
+
+    def test_loaded_instance(self):
+        """Тест: исходный статус берется из загруженной записи"""
+        order = self.create_order(status='confirmed')
+        self.changes.clear()
+        loaded = Order.objects.get(pk=order.pk)
+        loaded.status = 'processing'
+        loaded.save()
+        self.assertEqual(self.changes, [(order.pk, 'confirmed', 'processing')])
+
+    def test_bulk_update_status(self):
+        """Тест: массовая смена статуса отправляет сигнал по измененным заказам"""
+        first = self.create_order(status='new')
+        second = self.create_order(status='confirmed')
+        self.changes.clear()
+        updated = Order.objects.filter(pk__in=[first.pk, second.pk]).update_status('confirmed')
+        self.assertEqual(updated, 1)
+        self.assertEqual(self.changes, [(first.pk, 'new', 'confirmed')])
+        self.assertEqual(Order.objects.get(pk=first.pk).status, 'confirmed')
+
+    def test_bulk_update_status_batch_signal(self):
+        """Тест: массовая смена статуса отправляет и пакетный сигнал, а история пишется один раз"""
+        from .models import OrderStatusChange
+        from .signals import order_statuses_changed
+        batches = []
+
+        def on_bulk_change(sender, changes, **kwargs):
+            batches.append([(order.pk, old, new) for order, old, new in changes])
+
+        order_statuses_changed.connect(on_bulk_change, sender=Order)
+        self.addCleanup(order_statuses_changed.disconnect, on_bulk_change, sender=Order)
+
+        first = self.create_order(status='new')
+        Order.objects.filter(pk=first.pk).update_status('confirmed')
+        self.assertEqual(batches, [[(first.pk, 'new', 'confirmed')]])
+        self.assertEqual(OrderStatusChange.objects.filter(order=first, new_status='confirmed').count(), 1)
+
+
+class BulkTransitionTest(OrderTestMixin, TestCase):
+    def test_transition_rules(self):
+        """Тест правил переходов по шкале статусов"""
+        from .transitions import can_transition
+        self.assertTrue(can_transition('new', 'in_progress'))
+        self.assertTrue(can_transition('processing', 'cancelled'))
+        self.assertFalse(can_transition('delivered', 'new'))
+        self.assertFalse(can_transition('in_progress', 'cancelled'))
+        self.assertFalse(can_transition('cancelled', 'confirmed'))
+
+    def test_rejects_invalid_and_records_history(self):
+        """Тест: недопустимые переходы отклоняются, допустимые пишутся в историю"""
+        from .models import OrderStatusChange
+        from .transitions import bulk_transition
+        valid = self.create_order(status='confirmed')
+        delivered = self.create_order(status='delivered')
+        result = bulk_transition(Order.objects.all(), 'in_progress', changed_by=self.user)
+
+        self.assertEqual([order.pk for order, _, _ in result.changed], [valid.pk])
+        self.assertEqual([order.pk for order, _ in result.rejected], [delivered.pk])
+        self.assertEqual(Order.objects.get(pk=delivered.pk).status, 'delivered')
+        change = OrderStatusChange.objects.get(order=valid, new_status='in_progress')
+        self.assertEqual(change.old_status, 'confirmed')
+        self.assertEqual(change.changed_by, self.user)
+
+    def test_concurrent_change_skipped(self):
+        """Тест: заказ, измененный параллельно, не получает истории и уведомления"""
+        from unittest import mock
+        from bot.models import NotificationOutbox
+        from .models import OrderStatusChange
+        from . import transitions
+        first = self.create_order(status='confirmed', telegram_chat_id=100)
+        second = self.create_order(status='confirmed', telegram_chat_id=200)
+        NotificationOutbox.objects.all().delete()
+
+        can_transition = transitions.can_transition
+
+        def change_concurrently(old_status, new_status):
+            # Другой процесс меняет второй заказ между выборкой и UPDATE
+            Order.objects.filter(pk=second.pk).update(status='delivered')
+            return can_transition(old_status, new_status)
+
+        with mock.patch.object(transitions, 'can_transition', change_concurrently):
+            result = transitions.bulk_transition(Order.objects.all(), 'in_progress')
+
+        self.assertEqual([order.pk for order, _, _ in result.changed], [first.pk])
+        self.assertEqual([order.pk for order, _ in result.rejected], [second.pk])
+        self.assertEqual(Order.objects.get(pk=second.pk).status, 'delivered')
+        self.assertFalse(OrderStatusChange.objects.filter(order=second, new_status='in_progress').exists())
+        self.assertEqual(list(NotificationOutbox.objects.values_list('order_id', flat=True)), [first.pk])
+
+    def test_constant_statements(self):
+        """Тест: число запросов не зависит от количества заказов"""
+        from .transitions import bulk_transition
+        for i in range(2):
+            self.create_order(telegram_chat_id=100 + i)
+        with CaptureQueriesContext(connection) as small:
+            bulk_transition(Order.objects.all(), 'confirmed')
+        for i in range(20):
+            self.create_order(telegram_chat_id=200 + i)
+        with CaptureQueriesContext(connection) as large:
+            bulk_transition(Order.objects.filter(status='new'), 'confirmed')
+        self.assertEqual(len(small), len(large))
@@ -0,0 +1,89 @@
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Order
+from .stats import invalidate_order_stats_for_owners
+
+
+def can_transition(old_status, new_status):
+    """
+    Допустимые переходы: только вперед по Order.STATUS_FLOW
+    или отмена из Order.CANCELLABLE_STATUSES.
+    """
+    if new_status == 'cancelled':
+        return old_status in Order.CANCELLABLE_STATUSES
+    flow = Order.STATUS_FLOW
+    if old_status not in flow or new_status not in flow:
+        return False
+    return flow.index(new_status) > flow.index(old_status)
+
+
+@dataclass
+class TransitionResult:
+    # Список (order, old_status, new_status) для измененных заказов
+    changed: list = field(default_factory=list)
+    # Список (order, status) для заказов, переход которых недопустим
+    rejected: list = field(default_factory=list)
+
+
+def bulk_transition(queryset, new_status, changed_by=None):
+    """
+    Переводит заказы из queryset в статус new_status набором запросов,
+    не зависящим от числа заказов:
+    выборка с блокировкой, UPDATE, INSERT истории и пакетная постановка
+    уведомлений (через сигнал order_statuses_changed) в одной транзакции.
+    Заказы, статус которых успел измениться параллельно, попадают в rejected.
+    """
+    from .signals import order_statuses_changed
+
+    if new_status not in dict(Order.STATUS_CHOICES):
+        raise ValueError(f'Неизвестный статус: {new_status}')
+
+    result = TransitionResult()
+    with transaction.atomic():
+        # Заказы блокируются до конца транзакции, чтобы их статус не изменился
+        # между выборкой и UPDATE (в SQLite запись и так сериализована)
+        orders = list(
+            queryset.select_for_update().order_by('pk').only('id', 'status', 'user_id', 'telegram_chat_id')
+        )
+        for order in orders:
+            if can_transition(order.status, new_status):
+                result.changed.append((order, order.status, new_status))
+            elif order.status != new_status:
+                result.rejected.append((order, order.status))
+
+        if not result.changed:
+            return result
+
+        now = timezone.now()
+        changed_ids = [order.pk for order, _, _ in result.changed]
+        source_statuses = {old_status for _, old_status, _ in result.changed}
+        # Условие по исходному статусу защищает от параллельных изменений,
+        # если блокировка строк не поддерживается
+        updated = Order.objects.filter(pk__in=changed_ids, status__in=source_statuses).update(
+            status=new_status,
+            updated_at=now
+        )
+        if updated != len(changed_ids):
+            # История и уведомления - только для строк, которые изменил этот UPDATE
+            updated_ids = set(
+                Order.objects.filter(pk__in=changed_ids, status=new_status, updated_at=now)
+                .values_list('pk', flat=True)
+            )
+            skipped = [change for change in result.changed if change[0].pk not in updated_ids]
+            result.changed = [change for change in result.changed if change[0].pk in updated_ids]
+            result.rejected.extend((order, old_status) for order, old_status, _ in skipped)
+            if not result.changed:
+                return result
+
+        for order, _, _ in result.changed:
+            order.status = new_status
+            order._loaded_status = new_status
+        invalidate_order_stats_for_owners(
+            (order.user_id, order.telegram_chat_id) for order, _, _ in result.changed
+        )
+        order_statuses_changed.send(sender=Order, changes=result.changed, changed_by=changed_by)
+
+    return result
@@ -3,23 +3,50 @@ from django.contrib import messages
 from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 from django.db import transaction
+from catalog.cache import get_catalog_version
 from catalog.models import Product
-from .cart import Cart
+from flower_project.conditional import conditional_page
+from flower_project.ratelimit import ratelimit
+from .cart import get_cart
 from .forms import OrderForm
-from .models import Order, OrderItem
+from .checkout import place_order
+from .models import Order
+
+
+def revalidate_cart(request, cart):
+    """Сверяет корзину с каталогом и сообщает покупателю об изменениях"""
+    changes = cart.revalidate()
+    for product, old_price, new_price in changes.repriced:
+        messages.info(request, f'Цена товара «{product.name}» изменилась: {old_price} ₽ → {new_price} ₽')
+    for product in changes.removed:
+        messages.warning(request, f'Товар «{product.name}» больше недоступен и удален из корзины')
+    return changes
+
+
+def get_quantity(request):
+    """Количество из формы или None, если оно не число"""
+    try:
+        return int(request.POST.get('quantity', 1))
+    except ValueError:
+        return None
 
 
 def cart_detail(request):
-    cart = Cart(request)
+    cart = get_cart(request)
+    revalidate_cart(request, cart)
     return render(request, 'orders/cart_detail.html', {'cart': cart})
 
 
 @require_POST
+@ratelimit('cart')
 def cart_add(request, product_id):
-    cart = Cart(request)
+    cart = get_cart(request)
     product = get_object_or_404(Product, id=product_id)
 
-    quantity = int(request.POST.get('quantity', 1))
+    quantity = get_quantity(request)
+    if quantity is None or quantity < 1:
+        messages.error(request, 'Укажите количество товара')
+        return redirect('orders:cart_detail')
     cart.add(product=product, quantity=quantity)
 
     messages.success(request, f'Товар "{product.name}" добавлен в корзину')
@@ -27,8 +54,9 @@ def cart_add(request, product_id):
 
 
 @require_POST
+@ratelimit('cart')
 def cart_remove(request, product_id):
-    cart = Cart(request)
+    cart = get_cart(request)
     product = get_object_or_404(Product, id=product_id)
     cart.remove(product)
 
@@ -37,12 +65,15 @@ def cart_remove(request, product_id):
 
 
 @require_POST
+@ratelimit('cart')
 def cart_update(request, product_id):
-    cart = Cart(request)
+    cart = get_cart(request)
     product = get_object_or_404(Product, id=product_id)
 
-    quantity = int(request.POST.get('quantity', 1))
-    if quantity > 0:
+    quantity = get_quantity(request)
+    if quantity is None:
+        messages.error(request, 'Укажите количество товара')
+    elif quantity > 0:
         cart.add(product=product, quantity=quantity, update_quantity=True)
         messages.success(request, f'Количество товара "{product.name}" обновлено')
     else:
@@ -52,7 +83,8 @@ def cart_update(request, product_id):
 
 
 def order_create(request):
-    cart = Cart(request)
+    cart = get_cart(request)
+    changes = revalidate_cart(request, cart)
 
     if len(cart) == 0:
         messages.warning(request, 'Ваша корзина пуста')
@@ -60,7 +92,9 @@ def order_create(request):
 
     if request.method == 'POST':
         form = OrderForm(request.POST)
-        if form.is_valid():
+        # При изменении цен или состава корзины заказ не оформляется,
+        # покупатель сначала видит обновленную сумму
+        if form.is_valid() and not changes:
             try:
                 with transaction.atomic():
                     order = form.save(commit=False)
@@ -73,19 +107,8 @@ def order_create(request):
                     if not request.user.is_authenticated:
                         order.session_key = request.session.session_key
 
-                    order.save()
-
-                    # Создаем элементы заказа
-                    for item in cart:
-                        OrderItem.objects.create(
-                            order=order,
-                            product=item['product'],
-                            price=item['price'],
-                            quantity=item['quantity']
-                        )
-
-                    # Обновляем общую стоимость
-                    order.update_total_price()
+                    # Заказ и все позиции сохраняются за один проход
+                    place_order(order, cart)
 
                     # Очищаем корзину
                     cart.clear()
@@ -121,11 +144,24 @@ def order_created(request, order_id):
 
 @login_required
 def order_list(request):
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
+    orders = Order.objects.filter(user=request.user).with_items_count().order_by('-created_at')
     return render(request, 'orders/order_list.html', {'orders': orders})
 
 
+def order_version(request, order_id):
+    """
+    Версия для ETag страницы заказа: время его изменения (смена статуса)
+    и версия каталога (названия и изображения товаров). Чужой или
+    несуществующий заказ - None, представление ответит 404.
+    """
+    updated_at = Order.objects.filter(id=order_id, user=request.user).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    return (updated_at.isoformat(), get_catalog_version())
+
+
 @login_required
+@conditional_page(order_version)
 def order_detail(request, order_id):
-    order = get_object_or_404(Order, id=order_id, user=request.user)
+    order = get_object_or_404(Order.objects.with_items(), id=order_id, user=request.user)
     return render(request, 'orders/order_detail.html', {'order': order})
\ No newline at end of file
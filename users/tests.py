@@ -128,4 +128,46 @@ class URLTests(TestCase):
 
         for url in urls:
             response = self.client.get(url)
-            self.assertEqual(response.status_code, 200)
\ No newline at end of file
+            self.assertEqual(response.status_code, 200)
+
+
+class OrderHistoryPaginationTest(TestCase):
+    def setUp(self):
+        from django.utils import timezone
+        from orders.models import Order
+        self.user = User.objects.create_user(username='buyer', password='testpass123')
+        self.orders = [
+            Order.objects.create(
+                user=self.user,
+                customer_name='Покупатель',
+                customer_phone='+79999999999',
+                delivery_address='ул. Цветочная, 1',
+                delivery_time=timezone.now(),
+            )
+            for _ in range(25)
+        ]
+        self.client.login(username='buyer', password='testpass123')
+
+    def test_cursor_pages(self):
+        """Тест перехода по страницам истории заказов по курсору"""
+        first = self.client.get(reverse('order_history'))
+        page_obj = first.context['page_obj']
+        self.assertEqual(len(page_obj), 20)
+        self.assertTrue(page_obj.has_next())
+        self.assertFalse(page_obj.has_previous())
+
+        second = self.client.get(reverse('order_history'), {'cursor': page_obj.next_cursor})
+        second_page = second.context['page_obj']
+        self.assertEqual(len(second_page), 5)
+        self.assertFalse(second_page.has_next())
+
+        back = self.client.get(reverse('order_history'), {'cursor': second_page.previous_cursor})
+        self.assertEqual(list(back.context['orders']), list(page_obj.object_list))
+
+        ids = [order.id for order in page_obj] + [order.id for order in second_page]
+        self.assertEqual(sorted(ids), sorted(order.id for order in self.orders))
+
+    def test_invalid_cursor(self):
+        """Тест 404 для поврежденного курсора"""
+        response = self.client.get(reverse('order_history'), {'cursor': 'broken'})
+        self.assertEqual(response.status_code, 404)
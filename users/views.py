@@ -3,7 +3,11 @@ from django.contrib import messages
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.views import LoginView, LogoutView
+from django.http import Http404
+from orders.guest import adopt_guest_data, get_guest_session_key
 from orders.models import Order
+from orders.stats import get_user_order_stats
+from flower_project.pagination import CursorPaginator, InvalidCursor
 from .forms import UserRegisterForm, UserUpdateForm, ProfileUpdateForm
 
 
@@ -17,7 +21,9 @@ def register(request):
             password = form.cleaned_data.get('password1')
             user = authenticate(username=username, password=password)
             if user is not None:
+                guest_session_key = get_guest_session_key(request)
                 login(request, user)
+                adopt_guest_data(request, guest_session_key)
             messages.success(request, f'Аккаунт {username} успешно создан!')
             return redirect('profile')
         else:
@@ -33,18 +39,10 @@ def profile(request):
     """Личный кабинет пользователя"""
     # Получаем статистику заказов пользователя
     orders = Order.objects.filter(user=request.user)
-    orders_stats = {
-        'total': orders.count(),
-        'new': orders.filter(status='new').count(),
-        'confirmed': orders.filter(status='confirmed').count(),
-        'processing': orders.filter(status='processing').count(),
-        'in_progress': orders.filter(status='in_progress').count(),
-        'delivered': orders.filter(status='delivered').count(),
-        'cancelled': orders.filter(status='cancelled').count(),
-    }
+    orders_stats = get_user_order_stats(request.user)
 
     # Последние заказы
-    recent_orders = orders.order_by('-created_at')[:5]
+    recent_orders = orders.with_items_count().order_by('-created_at')[:5]
 
     if request.method == 'POST':
         user_form = UserUpdateForm(request.POST, instance=request.user)
@@ -77,15 +75,24 @@ def profile(request):
 @login_required
 def order_history(request):
     """Полная история заказов пользователя"""
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
+    orders = Order.objects.filter(user=request.user).with_items_count().order_by('-created_at')
 
     # Фильтрация по статусу
     status_filter = request.GET.get('status', '')
     if status_filter:
         orders = orders.filter(status=status_filter)
 
+    # Пагинация по курсору (created_at, id): без OFFSET для постоянных клиентов
+    paginator = CursorPaginator(orders, 20, count_limit=1000)
+    try:
+        page_obj = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor as e:
+        raise Http404(str(e))
+
     context = {
-        'orders': orders,
+        'orders': page_obj.object_list,
+        'paginator': paginator,
+        'page_obj': page_obj,
         'status_filter': status_filter,
     }
 
@@ -97,12 +104,13 @@ def home(request):
     """Домашняя страница для авторизованных пользователей"""
     # Получаем статистику для быстрого обзора
     orders = Order.objects.filter(user=request.user)
-    recent_orders = orders.order_by('-created_at')[:3]
+    recent_orders = orders.with_items_count().order_by('-created_at')[:3]
+    orders_stats = get_user_order_stats(request.user)
 
     context = {
         'recent_orders': recent_orders,
-        'total_orders': orders.count(),
-        'active_orders': orders.exclude(status__in=['delivered', 'cancelled']).count(),
+        'total_orders': orders_stats['total'],
+        'active_orders': orders_stats['active'],
     }
 
     return render(request, 'users/home.html', context)
@@ -120,7 +128,13 @@ class CustomLoginView(LoginView):
 
     def form_valid(self, form):
         messages.success(self.request, f'Добро пожаловать, {form.get_user().username}!')
-        return super().form_valid(form)
+        guest_session_key = get_guest_session_key(self.request)
+        response = super().form_valid(form)
+        # Корзина и заказы, оформленные до входа, переходят в аккаунт
+        claimed = adopt_guest_data(self.request, guest_session_key)
+        if claimed:
+            messages.info(self.request, f'К вашему аккаунту привязано заказов: {claimed}')
+        return response
 
 
 class CustomLogoutView(LogoutView):